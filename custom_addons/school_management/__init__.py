@@ -2,6 +2,7 @@
 
 from . import models
 from . import controllers
+from .hooks import pre_init_hook, post_init_hook
 
 # Suppression du middleware CORS qui cause des erreurs
 # La configuration CORS est déjà dans le fichier odoo.conf
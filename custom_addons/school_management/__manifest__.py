@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'School Management',
-    'version': '1.0',
+    'version': '1.1',
     'category': 'Education',
     'summary': 'Manage School, Students, Teachers, Courses',
     'sequence': 1,
     'author': 'Your Name',
     'website': 'http://www.yourwebsite.com',
-    'depends': ['base', 'mail', 'openeducat_core', 'openeducat_admission'],
+    'depends': ['base', 'mail', 'openeducat_core', 'openeducat_admission', 'openeducat_attendance'],
     'data': [
         'security/ir.model.access.csv',
+        'data/op_bulletin_cron.xml',
+        'data/op_resource_occupancy_cron.xml',
+        'data/op_attendance_fact_cron.xml',
+        'data/op_attendance_sync_cron.xml',
+        'data/op_checkin_cron.xml',
         'views/admission_view.xml',
         'views/course_view.xml',
         'views/student_view.xml',
@@ -21,6 +26,8 @@
         'views/timetable_view.xml',
         'views/menu.xml',
     ],
+    'pre_init_hook': 'pre_init_hook',
+    'post_init_hook': 'post_init_hook',
     # Retirez la section 'assets' pour éviter les conflits
     'installable': True,
     'application': True,
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 from odoo import http
-from odoo.http import request
+from odoo.http import request, Response
+from odoo.exceptions import ValidationError
 import json
 import logging
 from datetime import datetime
 from .main import cors_wrapper  # Import du décorateur CORS depuis main.py
+from .bulletin_pdf import render_bulletin_pdf, iter_rendered_pdfs, iter_zip, merge_pdfs, iter_file
 
 _logger = logging.getLogger(__name__)
 
@@ -135,10 +137,15 @@ class BulletinController(http.Controller):
                 domain.append(('state', '=', state))
 
             bulletins = request.env['op.bulletin'].sudo().search(domain)
+
+            # Les bulletins publiés sont lus depuis leur instantané, sans calcul
+            snapshots = bulletins._read_published_snapshots(bulletins.ids)
+            live_bulletins = bulletins.browse([bulletin_id for bulletin_id in bulletins.ids if bulletin_id not in snapshots])
             
             bulletin_data = []
-            for bulletin in bulletins:
-                bulletin_data.append({
+            live_data = {}
+            for bulletin in live_bulletins:
+                live_data[bulletin.id] = {
                     'id': bulletin.id,
                     'numero': bulletin.numero_bulletin,
                     'student_id': bulletin.student_id.id,
@@ -156,8 +163,21 @@ class BulletinController(http.Controller):
                     'state': bulletin.state,
                     'absence_non_justifiees': bulletin.absence_non_justifiees,
                     'absence_justifiees': bulletin.absence_justifiees,
-                    'retards': bulletin.retards
-                })
+                    'retards': bulletin.retards,
+                    # Présences calculées en une requête pour toute la liste
+                    'taux_presence': bulletin.taux_presence,
+                    'total_absences': bulletin.total_absences,
+                    'total_retards': bulletin.total_retards,
+                    'total_jours_cours': bulletin.total_jours_cours
+                }
+
+            for bulletin_id in bulletins.ids:
+                if bulletin_id in snapshots:
+                    data = dict(snapshots[bulletin_id]['api'])
+                    data.pop('bulletin_lines', None)
+                    bulletin_data.append(data)
+                else:
+                    bulletin_data.append(live_data[bulletin_id])
 
             return {
                 'status': 'success',
@@ -244,50 +264,21 @@ class BulletinController(http.Controller):
             if not self._check_session():
                 return {'status': 'error', 'code': 401, 'message': 'Session invalide ou expirée'}
 
-            bulletin = request.env['op.bulletin'].sudo().browse(bulletin_id)
+            Bulletin = request.env['op.bulletin'].sudo()
+
+            # Bulletin publié : servi tel quel depuis son instantané
+            snapshot = Bulletin._read_published_snapshots([bulletin_id]).get(bulletin_id)
+            if snapshot:
+                return {
+                    'status': 'success',
+                    'data': snapshot['api']
+                }
+
+            bulletin = Bulletin.browse(bulletin_id)
             if not bulletin.exists():
                 return {'status': 'error', 'code': 404, 'message': 'Bulletin non trouvé'}
 
-            # Récupération des notes détaillées
-            lines_data = []
-            for line in bulletin.note_lines:
-                lines_data.append({
-                    'id': line.id,
-                    'subject_id': line.subject_id.id,
-                    'subject_name': line.subject_id.name,
-                    'note_controle': float(line.note_controle) if line.note_controle else 0.0,
-                    'note_composition': float(line.note_composition) if line.note_composition else 0.0,
-                    'note_devoir': float(line.note_devoir) if line.note_devoir else 0.0,
-                    'note_oral': float(line.note_oral) if line.note_oral else 0.0,
-                    'note_tp': float(line.note_tp) if line.note_tp else 0.0,
-                    'moyenne_matiere': float(line.moyenne_matiere) if line.moyenne_matiere else 0.0,
-                    'coefficient': float(line.coefficient) if line.coefficient else 1.0,
-                    'moyenne_classe_matiere': float(line.moyenne_classe_matiere) if line.moyenne_classe_matiere else 0.0,
-                    'rang_matiere': line.rang_matiere,
-                    'appreciation': line.appreciation
-                })
-
-            bulletin_data = {
-                'id': bulletin.id,
-                'numero': bulletin.numero_bulletin,
-                'student_id': bulletin.student_id.id,
-                'student_name': bulletin.student_id.name,
-                'trimestre_id': bulletin.trimestre_id.id,
-                'trimestre_name': bulletin.trimestre_id.name,
-                'batch_id': bulletin.batch_id.id if bulletin.batch_id else None,
-                'batch_name': bulletin.batch_id.name if bulletin.batch_id else '',
-                'date_creation': bulletin.date_creation.isoformat() if bulletin.date_creation else None,
-                'date_edition': bulletin.date_edition.isoformat() if bulletin.date_edition else None,
-                'moyenne_generale': float(bulletin.moyenne_generale) if bulletin.moyenne_generale else 0.0,
-                'rang_classe': bulletin.rang_classe,
-                'total_eleves_classe': bulletin.total_eleves_classe,
-                'appreciation_generale': bulletin.appreciation_generale,
-                'state': bulletin.state,
-                'absence_non_justifiees': bulletin.absence_non_justifiees,
-                'absence_justifiees': bulletin.absence_justifiees,
-                'retards': bulletin.retards,
-                'bulletin_lines': lines_data
-            }
+            bulletin_data = bulletin._get_api_data()
 
             return {
                 'status': 'success',
@@ -309,6 +300,9 @@ class BulletinController(http.Controller):
             bulletin = request.env['op.bulletin'].sudo().browse(bulletin_id)
             if not bulletin.exists():
                 return {'status': 'error', 'code': 404, 'message': 'Bulletin non trouvé'}
+            if bulletin.state == 'published':
+                return {'status': 'error', 'code': 400,
+                        'message': 'Bulletin publié : le dépublier avant de le modifier, puis le publier à nouveau'}
 
             # Vérifier si c'est une sauvegarde manuelle
             is_manual_save = data.get('manual_save', False)
@@ -481,6 +475,32 @@ class BulletinController(http.Controller):
             _logger.error(f"Erreur lors de la publication du bulletin {bulletin_id}: {str(e)}")
             return {'status': 'error', 'code': 500, 'message': f'Erreur lors de la publication: {str(e)}'}
 
+    @http.route('/api/bulletins/<int:bulletin_id>/unpublish', auth='public', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def unpublish_bulletin(self, bulletin_id, **kwargs):
+        """Dépublier un bulletin pour pouvoir le modifier"""
+        try:
+            bulletin = request.env['op.bulletin'].sudo().browse(bulletin_id)
+            if not bulletin.exists():
+                return {'status': 'error', 'code': 404, 'message': 'Bulletin non trouvé'}
+
+            bulletin.action_unpublish()
+
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': 'Bulletin dépublié avec succès',
+                'data': {
+                    'id': bulletin.id,
+                    'state': bulletin.state
+                }
+            }
+        except ValidationError as e:
+            return {'status': 'error', 'code': 400, 'message': str(e)}
+        except Exception as e:
+            _logger.error(f"Erreur lors de la dépublication du bulletin {bulletin_id}: {str(e)}")
+            return {'status': 'error', 'code': 500, 'message': f'Erreur lors de la dépublication: {str(e)}'}
+
     @http.route('/api/bulletins/<int:bulletin_id>/archive', auth='public', type='http', csrf=False, methods=['POST', 'OPTIONS'])
     @cors_wrapper
     def archive_bulletin(self, bulletin_id, **kwargs):
@@ -506,6 +526,58 @@ class BulletinController(http.Controller):
             _logger.error(f"Erreur lors de l'archivage du bulletin {bulletin_id}: {str(e)}")
             return {'status': 'error', 'code': 500, 'message': f'Erreur lors de l\'archivage: {str(e)}'}
 
+    @http.route('/api/bulletins/bulk-action', auth='public', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def bulk_action_bulletins(self, **kwargs):
+        """Appliquer une action (calculate, validate, publish, archive) à plusieurs bulletins
+
+        Corps JSON : {"action": ..., "ids": [...]} ou {"action": ..., "batch_id": ..., "trimestre_id": ...}
+        """
+        try:
+            data = json.loads(request.httprequest.get_data() or b'{}')
+            action = data.get('action')
+            if action not in ('calculate', 'validate', 'publish', 'archive'):
+                return {'status': 'error', 'code': 400,
+                        'message': 'Action invalide (calculate, validate, publish ou archive)'}
+
+            Bulletin = request.env['op.bulletin'].sudo()
+            requested_ids = []
+            if data.get('ids'):
+                requested_ids = [int(bulletin_id) for bulletin_id in data['ids']]
+                bulletins = Bulletin.browse(requested_ids).exists()
+            elif data.get('batch_id') and data.get('trimestre_id'):
+                bulletins = Bulletin.search([
+                    ('batch_id', '=', int(data['batch_id'])),
+                    ('trimestre_id', '=', int(data['trimestre_id']))
+                ])
+            else:
+                return {'status': 'error', 'code': 400, 'message': 'ids ou batch_id et trimestre_id sont requis'}
+
+            outcomes = bulletins.apply_bulk_action(action, user_id=data.get('user_id'))
+            for bulletin_id in set(requested_ids) - set(bulletins.ids):
+                outcomes[bulletin_id] = {'status': 'not_found', 'state': None, 'message': 'Bulletin non trouvé'}
+
+            results = [dict(outcome, id=bulletin_id) for bulletin_id, outcome in outcomes.items()]
+            counts = {}
+            for result in results:
+                counts[result['status']] = counts.get(result['status'], 0) + 1
+
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': f"{counts.get('done', 0)} bulletins traités, {counts.get('skipped', 0)} ignorés, "
+                           f"{counts.get('error', 0) + counts.get('not_found', 0)} en erreur",
+                'data': {
+                    'action': action,
+                    'counts': counts,
+                    'results': results
+                }
+            }
+
+        except Exception as e:
+            _logger.error(f"Erreur action en masse sur les bulletins: {str(e)}")
+            return {'status': 'error', 'code': 500, 'message': f"Erreur lors de l'action en masse: {str(e)}"}
+
     @http.route('/api/bulletins/<int:bulletin_id>/delete', auth='public', type='http', csrf=False, methods=['DELETE', 'OPTIONS'])
     @cors_wrapper
     def delete_bulletin(self, bulletin_id, **kwargs):
@@ -552,111 +624,41 @@ class BulletinController(http.Controller):
             if not batch.exists() or not trimestre.exists():
                 return {'status': 'error', 'code': 404, 'message': 'Classe ou trimestre non trouvé'}
 
-            # Récupérer tous les étudiants de la classe
-            student_courses = request.env['op.student.course'].sudo().search([
-                ('batch_id', '=', batch_id),
-                ('state', '=', 'running')
-            ])
-            
-            if not student_courses:
+            _logger.info(f"Mise en file de la génération des bulletins pour classe {batch.name}, trimestre {trimestre.name}")
+            _logger.info(f"Options: regenerate={regenerate_existing}, auto_calculate={auto_calculate}, auto_validate={auto_validate}")
+
+            job = request.env['op.bulletin.generation.job'].sudo().enqueue(
+                batch, trimestre,
+                regenerate_existing=regenerate_existing,
+                auto_calculate=auto_calculate,
+                auto_validate=auto_validate
+            )
+
+            if not job.total_count:
+                job.unlink()
                 return {'status': 'error', 'code': 404, 'message': 'Aucun étudiant trouvé dans cette classe'}
 
-            created_bulletins = []
-            updated_bulletins = []
-            error_count = 0
-            
-            _logger.info(f"Début génération bulletins pour classe {batch.name}, trimestre {trimestre.name}")
-            _logger.info(f"Options: regenerate={regenerate_existing}, auto_calculate={auto_calculate}, auto_validate={auto_validate}")
-            
-            # Traiter chaque étudiant
-            for student_course in student_courses:
-                try:
-                    student = student_course.student_id
-                    
-                    # Vérifier si un bulletin existe déjà
-                    existing = request.env['op.bulletin'].sudo().search([
-                        ('student_id', '=', student.id),
-                        ('trimestre_id', '=', trimestre_id),
-                        ('batch_id', '=', batch_id)
-                    ])
-                    
-                    if existing:
-                        if regenerate_existing:
-                            # Supprimer l'ancien bulletin et en créer un nouveau
-                            existing.unlink()
-                            _logger.info(f"Bulletin existant supprimé pour {student.name}")
-                            
-                            # Créer le nouveau bulletin
-                            bulletin = request.env['op.bulletin'].sudo().create({
-                                'student_id': student.id,
-                                'trimestre_id': trimestre_id,
-                                'batch_id': batch_id,
-                                'course_id': student_course.course_id.id
-                            })
-                            
-                            updated_bulletins.append({
-                                'id': bulletin.id,
-                                'numero': bulletin.numero_bulletin,
-                                'student_name': bulletin.student_id.name,
-                                'state': bulletin.state
-                            })
-                            
-                            _logger.info(f"Bulletin régénéré pour {student.name}: {bulletin.numero_bulletin}")
-                        else:
-                            # Ignorer cet étudiant car il a déjà un bulletin
-                            _logger.info(f"Bulletin déjà existant pour {student.name} - ignoré")
-                            continue
-                    else:
-                        # Créer un nouveau bulletin
-                        bulletin = request.env['op.bulletin'].sudo().create({
-                            'student_id': student.id,
-                            'trimestre_id': trimestre_id,
-                            'batch_id': batch_id,
-                            'course_id': student_course.course_id.id
-                        })
-                        
-                        created_bulletins.append({
-                            'id': bulletin.id,
-                            'numero': bulletin.numero_bulletin,
-                            'student_name': bulletin.student_id.name,
-                            'state': bulletin.state
-                        })
-                        
-                        _logger.info(f"Bulletin créé pour {student.name}: {bulletin.numero_bulletin}")
-                    
-                    # Calculer automatiquement si demandé
-                    if auto_calculate:
-                        bulletin.action_calculate()
-                        _logger.info(f"Bulletin calculé pour {student.name}")
-                        
-                        # Valider automatiquement si demandé
-                        if auto_validate and bulletin.state == 'calculated':
-                            bulletin.action_validate()
-                            _logger.info(f"Bulletin validé pour {student.name}")
-                            
-                except Exception as e:
-                    error_count += 1
-                    _logger.error(f"Erreur pour {student.name}: {str(e)}")
-                    continue
-
-            # Préparer la réponse
-            total_processed = len(created_bulletins) + len(updated_bulletins)
-            all_bulletins = created_bulletins + updated_bulletins
-            
-            message = f"Génération terminée: {len(created_bulletins)} créés, {len(updated_bulletins)} mis à jour"
-            if error_count > 0:
-                message += f", {error_count} erreurs"
+            # Mode synchrone conservé pour les petits lots (async=false)
+            if not data.get('async', True):
+                job._run(commit=False)
+                job_data = job.get_job_data()
+                return {
+                    'status': 'success',
+                    'code': 200,
+                    'message': job.summary,
+                    'data': dict(job_data, job_id=job.id,
+                                 total_processed=job.created_count + job.updated_count)
+                }
 
             return {
                 'status': 'success',
-                'code': 200,
-                'message': message,
+                'code': 202,
+                'message': f'Génération mise en file pour {job.total_count} étudiants',
                 'data': {
-                    'created_count': len(created_bulletins),
-                    'updated_count': len(updated_bulletins),
-                    'error_count': error_count,
-                    'total_processed': total_processed,
-                    'bulletins': all_bulletins
+                    'job_id': job.id,
+                    'state': job.state,
+                    'total': job.total_count,
+                    'poll_url': f'/api/bulletins/jobs/{job.id}'
                 }
             }
 
@@ -664,6 +666,100 @@ class BulletinController(http.Controller):
             _logger.error(f"Erreur génération bulletins en lot: {str(e)}")
             return {'status': 'error', 'code': 500, 'message': f'Erreur lors de la génération: {str(e)}'}
 
+    @http.route('/api/bulletins/jobs/<int:job_id>', auth='public', type='http', csrf=False, methods=['GET', 'OPTIONS'])
+    @cors_wrapper
+    def get_bulletin_generation_job(self, job_id, **kwargs):
+        """Suivre l'avancement d'une génération de bulletins en arrière-plan"""
+        try:
+            job = request.env['op.bulletin.generation.job'].sudo().browse(job_id)
+            if not job.exists():
+                return {'status': 'error', 'code': 404, 'message': 'Tâche de génération non trouvée'}
+
+            return {
+                'status': 'success',
+                'code': 200,
+                'data': job.get_job_data()
+            }
+
+        except Exception as e:
+            _logger.error(f"Erreur récupération tâche de génération {job_id}: {str(e)}")
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    @http.route('/api/bulletins/print-batch', auth='public', type='http', csrf=False, methods=['GET', 'OPTIONS'])
+    @cors_wrapper
+    def print_bulletins_batch(self, **kwargs):
+        """Imprimer tous les bulletins d'une classe en un seul PDF fusionné ou une archive ZIP
+
+        Paramètres : batch_id, trimestre_id, format=pdf|zip (pdf par défaut).
+        Seuls les bulletins validés ou publiés sont imprimés.
+        """
+        try:
+            batch_id = kwargs.get('batch_id')
+            trimestre_id = kwargs.get('trimestre_id')
+            export_format = (kwargs.get('format') or 'pdf').lower()
+
+            if not batch_id or not trimestre_id:
+                return {'status': 'error', 'code': 400, 'message': 'batch_id et trimestre_id sont requis'}
+            if export_format not in ('pdf', 'zip'):
+                return {'status': 'error', 'code': 400, 'message': 'Format invalide (pdf ou zip)'}
+
+            batch = request.env['op.batch'].sudo().browse(int(batch_id))
+            trimestre = request.env['op.trimestre'].sudo().browse(int(trimestre_id))
+            if not batch.exists() or not trimestre.exists():
+                return {'status': 'error', 'code': 404, 'message': 'Classe ou trimestre non trouvé'}
+
+            bulletins = request.env['op.bulletin'].sudo().search([
+                ('batch_id', '=', batch.id),
+                ('trimestre_id', '=', trimestre.id),
+                ('state', 'in', ['validated', 'published'])
+            ], order='numero_bulletin, id')
+            if not bulletins:
+                return {'status': 'error', 'code': 404, 'message': 'Aucun bulletin validé ou publié pour cette classe'}
+
+            # Extraire toutes les données avant le rendu : le flux est produit après la fin de la requête
+            bulletins_data = [bulletin._get_pdf_data() for bulletin in bulletins]
+            basename = f"Bulletins_{batch.name}_{trimestre.name}".replace(' ', '_').replace('/', '_')
+
+            if export_format == 'zip':
+                filenames = [f"{data['numero'] or data['id']}_{data['filename']}".replace('/', '_')
+                             for data in bulletins_data]
+
+                def generate_zip():
+                    rendered = iter_rendered_pdfs(bulletins_data)
+                    yield from iter_zip(zip(filenames, rendered))
+
+                return Response(
+                    generate_zip(),
+                    headers=[
+                        ('Content-Type', 'application/zip'),
+                        ('Content-Disposition', f'attachment; filename="{basename}.zip"'),
+                        ('Cache-Control', 'no-cache, no-store, must-revalidate'),
+                    ],
+                    direct_passthrough=True
+                )
+
+            merged = merge_pdfs(iter_rendered_pdfs(bulletins_data))
+            merged.seek(0, 2)
+            content_length = merged.tell()
+            merged.seek(0)
+            return Response(
+                iter_file(merged),
+                headers=[
+                    ('Content-Type', 'application/pdf'),
+                    ('Content-Length', content_length),
+                    ('Content-Disposition', f'attachment; filename="{basename}.pdf"'),
+                    ('Cache-Control', 'no-cache, no-store, must-revalidate'),
+                ],
+                direct_passthrough=True
+            )
+
+        except ImportError as e:
+            _logger.error(f"Bibliothèque PDF non disponible pour l'impression en lot: {str(e)}")
+            return {'status': 'error', 'code': 500, 'message': f'Bibliothèque PDF non disponible: {str(e)}'}
+        except Exception as e:
+            _logger.error(f"Erreur impression bulletins en lot: {str(e)}")
+            return {'status': 'error', 'code': 500, 'message': f"Erreur lors de l'impression: {str(e)}"}
+
     @http.route('/api/batches/<int:batch_id>/students', auth='public', type='http', csrf=False, methods=['GET', 'OPTIONS'])
     @cors_wrapper
     def get_batch_students(self, batch_id, **kwargs):
@@ -718,109 +814,10 @@ class BulletinController(http.Controller):
             batch_id = kwargs.get('batch_id')
             state = kwargs.get('state')
 
-            domain = []
-            if trimestre_id:
-                domain.append(('trimestre_id', '=', int(trimestre_id)))
-            if batch_id:
-                domain.append(('batch_id', '=', int(batch_id)))
-            if state:
-                domain.append(('state', '=', state))
-
-            bulletins = request.env['op.bulletin'].sudo().search(domain)
-            
-            # Calcul des statistiques
-            total_bulletins = len(bulletins)
-            bulletins_by_state = {}
-            total_moyenne = 0
-            bulletins_with_moyenne = 0
-            
-            # Statistiques par état et moyennes
-            for bulletin in bulletins:
-                state = bulletin.state or 'brouillon'
-                bulletins_by_state[state] = bulletins_by_state.get(state, 0) + 1
-                
-                if bulletin.moyenne_generale and bulletin.moyenne_generale > 0:
-                    total_moyenne += bulletin.moyenne_generale
-                    bulletins_with_moyenne += 1
-            
-            # Moyenne générale
-            average_generale = total_moyenne / bulletins_with_moyenne if bulletins_with_moyenne > 0 else 0
-            
-            # Top étudiants (moyenne >= 16)
-            top_students = []
-            bulletins_with_good_moyenne = bulletins.filtered(lambda b: b.moyenne_generale >= 16)
-            sorted_top = sorted(bulletins_with_good_moyenne, key=lambda b: b.moyenne_generale, reverse=True)[:5]
-            for bulletin in sorted_top:
-                top_students.append({
-                    'name': bulletin.student_id.name,
-                    'moyenne': float(bulletin.moyenne_generale),
-                    'batch': bulletin.batch_id.name if bulletin.batch_id else 'Non définie',
-                    'trimestre': bulletin.trimestre_id.name
-                })
-            
-            # Étudiants en difficulté (moyenne < 10)
-            low_performers = []
-            bulletins_with_low_moyenne = bulletins.filtered(lambda b: b.moyenne_generale and b.moyenne_generale < 10)
-            sorted_low = sorted(bulletins_with_low_moyenne, key=lambda b: b.moyenne_generale)[:5]
-            for bulletin in sorted_low:
-                low_performers.append({
-                    'name': bulletin.student_id.name,
-                    'moyenne': float(bulletin.moyenne_generale),
-                    'batch': bulletin.batch_id.name if bulletin.batch_id else 'Non définie',
-                    'trimestre': bulletin.trimestre_id.name
-                })
-            
-            # Moyennes par matière (basées sur les lignes de bulletin)
-            subject_averages = []
-            bulletin_lines = request.env['op.bulletin.line'].sudo().search([
-                ('bulletin_id', 'in', bulletins.ids)
-            ])
-            
-            subjects_data = {}
-            for line in bulletin_lines:
-                subject_name = line.subject_id.name if line.subject_id else 'Matière inconnue'
-                if subject_name not in subjects_data:
-                    subjects_data[subject_name] = {
-                        'total': 0,
-                        'count': 0,
-                        'notes': []
-                    }
-                
-                if line.moyenne_matiere and line.moyenne_matiere > 0:
-                    subjects_data[subject_name]['total'] += line.moyenne_matiere
-                    subjects_data[subject_name]['count'] += 1
-                    subjects_data[subject_name]['notes'].append(line.moyenne_matiere)
-            
-            for subject_name, data in subjects_data.items():
-                if data['count'] > 0:
-                    moyenne = data['total'] / data['count']
-                    subject_averages.append({
-                        'subject': subject_name,
-                        'moyenne': round(moyenne, 2),
-                        'count': data['count'],
-                        'min_note': min(data['notes']) if data['notes'] else 0,
-                        'max_note': max(data['notes']) if data['notes'] else 0
-                    })
-            
-            # Statistiques supplémentaires
-            published_count = bulletins_by_state.get('publie', 0) + bulletins_by_state.get('published', 0)
-            pending_count = (bulletins_by_state.get('brouillon', 0) + 
-                           bulletins_by_state.get('draft', 0) +
-                           bulletins_by_state.get('calcule', 0) + 
-                           bulletins_by_state.get('calculated', 0))
-
-            stats_data = {
-                'total_bulletins': total_bulletins,
-                'bulletins_by_state': bulletins_by_state,
-                'average_generale': round(average_generale, 2),
-                'published': published_count,
-                'pending': pending_count,
-                'avg_general': round(average_generale, 2),  # Alias pour compatibilité
-                'top_students': top_students,
-                'low_performers': low_performers,
-                'subject_averages': subject_averages,
-                'bulletins_with_moyenne': bulletins_with_moyenne
-            }
+            # Agrégats SQL, mis en cache par combinaison de filtres
+            stats_data = request.env['op.bulletin.stats.snapshot'].sudo().get_stats(
+                trimestre_id=trimestre_id, batch_id=batch_id, state=state
+            )
 
             return {
                 'status': 'success',
@@ -1153,6 +1150,19 @@ class BulletinController(http.Controller):
         except Exception as e:
             return {'status': 'error', 'code': 500, 'message': str(e)}
 
+    def _make_pdf_response(self, pdf_content, filename, cache_key):
+        """Réponse PDF revalidable par ETag"""
+        return request.make_response(
+            pdf_content,
+            headers=[
+                ('Content-Type', 'application/pdf'),
+                ('Content-Length', len(pdf_content)),
+                ('Content-Disposition', f'attachment; filename="{filename}"'),
+                ('Cache-Control', 'private, no-cache'),
+                ('ETag', f'"{cache_key}"')
+            ]
+        )
+
     @http.route('/api/bulletins/<int:bulletin_id>/pdf', auth='public', type='http', csrf=False, methods=['GET', 'OPTIONS'])
     @cors_wrapper
     def get_bulletin_pdf(self, bulletin_id, **kwargs):
@@ -1168,165 +1178,22 @@ class BulletinController(http.Controller):
                 return {'status': 'error', 'code': 400, 'message': 'Le bulletin doit être validé ou publié pour être imprimé'}
 
             # Nom du fichier
-            filename = f"Bulletin_{bulletin.student_id.name}_{bulletin.trimestre_id.name}.pdf"
-            filename = filename.replace(' ', '_').replace('/', '_')  # Nettoyer le nom de fichier
-            
-            try:
-                # Essayer d'abord avec le nouveau template
-                report = request.env.ref('school_management.report_bulletin_scolaire')
-                if report:
-                    # Générer le PDF
-                    pdf_content, pdf_format = report.sudo()._render_qweb_pdf([bulletin_id])
-                    
-                    if pdf_content:
-                        # Retourner le PDF directement
-                        response = request.make_response(
-                            pdf_content,
-                            headers=[
-                                ('Content-Type', 'application/pdf'),
-                                ('Content-Length', len(pdf_content)),
-                                ('Content-Disposition', f'attachment; filename="{filename}"'),
-                                ('Cache-Control', 'no-cache, no-store, must-revalidate'),
-                                ('Pragma', 'no-cache'),
-                                ('Expires', '0')
-                            ]
-                        )
-                        return response
-            except Exception as pdf_error:
-                _logger.error(f"Erreur génération PDF bulletin {bulletin_id}: {str(pdf_error)}")
-            
-            # Fallback: créer un PDF simple avec les données du bulletin
-            try:
-                from reportlab.lib import colors
-                from reportlab.lib.pagesizes import letter, A4
-                from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-                from reportlab.lib.units import inch
-                import io
-                
-                # Créer un buffer pour le PDF
-                buffer = io.BytesIO()
-                
-                # Créer le document PDF
-                doc = SimpleDocTemplate(buffer, pagesize=A4)
-                elements = []
-                styles = getSampleStyleSheet()
-                
-                # Titre
-                title_style = ParagraphStyle(
-                    'CustomTitle',
-                    parent=styles['Heading1'],
-                    fontSize=18,
-                    spaceAfter=30,
-                    alignment=1,  # Centré
-                )
-                elements.append(Paragraph("BULLETIN SCOLAIRE", title_style))
-                elements.append(Paragraph(f"{bulletin.trimestre_id.name}", styles['Heading2']))
-                elements.append(Spacer(1, 20))
-                
-                # Informations étudiant
-                info_data = [
-                    ['Élève:', bulletin.student_id.name],
-                    ['Classe:', bulletin.batch_id.name],
-                    ['N° Bulletin:', bulletin.numero_bulletin or 'N/A'],
-                    ['Moyenne Générale:', f"{bulletin.moyenne_generale:.2f}/20"],
-                    ['Rang:', f"{bulletin.rang_classe}/{bulletin.total_eleves_classe}"],
-                ]
-                
-                info_table = Table(info_data, colWidths=[2*inch, 3*inch])
-                info_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-                ]))
-                elements.append(info_table)
-                elements.append(Spacer(1, 20))
-                
-                # Tableau des notes
-                notes_data = [['Matières', 'Coeff.', 'Moyenne', 'Appréciation']]
-                
-                for line in bulletin.note_lines:
-                    notes_data.append([
-                        line.subject_id.name,
-                        str(line.coefficient),
-                        f"{line.moyenne_matiere:.2f}",
-                        line.appreciation or ''
-                    ])
-                
-                # Ligne de moyenne générale
-                notes_data.append([
-                    'MOYENNE GÉNÉRALE',
-                    '',
-                    f"{bulletin.moyenne_generale:.2f}",
-                    ''
-                ])
-                
-                notes_table = Table(notes_data, colWidths=[3*inch, 0.8*inch, 1*inch, 2*inch])
-                notes_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 10),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-                    ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-                    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                elements.append(notes_table)
-                
-                # Appréciation générale
-                if bulletin.appreciation_generale:
-                    elements.append(Spacer(1, 20))
-                    elements.append(Paragraph("Appréciation Générale:", styles['Heading3']))
-                    elements.append(Paragraph(bulletin.appreciation_generale, styles['Normal']))
-                
-                # Générer le PDF
-                doc.build(elements)
-                
-                # Récupérer le contenu du buffer
-                pdf_content = buffer.getvalue()
-                buffer.close()
-                
-                # Retourner le PDF
-                response = request.make_response(
-                    pdf_content,
-                    headers=[
-                        ('Content-Type', 'application/pdf'),
-                        ('Content-Length', len(pdf_content)),
-                        ('Content-Disposition', f'attachment; filename="{filename}"'),
-                        ('Cache-Control', 'no-cache, no-store, must-revalidate'),
-                        ('Pragma', 'no-cache'),
-                        ('Expires', '0')
-                    ]
-                )
-                return response
-                
-            except ImportError:
-                # Si reportlab n'est pas disponible, fallback vers URL
-                _logger.warning("reportlab non disponible, utilisation du fallback URL")
-                pdf_url = f"/web/report/pdf/school_management.report_bulletin_scolaire/{bulletin_id}"
-                return {
-                    'status': 'success',
-                    'data': {
-                        'download_url': pdf_url,
-                        'filename': filename
-                    },
-                    'message': 'URL de téléchargement PDF générée (reportlab non disponible)'
-                }
-            except Exception as fallback_error:
-                _logger.error(f"Erreur génération PDF fallback bulletin {bulletin_id}: {str(fallback_error)}")
-                # Dernier fallback: retourner une URL simple
-                pdf_url = f"/web/report/pdf/school_management.report_bulletin_scolaire/{bulletin_id}"
-                return {
-                    'status': 'success',
-                    'data': {
-                        'download_url': pdf_url,
-                        'filename': filename
-                    },
-                    'message': 'URL de téléchargement PDF générée (fallback)'
-                }
+            filename = bulletin._get_pdf_filename()
+
+            # Empreinte du contenu : le client peut réutiliser sa copie tant qu'elle ne change pas
+            cache_key = bulletin._get_pdf_cache_key()
+            if request.httprequest.if_none_match.contains(cache_key):
+                return Response(status=304, headers=[('ETag', f'"{cache_key}"'),
+                                                     ('Cache-Control', 'private, no-cache')])
+
+            pdf_content = bulletin._get_cached_pdf(cache_key)
+            if pdf_content:
+                return self._make_pdf_response(pdf_content, filename, cache_key)
+
+            # Même rendu reportlab que l'impression en lot
+            pdf_content = render_bulletin_pdf(bulletin._get_pdf_data())
+            bulletin._store_pdf_cache(cache_key, pdf_content)
+            return self._make_pdf_response(pdf_content, filename, cache_key)
 
         except Exception as e:
             _logger.error(f"Erreur endpoint PDF bulletin {bulletin_id}: {str(e)}")
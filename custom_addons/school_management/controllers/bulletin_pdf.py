@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Rendu reportlab des bulletins.
+
+Seul moteur de rendu des bulletins, à l'unité comme en lot : ces fonctions ne
+travaillent que sur des dictionnaires préparés par op.bulletin._get_pdf_data()
+et n'accèdent jamais à l'ORM.
+"""
+import io
+import logging
+import tempfile
+import zipfile
+
+_logger = logging.getLogger(__name__)
+
+
+def render_bulletin_pdf(data):
+    """Construire le PDF reportlab d'un bulletin et retourner ses octets"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+
+    # Créer un buffer pour le PDF
+    buffer = io.BytesIO()
+
+    # Créer le document PDF
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Titre
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,  # Centré
+    )
+    elements.append(Paragraph("BULLETIN SCOLAIRE", title_style))
+    elements.append(Paragraph(f"{data['trimestre_name']}", styles['Heading2']))
+    elements.append(Spacer(1, 20))
+
+    # Informations étudiant
+    info_data = [
+        ['Élève:', data['student_name']],
+        ['Classe:', data['batch_name']],
+        ['N° Bulletin:', data['numero'] or 'N/A'],
+        ['Moyenne Générale:', f"{data['moyenne_generale']:.2f}/20"],
+        ['Rang:', f"{data['rang_classe']}/{data['total_eleves_classe']}"],
+        ['Présence:', f"{data['taux_presence']:.1f}% ({data['total_absences']} absences, {data['total_retards']} retards)"],
+    ]
+
+    info_table = Table(info_data, colWidths=[2*inch, 3*inch])
+    info_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ]))
+    elements.append(info_table)
+    elements.append(Spacer(1, 20))
+
+    # Tableau des notes
+    notes_data = [['Matières', 'Coeff.', 'Moyenne', 'Appréciation']]
+
+    for line in data['lines']:
+        notes_data.append([
+            line['subject_name'],
+            str(line['coefficient']),
+            f"{line['moyenne_matiere']:.2f}",
+            line['appreciation'] or ''
+        ])
+
+    # Ligne de moyenne générale
+    notes_data.append([
+        'MOYENNE GÉNÉRALE',
+        '',
+        f"{data['moyenne_generale']:.2f}",
+        ''
+    ])
+
+    notes_table = Table(notes_data, colWidths=[3*inch, 0.8*inch, 1*inch, 2*inch])
+    notes_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(notes_table)
+
+    # Appréciation générale
+    if data['appreciation_generale']:
+        elements.append(Spacer(1, 20))
+        elements.append(Paragraph("Appréciation Générale:", styles['Heading3']))
+        elements.append(Paragraph(data['appreciation_generale'], styles['Normal']))
+
+    # Générer le PDF
+    doc.build(elements)
+
+    pdf_content = buffer.getvalue()
+    buffer.close()
+    return pdf_content
+
+
+def iter_rendered_pdfs(datas):
+    """Rendre une liste de bulletins un par un, dans l'ordre
+
+    Le rendu reste dans le processus du serveur : il est soumis aux limites
+    de mémoire et de durée des workers, et un seul document est en mémoire
+    à la fois.
+    """
+    for data in datas:
+        yield render_bulletin_pdf(data)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Tampon en écriture seule vidé au fur et à mesure du streaming"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(named_pdfs):
+    """Produire une archive ZIP morceau par morceau à partir de (nom, octets PDF)"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for filename, pdf_content in named_pdfs:
+            archive.writestr(filename, pdf_content)
+            chunk = buffer.pop()
+            if chunk:
+                yield chunk
+    chunk = buffer.pop()
+    if chunk:
+        yield chunk
+
+
+def merge_pdfs(pdf_contents):
+    """Fusionner des PDF dans un fichier temporaire, retourné positionné au début
+
+    Chaque document passe par un fichier temporaire : la fusion ne garde pas
+    tous les bulletins en mémoire.
+    """
+    from PyPDF2 import PdfFileMerger
+
+    merger = PdfFileMerger(strict=False)
+    sources = []
+    try:
+        for pdf_content in pdf_contents:
+            source = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            source.write(pdf_content)
+            source.seek(0)
+            sources.append(source)
+            merger.append(source)
+
+        output = tempfile.TemporaryFile()
+        merger.write(output)
+        output.seek(0)
+        return output
+    finally:
+        merger.close()
+        for source in sources:
+            source.close()
+
+
+def iter_file(fileobj, chunk_size=64 * 1024):
+    """Lire un fichier par blocs puis le fermer"""
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
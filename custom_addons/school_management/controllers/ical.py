@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Sérialisation iCalendar (RFC 5545) des emplois du temps
+
+Module sans dépendance à l'ORM : les événements sont préparés dans la requête
+puis sérialisés morceau par morceau pendant le streaming de la réponse.
+"""
+
+# Nombre d'événements sérialisés par morceau envoyé au client
+ICAL_CHUNK_EVENTS = 50
+ICAL_PRODID = '-//School Management//Emplois du temps//FR'
+
+
+def escape_text(value):
+    """Échapper une valeur TEXT : antislash, point-virgule, virgule et retours à la ligne"""
+    return (str(value or '')
+            .replace('\\', '\\\\')
+            .replace(';', '\\;')
+            .replace(',', '\\,')
+            .replace('\r\n', '\\n')
+            .replace('\n', '\\n'))
+
+
+def fold_line(line):
+    """Replier une ligne à 75 octets (continuation par un espace)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    current = ''
+    size = 0
+    limit = 75
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > limit:
+            parts.append(current)
+            current, size, limit = ' ', 1, 75
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+    """Date et heure flottantes (heure locale de l'école, sans fuseau)"""
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def format_utc(value):
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def format_event(event, stamp):
+    """Lignes VEVENT d'un événement
+
+    :param event: dict uid, start, end, summary et optionnellement location,
+                  description, status, last_modified, until (date de fin de
+                  la récurrence hebdomadaire) et exdates
+    :param stamp: datetime UTC de génération (DTSTAMP)
+    """
+    lines = [
+        'BEGIN:VEVENT',
+        'UID:%s' % event['uid'],
+        'DTSTAMP:%s' % format_utc(stamp),
+        'DTSTART:%s' % format_datetime(event['start']),
+        'DTEND:%s' % format_datetime(event['end']),
+        'SUMMARY:%s' % escape_text(event['summary']),
+    ]
+    if event.get('until'):
+        lines.append('RRULE:FREQ=WEEKLY;UNTIL=%sT235959' % event['until'].strftime('%Y%m%d'))
+        for exdate in event.get('exdates') or []:
+            lines.append('EXDATE:%s' % format_datetime(exdate))
+    if event.get('location'):
+        lines.append('LOCATION:%s' % escape_text(event['location']))
+    if event.get('description'):
+        lines.append('DESCRIPTION:%s' % escape_text(event['description']))
+    if event.get('status'):
+        lines.append('STATUS:%s' % event['status'])
+    if event.get('last_modified'):
+        lines.append('LAST-MODIFIED:%s' % format_utc(event['last_modified']))
+    lines.append('END:VEVENT')
+    return ''.join(fold_line(line) for line in lines)
+
+
+def iter_calendar(name, events, stamp):
+    """Produire le calendrier en morceaux d'octets UTF-8"""
+    yield ''.join(fold_line(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:%s' % ICAL_PRODID,
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:%s' % escape_text(name),
+        'X-PUBLISHED-TTL:PT15M',
+    )).encode('utf-8')
+    chunk = []
+    for event in events:
+        chunk.append(format_event(event, stamp))
+        if len(chunk) >= ICAL_CHUNK_EVENTS:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+    chunk.append(fold_line('END:VCALENDAR'))
+    yield ''.join(chunk).encode('utf-8')
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from odoo import http, fields
 from odoo.http import request, Response
+from odoo.exceptions import ValidationError
 import json
 import functools
 import logging
@@ -11,10 +12,21 @@ import unicodedata
 import time
 from passlib.context import CryptContext
 import re
+import werkzeug.http
 import werkzeug.wrappers
 
+from ..models.op_resource_occupancy import parse_hour
+from ..models.op_schedule_grid import SCHEDULE_GRID_KINDS
+from ..models.op_calendar_feed import CALENDAR_FEED_KINDS
+from ..models.op_attendance_fact import empty_totals, presence_rate
+from ..models.op_attendance_sync import parse_client_timestamp
+from .ical import iter_calendar
+
 _logger = logging.getLogger(__name__)
 
+# Taille maximale d'un lot de synchronisation hors ligne
+SYNC_MAX_OPERATIONS = 1000
+
 # Origines autorisées pour CORS
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
@@ -86,6 +98,28 @@ def get_cors_headers(origin=None):
         ]
     return headers
 
+def serialize_grid_session(entry):
+    """Session d'une grille hebdomadaire au format des endpoints /api/sessions
+
+    Date et heures de la grille sont celles de start_datetime et end_datetime
+    (UTC, sans fuseau) : les datetimes sont reconstruits à la minute près.
+    """
+    subject = entry['subject']
+    return {
+        'id': entry['id'],
+        'name': entry['name'],
+        'start_datetime': '%sT%s:00' % (entry['date'], entry['start_time']),
+        'end_datetime': '%sT%s:00' % (entry['date'], entry['end_time']),
+        'state': entry['state'],
+        'subject': {
+            'id': subject['id'],
+            'name': subject['name'],
+            'code': subject.get('code') or ''
+        } if subject else None,
+        'batch': entry['batch'],
+        'faculty': entry['faculty'],
+    }
+
 # ---------------- CONTROLLER PRINCIPAL ----------------
 class SchoolManagementController(http.Controller):
 
@@ -2463,6 +2497,183 @@ class SchoolManagementController(http.Controller):
             _logger.error("Erreur create_session: %s", str(e))
             return {'status': 'error', 'code': 500, 'message': str(e)}
 
+    @http.route('/api/sessions/<int:session_id>/attendance', auth='none', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def mark_session_attendance(self, session_id, **kwargs):
+        """Enregistrer l'appel complet d'une session
+
+        Corps : {"entries": [{"student_id": 1, "state": "present", "arrival_time": "08:05"}, ...]}
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            session = request.env['op.session'].sudo().browse(session_id)
+            if not session.exists():
+                return {'status': 'error', 'code': 404, 'message': 'Session non trouvée'}
+
+            data = json.loads(request.httprequest.data.decode('utf-8') or '{}')
+            raw_entries = data.get('entries') if isinstance(data, dict) else data
+            if not isinstance(raw_entries, list) or not raw_entries:
+                return {'status': 'error', 'code': 400, 'message': 'La liste entries est obligatoire'}
+
+            Attendance = request.env['op.attendance'].sudo()
+            states = dict(Attendance._fields['state'].selection)
+            entries = []
+            for raw in raw_entries:
+                if not isinstance(raw, dict):
+                    return {'status': 'error', 'code': 400, 'message': 'Entrée invalide: %s' % (raw,)}
+                try:
+                    student_id = int(raw.get('student_id'))
+                except (TypeError, ValueError):
+                    return {'status': 'error', 'code': 400, 'message': 'student_id invalide: %s' % raw.get('student_id')}
+                state = raw.get('state') or 'present'
+                if state not in states:
+                    return {'status': 'error', 'code': 400,
+                            'message': 'État invalide pour l\'étudiant %s (%s)' % (student_id, ', '.join(states))}
+                arrival_time = parse_hour(raw.get('arrival_time'))
+                if raw.get('arrival_time') not in (None, '') and arrival_time is None:
+                    return {'status': 'error', 'code': 400, 'message': 'arrival_time invalide pour l\'étudiant %s' % student_id}
+                entries.append({'student_id': student_id, 'state': state, 'arrival_time': arrival_time})
+
+            # Seuls les étudiants inscrits dans la classe de la session peuvent être pointés
+            student_ids = {entry['student_id'] for entry in entries}
+            if session.batch_id:
+                known_ids = set(request.env['op.student.course'].sudo().search([
+                    ('batch_id', '=', session.batch_id.id),
+                    ('student_id', 'in', list(student_ids)),
+                ]).mapped('student_id').ids)
+            else:
+                known_ids = set(request.env['op.student'].sudo().browse(list(student_ids)).exists().ids)
+            unknown_ids = sorted(student_ids - known_ids)
+            if unknown_ids:
+                return {'status': 'error', 'code': 400,
+                        'message': 'Étudiants hors de la classe de la session: %s' % ', '.join(map(str, unknown_ids))}
+
+            count = Attendance.upsert_session_attendance(session, entries)
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': '%s présence(s) enregistrée(s)' % count,
+                'data': {
+                    'session_id': session.id,
+                    'updated': count,
+                    'attendance_count': session.attendance_count,
+                    'absent_count': session.absent_count,
+                    'attendance_rate': round(session.attendance_rate, 2),
+                },
+            }
+        except (ValidationError, ValueError, TypeError) as e:
+            return {'status': 'error', 'code': 400, 'message': str(e)}
+        except Exception as e:
+            _logger.error("Erreur mark_session_attendance: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    @http.route('/api/sync/attendance', auth='none', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def sync_attendance(self, **kwargs):
+        """Synchroniser les présences et notes saisies hors ligne sur une tablette
+
+        Corps : {"device_id": "...", "faculty_id": 3, "sync_token": "...",
+                 "operations": [{"key": "uuid", "type": "attendance", "session_id": 1,
+                                 "student_id": 2, "state": "present", "client_ts": "2026-01-05T08:05:00Z"},
+                                {"key": "uuid", "type": "session_note", "session_id": 1,
+                                 "notes": "...", "client_ts": "..."}]}
+
+        Chaque opération est rejouable sans effet grâce à sa clé ; la réponse
+        donne le résultat de chaque opération, les changements du serveur
+        depuis sync_token et le jeton à renvoyer à la prochaine synchronisation.
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            data = json.loads(request.httprequest.data.decode('utf-8') or '{}')
+            if not isinstance(data, dict):
+                return {'status': 'error', 'code': 400, 'message': 'Objet JSON attendu'}
+            operations = data.get('operations') or []
+            if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+                return {'status': 'error', 'code': 400, 'message': 'operations doit être une liste d\'objets'}
+            if len(operations) > SYNC_MAX_OPERATIONS:
+                return {'status': 'error', 'code': 413,
+                        'message': 'Au plus %s opérations par synchronisation' % SYNC_MAX_OPERATIONS}
+            faculty_id = data.get('faculty_id')
+            if faculty_id not in (None, ''):
+                try:
+                    faculty_id = int(faculty_id)
+                except (TypeError, ValueError):
+                    return {'status': 'error', 'code': 400, 'message': 'faculty_id invalide'}
+
+            result = request.env['op.sync.operation'].sudo().sync(
+                operations,
+                sync_token=data.get('sync_token'),
+                faculty_id=faculty_id or None,
+                device_id=data.get('device_id'),
+            )
+            applied = sum(1 for item in result['results'] if item['status'] == 'applied')
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': '%s/%s opération(s) appliquée(s)' % (applied, len(operations)),
+                'data': result,
+            }
+        except ValueError as e:
+            return {'status': 'error', 'code': 400, 'message': str(e)}
+        except Exception as e:
+            _logger.error("Erreur sync_attendance: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    @http.route('/api/checkin', auth='none', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def record_checkin(self, **kwargs):
+        """Enregistrer un passage au portail (badge ou QR code)
+
+        Corps : {"token": "...", "method": "badge" | "qr", "gate": "Entrée A",
+                 "scanned_at": "2026-01-05T07:55:00Z"}
+
+        Le badge est validé en mémoire et le passage est écrit par lots en
+        arrière-plan : la réponse 202 ne garantit pas encore l'écriture. Le
+        report sur les présences est fait par la tâche planifiée.
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            data = json.loads(request.httprequest.data.decode('utf-8') or '{}')
+            if not isinstance(data, dict):
+                return {'status': 'error', 'code': 400, 'message': 'Objet JSON attendu'}
+            token = data.get('token')
+            if not token or not isinstance(token, str):
+                return {'status': 'error', 'code': 400, 'message': 'token requis'}
+            method = data.get('method') or 'badge'
+            if method not in ('badge', 'qr'):
+                return {'status': 'error', 'code': 400, 'message': 'method doit valoir badge ou qr'}
+            scanned_at = None
+            if data.get('scanned_at'):
+                scanned_at = parse_client_timestamp(data['scanned_at'])
+                if not scanned_at:
+                    return {'status': 'error', 'code': 400, 'message': 'scanned_at invalide'}
+
+            result = request.env['op.checkin'].sudo().record_scan(
+                token, method=method, gate=data.get('gate') or None, scanned_at=scanned_at)
+            if result is None:
+                return {'status': 'error', 'code': 404, 'message': 'Badge inconnu'}
+            if not result['buffered']:
+                return {'status': 'error', 'code': 503,
+                        'message': 'Enregistrement des passages indisponible, réessayer plus tard'}
+            return {
+                'status': 'success',
+                'code': 202,
+                'message': 'Passage enregistré',
+                'data': {
+                    'student_id': result['student_id'],
+                    'name': result['name'],
+                    'pending': result['pending'],
+                },
+            }
+        except ValueError as e:
+            return {'status': 'error', 'code': 400, 'message': str(e)}
+        except Exception as e:
+            _logger.error("Erreur record_checkin: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
     @http.route('/api/sessions/<int:session_id>', auth='none', type='http', csrf=False, methods=['GET', 'PUT', 'DELETE', 'OPTIONS'])
     @cors_wrapper
     def handle_session_by_id(self, session_id, **kwargs):
@@ -2649,70 +2860,42 @@ class SchoolManagementController(http.Controller):
     @http.route('/api/sessions/today', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
     @cors_wrapper
     def get_today_sessions(self, **kwargs):
-        """Récupérer les sessions d'aujourd'hui avec statistiques de présence"""
+        """Récupérer les sessions d'aujourd'hui avec statistiques de présence
+
+        Les sessions sont lues dans les grilles hebdomadaires des classes.
+        """
         try:
             _logger.info("=== DEBUT get_today_sessions ===")
             
             # Date d'aujourd'hui
-            from datetime import datetime, timedelta
+            from datetime import datetime
             today = datetime.now().date()
             
             _logger.info(f"🔍 get_today_sessions: Recherche des sessions pour {today}")
             
-            # Récupérer les sessions d'aujourd'hui
-            sessions = request.env['op.session'].sudo().search([
-                ('start_datetime', '>=', today),
-                ('start_datetime', '<', today + timedelta(days=1))
-            ])
+            # Sessions d'aujourd'hui de toutes les classes
+            entries = request.env['op.schedule.grid'].sudo().get_school_entries(today, today, 'session')
             
-            _logger.info(f"🔍 get_today_sessions: {len(sessions)} sessions trouvées")
+            _logger.info(f"🔍 get_today_sessions: {len(entries)} sessions trouvées")
             
-            sessions_data = []
+            # Statistiques de présence de toutes les sessions en une requête groupée
+            session_totals = request.env['op.attendance.fact'].sudo().get_session_totals(
+                [entry['id'] for entry in entries])
             
-            for session in sessions:
-                try:
-                    # Calculer les statistiques de présence pour cette session
-                    attendances = request.env['op.attendance.line'].sudo().search([
-                        ('attendance_id.session_id', '=', session.id),
-                        ('attendance_date', '=', today)
-                    ])
-                    
-                    total_students = len(attendances)
-                    present_count = len(attendances.filtered(lambda a: a.present))
-                    attendance_rate = (present_count / total_students * 100) if total_students > 0 else 0
-                    
-                    session_data = {
-                        'id': session.id,
-                        'name': session.name,
-                        'start_datetime': session.start_datetime.isoformat() if session.start_datetime else None,
-                        'end_datetime': session.end_datetime.isoformat() if session.end_datetime else None,
-                        'state': session.state,
-                        'subject': {
-                            'id': session.subject_id.id,
-                            'name': session.subject_id.name,
-                            'code': session.subject_id.code if hasattr(session.subject_id, 'code') else ''
-                        } if session.subject_id else None,
-                        'batch': {
-                            'id': session.batch_id.id,
-                            'name': session.batch_id.name
-                        } if session.batch_id else None,
-                        'faculty': {
-                            'id': session.faculty_id.id,
-                            'name': session.faculty_id.name
-                        } if session.faculty_id else None,
-                        'attendance_stats': {
-                            'total_students': total_students,
-                            'present_count': present_count,
-                            'absent_count': total_students - present_count,
-                            'attendance_rate': round(attendance_rate, 1)
-                        }
-                    }
-                    
-                    sessions_data.append(session_data)
-                    
-                except Exception as e:
-                    _logger.error(f"Erreur lors du traitement de la session {session.id}: {str(e)}")
-                    continue
+            sessions_data = []
+            for entry in entries:
+                totals = session_totals.get(entry['id']) or empty_totals()
+                total_students = totals['total']
+                present_count = totals['present'] + totals['late']
+                attendance_rate = presence_rate(totals)
+
+                session_data = dict(serialize_grid_session(entry), attendance_stats={
+                    'total_students': total_students,
+                    'present_count': present_count,
+                    'absent_count': total_students - present_count,
+                    'attendance_rate': round(attendance_rate, 1)
+                })
+                sessions_data.append(session_data)
             
             result = {
                 'status': 'success',
@@ -2730,7 +2913,10 @@ class SchoolManagementController(http.Controller):
     @http.route('/api/sessions/upcoming', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
     @cors_wrapper
     def get_upcoming_sessions(self, **kwargs):
-        """Récupérer les sessions à venir"""
+        """Récupérer les sessions à venir
+
+        Les sessions sont lues dans les grilles hebdomadaires des classes.
+        """
         try:
             _logger.info("=== DEBUT get_upcoming_sessions ===")
             
@@ -2739,44 +2925,15 @@ class SchoolManagementController(http.Controller):
             today = datetime.now().date()
             end_date = today + timedelta(days=days)
             
-            # Rechercher les sessions à venir
-            sessions = request.env['op.session'].sudo().search([
-                ('start_datetime', '>=', datetime.combine(today, datetime.min.time())),
-                ('start_datetime', '<=', datetime.combine(end_date, datetime.max.time())),
-                ('state', 'in', ['draft', 'confirm', 'confirmed'])
-            ], order='start_datetime asc')
-            
-            _logger.info(f"🔍 get_upcoming_sessions: {len(sessions)} sessions trouvées pour les {days} prochains jours")
+            # Sessions à venir de toutes les classes, triées par date et heure
+            entries = request.env['op.schedule.grid'].sudo().get_school_entries(today, end_date, 'session')
+            sessions_data = [
+                serialize_grid_session(entry)
+                for entry in entries
+                if entry['state'] in ('draft', 'confirm', 'confirmed')
+            ]
             
-            sessions_data = []
-            for session in sessions:
-                try:
-                    session_data = {
-                        'id': session.id,
-                        'name': session.name,
-                        'start_datetime': session.start_datetime.isoformat() if session.start_datetime else None,
-                        'end_datetime': session.end_datetime.isoformat() if session.end_datetime else None,
-                        'state': session.state,
-                        'subject': {
-                            'id': session.subject_id.id,
-                            'name': session.subject_id.name,
-                            'code': session.subject_id.code if hasattr(session.subject_id, 'code') else ''
-                        } if session.subject_id else None,
-                        'batch': {
-                            'id': session.batch_id.id,
-                            'name': session.batch_id.name
-                        } if session.batch_id else None,
-                        'faculty': {
-                            'id': session.faculty_id.id,
-                            'name': session.faculty_id.name
-                        } if session.faculty_id else None
-                    }
-                    
-                    sessions_data.append(session_data)
-                    
-                except Exception as session_error:
-                    _logger.error(f"❌ Erreur session {session.id}: {str(session_error)}")
-                    continue
+            _logger.info(f"🔍 get_upcoming_sessions: {len(sessions_data)} sessions trouvées pour les {days} prochains jours")
             
             result = {
                 'status': 'success',
@@ -2847,12 +3004,13 @@ class SchoolManagementController(http.Controller):
                     ('notes', 'ilike', search)
                 ])
             
+            total_real_timetables = request.env['op.timetable'].sudo().search_count(timetable_domain)
             real_timetables = request.env['op.timetable'].sudo().search(
                 timetable_domain,
                 order='created_date desc',
                 limit=limit,
                 offset=offset
-            )
+            ) if offset < total_real_timetables else request.env['op.timetable']
             
             for timetable in real_timetables:
                 # Récupérer les créneaux
@@ -2910,114 +3068,22 @@ class SchoolManagementController(http.Controller):
                 }
                 timetables_list.append(timetable_data)
             
-            # 2. Si on n'a pas assez de résultats, compléter avec les emplois du temps générés à partir des sessions
+            # 2. Compléter avec les emplois du temps déduits des sessions (vue SQL)
+            SessionTimetable = request.env['op.session.timetable'].sudo()
+            session_domain = SessionTimetable._get_search_domain(search)
+            total_session_timetables = SessionTimetable.search_count(session_domain)
             remaining_limit = limit - len(timetables_list)
             if remaining_limit > 0:
-                session_domain = []
-                if search:
-                    session_domain.extend([
-                        '|', '|',
-                        ('batch_id.name', 'ilike', search),
-                        ('subject_id.name', 'ilike', search),
-                        ('faculty_id.name', 'ilike', search),
-                    ])
-                
-                # Récupérer les sessions distinctes par batch pour créer les emplois du temps
-                sessions = request.env['op.session'].sudo().search(
+                session_offset = max(0, offset - total_real_timetables)
+                session_timetables = SessionTimetable.search(
                     session_domain,
-                    order='batch_id, start_datetime',
-                    limit=remaining_limit * 5  # Multiplier car on groupe par batch
+                    limit=remaining_limit,
+                    offset=session_offset,
                 )
-                
-                # Grouper par batch pour créer les emplois du temps
-                timetables_dict = {}
-                
-                for session in sessions:
-                    if not session.batch_id:
-                        continue
-                        
-                    batch_key = session.batch_id.id
-                    
-                    # Vérifier qu'on n'a pas déjà un vrai emploi du temps pour cette classe
-                    existing_real = any(t['batch'] and t['batch']['id'] == batch_key for t in timetables_list)
-                    if existing_real:
-                        continue
-                    
-                    if batch_key not in timetables_dict:
-                        # Calculer les dates de début et fin basées sur les sessions
-                        batch_sessions = request.env['op.session'].sudo().search([
-                            ('batch_id', '=', session.batch_id.id)
-                        ], order='start_datetime')
-                        
-                        start_date = None
-                        end_date = None
-                        if batch_sessions:
-                            start_date = min(s.start_datetime for s in batch_sessions if s.start_datetime)
-                            end_date = max(s.end_datetime for s in batch_sessions if s.end_datetime)
-                        
-                        timetables_dict[batch_key] = {
-                            'id': f"timetable_{batch_key}",
-                            'name': f"Emploi du temps - {session.batch_id.name}",
-                            'batch': {
-                                'id': session.batch_id.id,
-                                'name': session.batch_id.name
-                            } if session.batch_id else None,
-                            'start_date': start_date.strftime('%Y-%m-%d') if start_date else None,
-                            'end_date': end_date.strftime('%Y-%m-%d') if end_date else None,
-                            'state': 'active',
-                            'sessions_count': 0,
-                            'subjects': set(),
-                            'faculty': set(),
-                            'slot_ids': []
-                        }
-                    
-                    # Ajouter les informations de session
-                    timetable = timetables_dict[batch_key]
-                    timetable['sessions_count'] += 1
-                    
-                    if session.subject_id:
-                        timetable['subjects'].add(session.subject_id.name)
-                    if session.faculty_id:
-                        timetable['faculty'].add(session.faculty_id.name)
-                    
-                    # Créer un slot pour cette session
-                    slot_data = {
-                        'id': session.id,
-                        'day_of_week': session.start_datetime.weekday() if session.start_datetime else 0,
-                        'start_time': session.start_datetime.strftime('%H:%M') if session.start_datetime else '08:00',
-                        'end_time': session.end_datetime.strftime('%H:%M') if session.end_datetime else '09:00',
-                        'subject': {
-                            'id': session.subject_id.id,
-                            'name': session.subject_id.name
-                        } if session.subject_id else None,
-                        'faculty': {
-                            'id': session.faculty_id.id,
-                            'name': session.faculty_id.name
-                        } if session.faculty_id else None,
-                        'classroom': {
-                            'name': getattr(session, 'classroom_id.name', 'Non définie')
-                        },
-                        'session_type': getattr(session, 'type', 'lecture'),
-                        'topic': getattr(session, 'name', '')
-                    }
-                    
-                    timetable['slot_ids'].append(slot_data)
-                
-                # Convertir en liste et nettoyer les sets
-                for timetable in timetables_dict.values():
-                    timetable['subjects'] = list(timetable['subjects'])
-                    timetable['faculty'] = list(timetable['faculty'])
-                    timetables_list.append(timetable)
-                    
-                    if len(timetables_list) >= limit:
-                        break
-            
-            # Compter le total pour la pagination
-            total_real_timetables = request.env['op.timetable'].sudo().search_count(timetable_domain)
-            total_sessions = request.env['op.session'].sudo().search_count([])
-            total_estimated_session_timetables = max(0, total_sessions // 5)
-            total_timetables = total_real_timetables + total_estimated_session_timetables
-            
+                timetables_list.extend(session_timetables._get_api_data())
+
+            total_timetables = total_real_timetables + total_session_timetables
+
             result = {
                 'status': 'success',
                 'data': {
@@ -3214,6 +3280,365 @@ class SchoolManagementController(http.Controller):
                 'message': f'Erreur lors de la création de l\'emploi du temps: {str(e)}'
             }
 
+    @http.route('/api/timetables/validate', auth='none', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def validate_timetables(self, **kwargs):
+        """Détecter tous les conflits de salle, d'enseignant et de classe
+
+        Corps JSON optionnel : {"timetable_ids": [...]} pour vérifier des
+        emplois du temps non actifs avec les emplois du temps actifs.
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            data = {}
+            if request.httprequest.data:
+                try:
+                    data = json.loads(request.httprequest.data.decode('utf-8'))
+                except json.JSONDecodeError:
+                    return {'status': 'error', 'code': 400, 'message': 'Données JSON invalides'}
+
+            timetable_ids = data.get('timetable_ids') or []
+            if not isinstance(timetable_ids, list):
+                timetable_ids = [timetable_ids]
+            try:
+                timetable_ids = [int(tid) for tid in timetable_ids]
+            except (ValueError, TypeError):
+                return {'status': 'error', 'code': 400, 'message': 'timetable_ids invalide'}
+
+            report = request.env['op.timetable.slot'].sudo().validate_timetables(timetable_ids)
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': '%s conflit(s) détecté(s)' % report['count'],
+                'data': report,
+            }
+        except Exception as e:
+            _logger.error("Erreur validate_timetables: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    @http.route('/api/timetables/generate-sessions', auth='none', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def generate_timetable_sessions(self, **kwargs):
+        """Générer les sessions d'un ou plusieurs emplois du temps
+
+        Corps JSON : {"timetable_ids": [...]} ou {"all_active": true},
+        plus "dry_run": true pour n'obtenir que les comptes.
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            data = {}
+            if request.httprequest.data:
+                try:
+                    data = json.loads(request.httprequest.data.decode('utf-8'))
+                except json.JSONDecodeError:
+                    return {'status': 'error', 'code': 400, 'message': 'Données JSON invalides'}
+
+            dry_run = bool(data.get('dry_run'))
+            Timetable = request.env['op.timetable'].sudo()
+            if data.get('all_active'):
+                summary = Timetable.generate_active_sessions(dry_run=dry_run)
+            else:
+                timetable_ids = data.get('timetable_ids') or []
+                if not isinstance(timetable_ids, list):
+                    timetable_ids = [timetable_ids]
+                try:
+                    timetable_ids = [int(tid) for tid in timetable_ids]
+                except (ValueError, TypeError):
+                    return {'status': 'error', 'code': 400, 'message': 'timetable_ids invalide'}
+                timetables = Timetable.browse(timetable_ids).exists()
+                if not timetables:
+                    return {'status': 'error', 'code': 400, 'message': 'timetable_ids ou all_active requis'}
+                summary = timetables._generate_sessions(dry_run=dry_run)
+
+            message = '%s session(s) %s' % (summary['created'], 'à créer' if dry_run else 'créée(s)')
+            return {'status': 'success', 'code': 200, 'message': message, 'data': summary}
+        except Exception as e:
+            _logger.error("Erreur generate_timetable_sessions: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    @http.route('/api/timetables/solve', auth='none', type='http', csrf=False, methods=['POST', 'OPTIONS'])
+    @cors_wrapper
+    def solve_timetables(self, **kwargs):
+        """Calculer automatiquement les emplois du temps des classes
+
+        Corps JSON : {"batch_ids": [...] (toutes les classes par défaut),
+        "start_date", "end_date", "apply": bool, "activate": bool,
+        "benchmark": nombre de classes fictives pour un banc d'essai}
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            data = {}
+            if request.httprequest.data:
+                try:
+                    data = json.loads(request.httprequest.data.decode('utf-8'))
+                except json.JSONDecodeError:
+                    return {'status': 'error', 'code': 400, 'message': 'Données JSON invalides'}
+
+            SolverRun = request.env['op.timetable.solver.run'].sudo()
+            if data.get('benchmark'):
+                run = SolverRun.run_benchmark(int(data['benchmark']), int(data.get('seed') or 0))
+            else:
+                batch_ids = data.get('batch_ids') or []
+                if not isinstance(batch_ids, list):
+                    batch_ids = [batch_ids]
+                try:
+                    batch_ids = [int(bid) for bid in batch_ids]
+                except (ValueError, TypeError):
+                    return {'status': 'error', 'code': 400, 'message': 'batch_ids invalide'}
+                run = SolverRun.solve(
+                    batch_ids=batch_ids or None,
+                    start_date=data.get('start_date'),
+                    end_date=data.get('end_date'),
+                    apply=bool(data.get('apply')),
+                    activate=bool(data.get('activate')),
+                )
+            message = '%s/%s heures placées en %s ms' % (run.placed_count, run.lesson_count, run.duration_ms)
+            return {'status': 'success', 'code': 200, 'message': message, 'data': run._get_api_data()}
+        except (ValueError, TypeError) as e:
+            return {'status': 'error', 'code': 400, 'message': str(e)}
+        except Exception as e:
+            _logger.error("Erreur solve_timetables: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    # ===== ENDPOINTS DISPONIBILITÉS =====
+
+    def _parse_availability_params(self, kwargs):
+        """Lire day (YYYY-MM-DD ou 0-6), start et end ; renvoie (day, start, end, erreur)"""
+        day_param = (kwargs.get('day') or '').strip()
+        if not day_param:
+            day = fields.Date.today()
+        elif day_param.isdigit():
+            day = int(day_param)
+            if day > 6:
+                return None, None, None, 'day doit être une date ou un jour de 0 (lundi) à 6'
+        else:
+            try:
+                day = datetime.strptime(day_param, '%Y-%m-%d').date()
+            except ValueError:
+                return None, None, None, 'Format de date invalide (YYYY-MM-DD attendu)'
+
+        start = parse_hour(kwargs.get('start'))
+        end = parse_hour(kwargs.get('end'))
+        if start is None or end is None:
+            return None, None, None, 'Les paramètres start et end sont obligatoires (HH:MM)'
+        if not 0 <= start < end <= 24:
+            return None, None, None, 'Plage horaire invalide'
+        return day, start, end, None
+
+    @http.route('/api/availability/rooms', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
+    @cors_wrapper
+    def get_available_rooms(self, **kwargs):
+        """Salles libres sur une plage horaire (capacity : capacité minimale)"""
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            day, start, end, error = self._parse_availability_params(kwargs)
+            if error:
+                return {'status': 'error', 'code': 400, 'message': error}
+
+            domain = [('is_active', '=', True)]
+            if kwargs.get('capacity'):
+                try:
+                    domain.append(('capacity', '>=', int(kwargs['capacity'])))
+                except ValueError:
+                    return {'status': 'error', 'code': 400, 'message': 'capacity invalide'}
+            rooms = request.env['op.classroom'].sudo().search(domain, order='capacity, name')
+            free_ids = set(request.env['op.resource.occupancy'].sudo().get_free_resources(
+                'classroom', day, start, end, rooms.ids))
+
+            rooms_data = [{
+                'id': room.id,
+                'name': room.name,
+                'code': room.code,
+                'capacity': room.capacity,
+                'building': room.building or '',
+                'floor': room.floor or '',
+            } for room in rooms if room.id in free_ids]
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': '%s salle(s) libre(s)' % len(rooms_data),
+                'data': {'rooms': rooms_data, 'count': len(rooms_data)},
+            }
+        except Exception as e:
+            _logger.error("Erreur get_available_rooms: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    @http.route('/api/availability/teachers', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
+    @cors_wrapper
+    def get_available_teachers(self, **kwargs):
+        """Enseignants libres sur une plage horaire (course_id : enseignants du cours)"""
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            day, start, end, error = self._parse_availability_params(kwargs)
+            if error:
+                return {'status': 'error', 'code': 400, 'message': error}
+
+            if kwargs.get('course_id'):
+                try:
+                    course = request.env['op.course'].sudo().browse(int(kwargs['course_id'])).exists()
+                except ValueError:
+                    return {'status': 'error', 'code': 400, 'message': 'course_id invalide'}
+                faculties = course.main_teacher_id | course.teacher_ids
+            else:
+                faculties = request.env['op.faculty'].sudo().search([], order='name')
+            free_ids = set(request.env['op.resource.occupancy'].sudo().get_free_resources(
+                'faculty', day, start, end, faculties.ids))
+
+            teachers_data = [{
+                'id': faculty.id,
+                'name': faculty.name,
+            } for faculty in faculties if faculty.id in free_ids]
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': '%s enseignant(s) libre(s)' % len(teachers_data),
+                'data': {'teachers': teachers_data, 'count': len(teachers_data)},
+            }
+        except Exception as e:
+            _logger.error("Erreur get_available_teachers: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    @http.route('/api/substitutions', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
+    @cors_wrapper
+    def get_substitutions(self, **kwargs):
+        """Remplaçants pour un enseignant absent
+
+        Paramètres : faculty_id (obligatoire), session_id ou date_from/date_to
+        (aujourd'hui par défaut), limit (5 candidats par session par défaut).
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            try:
+                faculty_id = int(kwargs.get('faculty_id') or 0)
+                session_ids = [int(kwargs['session_id'])] if kwargs.get('session_id') else None
+                limit = min(int(kwargs.get('limit') or 5), 50)
+                date_from = datetime.strptime(kwargs['date_from'], '%Y-%m-%d').date() if kwargs.get('date_from') else None
+                date_to = datetime.strptime(kwargs['date_to'], '%Y-%m-%d').date() if kwargs.get('date_to') else None
+            except ValueError:
+                return {'status': 'error', 'code': 400, 'message': 'Paramètres invalides'}
+            if not faculty_id:
+                return {'status': 'error', 'code': 400, 'message': 'faculty_id est obligatoire'}
+
+            results = request.env['op.session'].sudo().find_substitutes(
+                faculty_id, session_ids=session_ids, date_from=date_from, date_to=date_to, limit=limit)
+
+            substitutions = []
+            for entry in results:
+                session = entry['session']
+                substitutions.append({
+                    'session': {
+                        'id': session.id,
+                        'name': session.name,
+                        'date': session.date.strftime('%Y-%m-%d') if session.date else None,
+                        'start_time': f"{int(session.start_time):02d}:{int(round((session.start_time % 1) * 60)):02d}",
+                        'end_time': f"{int(session.end_time):02d}:{int(round((session.end_time % 1) * 60)):02d}",
+                        'subject_name': session.subject_id.name or '',
+                        'batch_name': session.batch_id.name or '',
+                        'classroom_name': session.classroom_id.name or '',
+                    },
+                    'candidates': entry['candidates'],
+                })
+            return {
+                'status': 'success',
+                'code': 200,
+                'message': '%s session(s) à remplacer' % len(substitutions),
+                'data': {'substitutions': substitutions, 'count': len(substitutions)},
+            }
+        except Exception as e:
+            _logger.error("Erreur get_substitutions: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    # ===== ENDPOINT GRILLES HEBDOMADAIRES =====
+
+    @http.route('/api/schedule/<string:kind>/<int:resource_id>', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
+    @cors_wrapper
+    def get_schedule_grid(self, kind, resource_id, **kwargs):
+        """Grille hebdomadaire d'une classe (batch), d'un enseignant (faculty) ou d'une salle (classroom)
+
+        week : date de la semaine (YYYY-MM-DD) ou semaine ISO (YYYY-Www), semaine courante par défaut
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            if kind not in SCHEDULE_GRID_KINDS:
+                return {'status': 'error', 'code': 400,
+                        'message': 'Type de grille invalide (%s)' % ', '.join(SCHEDULE_GRID_KINDS)}
+            week_param = (kwargs.get('week') or '').strip()
+            day = None
+            if week_param:
+                try:
+                    if '-W' in week_param.upper():
+                        year, week = week_param.upper().split('-W')
+                        day = date.fromisocalendar(int(year), int(week), 1)
+                    else:
+                        day = datetime.strptime(week_param, '%Y-%m-%d').date()
+                except ValueError:
+                    return {'status': 'error', 'code': 400,
+                            'message': 'Format de semaine invalide (YYYY-MM-DD ou YYYY-Www attendu)'}
+
+            model_name = SCHEDULE_GRID_KINDS[kind][0]
+            if not request.env[model_name].sudo().browse(resource_id).exists():
+                return {'status': 'error', 'code': 404, 'message': 'Ressource non trouvée'}
+            grid = request.env['op.schedule.grid'].sudo().get_grid(kind, resource_id, day)
+            return {'status': 'success', 'code': 200, 'message': 'Grille récupérée', 'data': grid}
+        except Exception as e:
+            _logger.error("Erreur get_schedule_grid: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
+    # ===== ENDPOINT FLUX ICALENDAR =====
+
+    @http.route('/api/calendar/<string:kind>/<int:resource_id>.ics', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
+    @cors_wrapper
+    def get_calendar_feed(self, kind, resource_id, **kwargs):
+        """Flux iCalendar d'une classe (batch), d'un enseignant (faculty) ou d'un étudiant (student)
+
+        Revalidable par ETag et Last-Modified : un client qui interroge le flux
+        régulièrement reçoit un 304 tant que ses sessions et créneaux ne changent pas.
+        """
+        if request.httprequest.method == 'OPTIONS':
+            return ''
+        try:
+            if kind not in CALENDAR_FEED_KINDS:
+                return {'status': 'error', 'code': 400,
+                        'message': 'Type de flux invalide (%s)' % ', '.join(CALENDAR_FEED_KINDS)}
+            Feed = request.env['op.calendar.feed'].sudo()
+            version = Feed.get_feed_version(kind, resource_id)
+            if not version:
+                return {'status': 'error', 'code': 404, 'message': 'Ressource non trouvée'}
+
+            headers = [('ETag', '"%s"' % version['etag']), ('Cache-Control', 'private, no-cache')]
+            if version['last_modified']:
+                headers.append(('Last-Modified', werkzeug.http.http_date(version['last_modified'])))
+            httprequest = request.httprequest
+            if httprequest.if_none_match:
+                not_modified = httprequest.if_none_match.contains(version['etag'])
+            else:
+                not_modified = bool(version['last_modified'] and httprequest.if_modified_since
+                                    and httprequest.if_modified_since.replace(tzinfo=None) >= version['last_modified'])
+            if not_modified:
+                return Response(status=304, headers=headers)
+
+            # Événements lus pendant la requête, sérialisés pendant le streaming
+            name, events = Feed.get_feed(kind, resource_id)
+            filename = '%s-%s.ics' % (kind, resource_id)
+            return Response(
+                iter_calendar(name, events, datetime.utcnow()),
+                headers=headers + [
+                    ('Content-Type', 'text/calendar; charset=utf-8'),
+                    ('Content-Disposition', 'inline; filename="%s"' % filename),
+                ],
+                direct_passthrough=True
+            )
+        except Exception as e:
+            _logger.error("Erreur get_calendar_feed: %s", str(e), exc_info=True)
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
     @http.route('/api/timetables/<int:timetable_id>', auth='none', type='http', csrf=False, methods=['GET', 'PUT', 'DELETE', 'OPTIONS'])
     @cors_wrapper
     def handle_timetable_by_id(self, timetable_id, **kwargs):
@@ -3583,10 +4008,8 @@ class SchoolManagementController(http.Controller):
             
             # Statistiques des présences récentes (7 derniers jours)
             week_ago = today - timedelta(days=7)
-            recent_attendance = request.env['op.attendance.line'].sudo().search_count([
-                ('attendance_date', '>=', week_ago),
-                ('attendance_date', '<=', today)
-            ])
+            recent_attendance = request.env['op.attendance.daily'].sudo().get_totals(
+                date_from=week_ago, date_to=today)['total']
             
             return {
                 'status': 'success',
@@ -4607,6 +5030,37 @@ class SchoolManagementController(http.Controller):
             _logger.error("Erreur get_student_reports: %s", str(e))
             return {'status': 'error', 'code': 500, 'message': str(e)}
 
+    @http.route('/api/parent/student/<int:student_id>/bulletins', auth='none', type='http', methods=['GET', 'OPTIONS'], csrf=False)
+    @cors_wrapper
+    def get_student_published_bulletins(self, student_id, **kwargs):
+        """Bulletins publiés d'un étudiant, servis depuis leurs instantanés figés"""
+        try:
+            if not hasattr(request, 'session') or not request.session.get('parent_user_id'):
+                return {'status': 'error', 'code': 401, 'message': 'Authentification requise'}
+
+            parent_user_id = request.session.get('parent_user_id')
+
+            # Vérifier que le parent a accès à cet étudiant
+            parent = request.env['op.parent'].sudo().search([('user_id', '=', parent_user_id)], limit=1)
+            if not parent or student_id not in parent.student_ids.ids:
+                return {'status': 'error', 'code': 403, 'message': 'Accès non autorisé à cet étudiant'}
+
+            # Une seule lecture indexée, sans aucun calcul
+            snapshots = request.env['op.bulletin'].sudo()._read_published_snapshots(student_id=student_id)
+            bulletins = [snapshot['api'] for snapshot in snapshots.values()]
+
+            return {
+                'status': 'success',
+                'data': {
+                    'bulletins': bulletins,
+                    'count': len(bulletins)
+                }
+            }
+
+        except Exception as e:
+            _logger.error("Erreur get_student_published_bulletins: %s", str(e))
+            return {'status': 'error', 'code': 500, 'message': str(e)}
+
     @http.route('/api/parent/student/<int:student_id>/reports/<string:report_id>/download', auth='none', type='http', methods=['GET', 'OPTIONS'], csrf=False)
     @cors_wrapper
     def download_student_report(self, student_id, report_id, **kwargs):
@@ -4840,15 +5294,12 @@ class SchoolManagementController(http.Controller):
             current_month = today.replace(day=1)
             
             # Présences du mois
-            attendance_records = request.env['op.attendance.line'].sudo().search([
-                ('student_id', '=', student_id),
-                ('attendance_date', '>=', current_month),
-                ('attendance_date', '<=', today)
-            ])
+            attendance_totals = request.env['op.attendance.daily'].sudo().get_totals(
+                [student_id], current_month, today)
             
-            present_count = len(attendance_records.filtered(lambda r: r.present))
-            total_count = len(attendance_records)
-            attendance_rate = (present_count / total_count * 100) if total_count > 0 else 0
+            present_count = attendance_totals['present'] + attendance_totals['late']
+            total_count = attendance_totals['total']
+            attendance_rate = presence_rate(attendance_totals)
             
             # Notes récentes
             recent_results = request.env['op.result.line'].sudo().search([
@@ -4877,21 +5328,18 @@ class SchoolManagementController(http.Controller):
             outstanding_fees = total_fees - paid_fees
             
             # Emploi du temps d'aujourd'hui
-            today_sessions = request.env['op.session'].sudo().search([
-                ('batch_id', 'in', student.course_detail_ids.mapped('batch_id.id')),
-                ('start_datetime', '>=', datetime.combine(today, datetime.min.time())),
-                ('start_datetime', '<', datetime.combine(today + timedelta(days=1), datetime.min.time()))
-            ], order='start_datetime')
+            today_entries = request.env['op.schedule.grid'].sudo().get_day_entries(
+                'batch', student.course_detail_ids.mapped('batch_id.id'), today, 'session')
             
             schedule = []
-            for session in today_sessions:
+            for entry in today_entries:
                 schedule.append({
-                    'id': session.id,
-                    'subject': session.subject_id.name if session.subject_id else 'N/A',
-                    'teacher': session.faculty_id.name if session.faculty_id else 'N/A',
-                    'start_time': session.start_datetime.strftime('%H:%M') if session.start_datetime else '',
-                    'end_time': session.end_datetime.strftime('%H:%M') if session.end_datetime else '',
-                    'classroom': session.classroom_id.name if session.classroom_id else 'N/A'
+                    'id': entry['id'],
+                    'subject': entry['subject']['name'] if entry['subject'] else 'N/A',
+                    'teacher': entry['faculty']['name'] if entry['faculty'] else 'N/A',
+                    'start_time': entry['start_time'],
+                    'end_time': entry['end_time'],
+                    'classroom': entry['classroom']['name'] if entry['classroom'] else 'N/A'
                 })
             
             return {
@@ -5122,8 +5570,9 @@ class SchoolManagementController(http.Controller):
             })
         except Exception as e:
             _logger.error("Erreur lors de la récupération des options du formulaire: %s", str(e))
-                return self.json_response({
-                
+            return self.json_response({
+                'status': 'error',
+                'message': str(e)
             }, status=500)
 
     @http.route('/api/admissions/analytics', auth='none', type='http', csrf=False, methods=['GET', 'OPTIONS'])
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Initialisation du module : données existantes et index dérivés
+
+Les lectures ne construisent jamais ces index : ils le sont ici, par les
+migrations lors d'une mise à jour, puis entretenus par les écritures et
+les tâches planifiées.
+"""
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def dedup_attendance(cr):
+    """Ne garder qu'une présence par (session, étudiant) : la plus récemment marquée
+
+    À exécuter avant la création de la contrainte session_student_uniq, sans
+    quoi Odoo ne peut pas la poser et les upserts ON CONFLICT échouent.
+    """
+    cr.execute("SELECT to_regclass('op_attendance')")
+    if not cr.fetchone()[0]:
+        return
+    cr.execute("""
+        DELETE FROM op_attendance a
+         USING (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id, student_id
+                                          ORDER BY marked_date DESC NULLS LAST, id DESC) AS position
+              FROM op_attendance
+         ) d
+         WHERE d.id = a.id AND d.position > 1
+    """)
+    if cr.rowcount:
+        _logger.info("Présences en double supprimées : %s", cr.rowcount)
+
+
+def pre_init_hook(env):
+    dedup_attendance(env.cr)
+
+
+def post_init_hook(env):
+    # Occupation des salles et enseignants
+    env['op.resource.occupancy']._rebuild_all()
+    # Faits et agrégats de présence, depuis les présences déjà saisies
+    env['op.attendance.fact']._rebuild_all()
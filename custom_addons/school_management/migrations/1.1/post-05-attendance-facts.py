@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""Construire les faits et agrégats de présence depuis tout l'historique
+
+Exécuté avant le gel des bulletins publiés, dont les totaux de présence se
+lisent dans ces agrégats.
+"""
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['op.attendance.fact']._rebuild_all()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""Remplir les colonnes de classe des bulletins existants
+
+Moyenne de classe, rangs, nombre d'évaluations et notes extrêmes étaient des
+champs calculés ; devenus des colonnes stockées, ils valent 0 sur les
+bulletins antérieurs tant qu'ils ne sont pas recalculés.
+"""
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['op.bulletin']._rebuild_class_statistics()
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""Figer les bulletins publiés avant l'introduction des instantanés
+
+Exécuté après le recalcul des statistiques de classe pour que les
+instantanés portent les rangs et moyennes définitifs.
+"""
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute("SELECT id FROM op_bulletin WHERE state = 'published' AND published_snapshot IS NULL")
+    bulletins = env['op.bulletin'].browse([row[0] for row in cr.fetchall()])
+    bulletins._freeze_published_snapshot()
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""Reconstruire l'index d'occupation avec la période de validité des semaines types"""
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['op.resource.occupancy']._rebuild_all()
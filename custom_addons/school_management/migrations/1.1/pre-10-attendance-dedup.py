@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Supprimer les présences en double avant la contrainte unique (session, étudiant)
+
+Seule la présence la plus récemment marquée est gardée. Sans ce nettoyage,
+Odoo ne peut pas poser session_student_uniq et les upserts ON CONFLICT
+(session_id, student_id) échouent.
+"""
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    cr.execute("""
+        DELETE FROM op_attendance a
+         USING (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id, student_id
+                                          ORDER BY marked_date DESC NULLS LAST, id DESC) AS position
+              FROM op_attendance
+         ) d
+         WHERE d.id = a.id AND d.position > 1
+    """)
+    _logger.info("Présences en double supprimées : %s", cr.rowcount)
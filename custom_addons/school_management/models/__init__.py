@@ -8,8 +8,18 @@ from . import op_subject
 from . import op_batch
 from . import op_session  # Réactivé pour le système de sessions et présences
 from . import op_timetable  # Nouveau système d'emploi du temps
+from . import op_timetable_solver  # Solveur automatique d'emplois du temps
+from . import op_resource_occupancy  # Disponibilité des salles et enseignants
+from . import op_schedule_grid  # Grilles hebdomadaires précalculées
+from . import op_calendar_feed  # Flux iCalendar
+from . import op_attendance_fact  # Faits et agrégats de présence
+from . import op_attendance_line
+from . import op_attendance_sync  # Synchronisation hors ligne des tablettes
+from . import op_checkin  # Passages au portail
+from . import op_session_timetable  # Emplois du temps déduits des sessions (vues SQL)
 from . import op_evaluation
 from . import op_bulletin
+from . import op_bulletin_job  # Génération de bulletins en arrière-plan
 from . import op_fees  # Nouveau modèle d'héritage pour les frais
 from . import models
 from . import mock_data
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Tampon d'écriture des passages au portail
+
+Module sans dépendance à l'ORM : les passages sont accumulés en mémoire puis
+écrits par lots, dès que le lot atteint sa taille ou que le plus ancien
+passage attend depuis le délai maximal.
+"""
+
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class CheckinBuffer:
+    """Lot de lignes vidé tous les flush_size éléments ou toutes les flush_interval_ms
+
+    :param writer: fonction appelée avec la liste des lignes à écrire ; en cas
+                   d'erreur les lignes sont remises en tête du tampon
+    """
+
+    def __init__(self, writer, flush_size=50, flush_interval_ms=500, max_pending=20000):
+        self._writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_pending = max_pending
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._first_at = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row):
+        """Ajouter une ligne ; vide le tampon si le lot est plein
+
+        :return: False si le tampon est saturé (écritures en échec)
+        """
+        with self._lock:
+            if len(self._rows) >= self.max_pending:
+                return False
+            self._rows.append(row)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            full = len(self._rows) >= self.flush_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Écrire toutes les lignes en attente en un seul appel au writer
+
+        :return: nombre de lignes écrites
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                self._first_at = None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not rows:
+                return 0
+            try:
+                self._writer(rows)
+            except Exception:
+                _logger.exception("Écriture de %s passage(s) en échec, nouvelle tentative au prochain lot", len(rows))
+                with self._lock:
+                    self._rows[:0] = rows
+                    if self._first_at is None:
+                        self._first_at = time.monotonic()
+                    if self._timer is None:
+                        self._timer = threading.Timer(self.flush_interval, self.flush)
+                        self._timer.daemon = True
+                        self._timer.start()
+                return 0
+            return len(rows)
+
+    def age_ms(self):
+        """Attente du plus ancien passage non écrit (ms)"""
+        first_at = self._first_at
+        return (time.monotonic() - first_at) * 1000 if first_at is not None else 0.0
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+ATTENDANCE_FACT_PRECOMMIT_KEY = 'op.attendance.fact'
+ATTENDANCE_STATES = [
+    ('present', 'Présent'),
+    ('late', 'Retard'),
+    ('absent', 'Absent'),
+    ('excused', 'Excusé'),
+]
+# Couples (étudiant, jour) recalculés par lot lors d'une reconstruction complète
+ATTENDANCE_REBUILD_CHUNK = 5000
+# Colonnes de comptage communes aux deux agrégats
+ROLLUP_COLUMNS = ('total', 'present', 'late', 'absent', 'excused')
+
+
+def empty_totals():
+    return dict.fromkeys(ROLLUP_COLUMNS, 0)
+
+
+def presence_rate(totals):
+    """Taux de présence (%) : présents et retards sur le total"""
+    return (totals['present'] + totals['late']) / totals['total'] * 100 if totals['total'] else 0.0
+
+
+def absence_rate(totals):
+    """Taux d'absence (%) : absences justifiées ou non sur le total"""
+    return (totals['absent'] + totals['excused']) / totals['total'] * 100 if totals['total'] else 0.0
+
+
+class OpAttendanceFact(models.Model):
+    """Présences unifiées : une ligne par étudiant et par séance
+
+    Alimentée depuis les présences de session (op.attendance) et les feuilles
+    d'appel OpenEduCat (op.attendance.line). Quand un étudiant est pointé dans
+    les deux pour une même session, la présence de session l'emporte.
+
+    Les faits sont recalculés par couple (étudiant, jour) avant le commit,
+    puis les agrégats journaliers (étudiant) et mensuels (classe) touchés.
+    """
+    _name = 'op.attendance.fact'
+    _description = 'Présence unifiée'
+
+    source = fields.Selection([
+        ('session', 'Présence de session'),
+        ('sheet', 'Feuille d\'appel'),
+    ], string='Source', required=True)
+    source_id = fields.Integer('Enregistrement source', required=True)
+    student_id = fields.Many2one('op.student', 'Étudiant', required=True, index=True, ondelete='cascade')
+    batch_id = fields.Many2one('op.batch', 'Classe', index=True, ondelete='set null')
+    session_id = fields.Many2one('op.session', 'Session', index=True, ondelete='set null')
+    date = fields.Date('Date', required=True, index=True)
+    state = fields.Selection(ATTENDANCE_STATES, string='État', required=True)
+
+    _sql_constraints = [
+        ('source_uniq', 'unique(source, source_id)', 'Un seul fait par enregistrement source.'),
+    ]
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _mark_dirty(self, keys):
+        """Recalculer les faits de ces couples (student_id, date) avant le commit"""
+        keys = {key for key in keys if key[0] and key[1]}
+        if not keys:
+            return
+        pending = self.env.cr.precommit.data.setdefault(ATTENDANCE_FACT_PRECOMMIT_KEY, set())
+        if not pending:
+            self.env.cr.precommit.add(self._flush_dirty)
+        pending.update(keys)
+
+    @api.model
+    def _mark_attendances_dirty(self, attendances):
+        self._mark_dirty((attendance.student_id.id, attendance.date) for attendance in attendances.sudo())
+
+    @api.model
+    def _mark_lines_dirty(self, lines):
+        self._mark_dirty((line.student_id.id, line.attendance_date) for line in lines.sudo())
+
+    @api.model
+    def _flush_dirty(self):
+        pending = self.env.cr.precommit.data.pop(ATTENDANCE_FACT_PRECOMMIT_KEY, set())
+        if pending:
+            self._refresh(pending)
+
+    @api.model
+    def _line_state(self, line):
+        """État d'une ligne de feuille d'appel (les champs late et excused sont optionnels)"""
+        if not line.present:
+            return 'excused' if 'excused' in line._fields and line.excused else 'absent'
+        return 'late' if 'late' in line._fields and line.late else 'present'
+
+    @api.model
+    def _prepare_facts(self, keys):
+        """Faits des couples (student_id, date), lus dans les deux sources"""
+        student_ids = list({key[0] for key in keys})
+        dates = list({key[1] for key in keys})
+        facts = []
+        session_students = set()
+
+        attendances = self.env['op.attendance'].sudo().search([
+            ('student_id', 'in', student_ids),
+            ('date', 'in', dates),
+        ])
+        for attendance in attendances:
+            if (attendance.student_id.id, attendance.date) not in keys:
+                continue
+            session_students.add((attendance.session_id.id, attendance.student_id.id))
+            facts.append({
+                'source': 'session',
+                'source_id': attendance.id,
+                'student_id': attendance.student_id.id,
+                'batch_id': attendance.session_id.batch_id.id or None,
+                'session_id': attendance.session_id.id or None,
+                'date': attendance.date,
+                'state': attendance.state,
+            })
+
+        lines = self.env['op.attendance.line'].sudo().search([
+            ('student_id', 'in', student_ids),
+            ('attendance_date', 'in', dates),
+        ])
+        for line in lines:
+            if (line.student_id.id, line.attendance_date) not in keys:
+                continue
+            sheet = line.attendance_id
+            session = sheet.session_id
+            if session and (session.id, line.student_id.id) in session_students:
+                continue
+            facts.append({
+                'source': 'sheet',
+                'source_id': line.id,
+                'student_id': line.student_id.id,
+                'batch_id': (session.batch_id or sheet.register_id.batch_id).id or None,
+                'session_id': session.id or None,
+                'date': line.attendance_date,
+                'state': self._line_state(line),
+            })
+        return facts
+
+    @api.model
+    def _refresh(self, keys):
+        """Remplacer les faits de ces couples (student_id, date) puis leurs agrégats"""
+        keys = set(keys)
+        pending = self.env.cr.precommit.data.get(ATTENDANCE_FACT_PRECOMMIT_KEY)
+        if pending:
+            pending.difference_update(keys)
+        if not keys:
+            return
+
+        self.env['op.attendance'].flush_model()
+        facts = self._prepare_facts(keys)
+        cr = self.env.cr
+
+        cr.execute("""
+            DELETE FROM op_attendance_fact WHERE (student_id, date) IN %s
+            RETURNING batch_id, date
+        """, [tuple(keys)])
+        months = {(batch_id, day.replace(day=1)) for batch_id, day in cr.fetchall() if batch_id}
+        if facts:
+            cr.execute("""
+                INSERT INTO op_attendance_fact
+                       (source, source_id, student_id, batch_id, session_id, date, state,
+                        create_uid, create_date, write_uid, write_date)
+                SELECT u.source, u.source_id, u.student_id, u.batch_id, u.session_id, u.date, u.state,
+                       %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC'
+                  FROM unnest(%s::varchar[], %s::int[], %s::int[], %s::int[], %s::int[], %s::date[], %s::varchar[])
+                       AS u(source, source_id, student_id, batch_id, session_id, date, state)
+            """, [
+                self.env.uid, self.env.uid,
+                [fact['source'] for fact in facts],
+                [fact['source_id'] for fact in facts],
+                [fact['student_id'] for fact in facts],
+                [fact['batch_id'] for fact in facts],
+                [fact['session_id'] for fact in facts],
+                [fact['date'] for fact in facts],
+                [fact['state'] for fact in facts],
+            ])
+            months.update((fact['batch_id'], fact['date'].replace(day=1)) for fact in facts if fact['batch_id'])
+
+        self.env['op.attendance.daily']._refresh(keys)
+        self.env['op.attendance.monthly']._refresh(months)
+        self.invalidate_model()
+
+    @api.model
+    def _rebuild_all(self):
+        """Reconstruire tous les faits depuis les deux sources"""
+        self.env['op.attendance'].flush_model()
+        self.env['op.attendance.line'].flush_model()
+        cr = self.env.cr
+        cr.execute("""
+            SELECT student_id, date FROM op_attendance WHERE student_id IS NOT NULL AND date IS NOT NULL
+             UNION
+            SELECT student_id, attendance_date FROM op_attendance_line
+             WHERE student_id IS NOT NULL AND attendance_date IS NOT NULL
+        """)
+        keys = set(cr.fetchall())
+        cr.execute("DELETE FROM op_attendance_fact")
+        cr.execute("DELETE FROM op_attendance_daily")
+        cr.execute("DELETE FROM op_attendance_monthly")
+        keys = sorted(keys)
+        for offset in range(0, len(keys), ATTENDANCE_REBUILD_CHUNK):
+            self._refresh(keys[offset:offset + ATTENDANCE_REBUILD_CHUNK])
+        _logger.info("Faits de présence reconstruits pour %s couples (étudiant, jour)", len(keys))
+
+    @api.model
+    def _cron_rebuild(self):
+        """Filet de sécurité quotidien : rattrape les écritures faites hors ORM"""
+        self._rebuild_all()
+
+    @api.model
+    def _ensure_ready(self):
+        """Appliquer les changements en attente de la transaction avant une lecture
+
+        Les faits sont construits à l'installation et à la mise à jour du
+        module, puis entretenus par les écritures et la tâche planifiée : une
+        lecture ne déclenche jamais de reconstruction complète.
+        """
+        self._flush_dirty()
+
+    # ------------------------------------------------------------------
+    # Interrogation
+    # ------------------------------------------------------------------
+
+    @api.model
+    def get_session_totals(self, session_ids):
+        """Totaux par session, en une requête groupée sur les faits
+
+        :return: {session_id: {total, present, late, absent, excused}}
+        """
+        self._ensure_ready()
+        self.env.cr.execute("""
+            SELECT session_id, state, COUNT(*) FROM op_attendance_fact
+             WHERE session_id = ANY(%s)
+             GROUP BY session_id, state
+        """, [list(session_ids)])
+        totals = {}
+        for session_id, state, count in self.env.cr.fetchall():
+            session_totals = totals.setdefault(session_id, empty_totals())
+            session_totals[state] += count
+            session_totals['total'] += count
+        return totals
+
+
+class OpAttendanceDaily(models.Model):
+    """Agrégat journalier des présences par étudiant"""
+    _name = 'op.attendance.daily'
+    _description = 'Présences journalières par étudiant'
+
+    student_id = fields.Many2one('op.student', 'Étudiant', required=True, index=True, ondelete='cascade')
+    date = fields.Date('Date', required=True, index=True)
+    total = fields.Integer('Séances')
+    present = fields.Integer('Présents')
+    late = fields.Integer('Retards')
+    absent = fields.Integer('Absents')
+    excused = fields.Integer('Excusés')
+
+    _sql_constraints = [
+        ('student_date_uniq', 'unique(student_id, date)', 'Un seul agrégat par étudiant et par jour.'),
+    ]
+
+    @api.model
+    def _refresh(self, keys):
+        """Recalculer les agrégats des couples (student_id, date) depuis les faits"""
+        keys = tuple(keys)
+        if not keys:
+            return
+        self.env.cr.execute("DELETE FROM op_attendance_daily WHERE (student_id, date) IN %s", [keys])
+        self.env.cr.execute("""
+            INSERT INTO op_attendance_daily
+                   (student_id, date, total, present, late, absent, excused,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT student_id, date, COUNT(*),
+                   COUNT(*) FILTER (WHERE state = 'present'),
+                   COUNT(*) FILTER (WHERE state = 'late'),
+                   COUNT(*) FILTER (WHERE state = 'absent'),
+                   COUNT(*) FILTER (WHERE state = 'excused'),
+                   %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC'
+              FROM op_attendance_fact
+             WHERE (student_id, date) IN %s
+             GROUP BY student_id, date
+        """, [self.env.uid, self.env.uid, keys])
+        self.invalidate_model()
+
+    @api.model
+    def get_student_totals(self, student_ids=None, date_from=None, date_to=None):
+        """Totaux par étudiant sur une période
+
+        :param student_ids: étudiants à lire ; None pour toute l'école
+        :return: {student_id: {total, present, late, absent, excused}}
+        """
+        self.env['op.attendance.fact']._ensure_ready()
+        conditions = []
+        params = []
+        if student_ids is not None:
+            conditions.append("student_id = ANY(%s)")
+            params.append(list(student_ids))
+        if date_from:
+            conditions.append("date >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("date <= %s")
+            params.append(date_to)
+        self.env.cr.execute("""
+            SELECT student_id, SUM(total), SUM(present), SUM(late), SUM(absent), SUM(excused)
+              FROM op_attendance_daily
+             {where}
+             GROUP BY student_id
+        """.format(where='WHERE ' + ' AND '.join(conditions) if conditions else ''), params)
+        return {row[0]: dict(zip(ROLLUP_COLUMNS, row[1:])) for row in self.env.cr.fetchall()}
+
+    @api.model
+    def get_totals(self, student_ids=None, date_from=None, date_to=None):
+        """Totaux cumulés de plusieurs étudiants (toute l'école par défaut)"""
+        result = empty_totals()
+        for totals in self.get_student_totals(student_ids, date_from, date_to).values():
+            for column in ROLLUP_COLUMNS:
+                result[column] += totals[column]
+        return result
+
+
+class OpAttendanceMonthly(models.Model):
+    """Agrégat mensuel des présences par classe"""
+    _name = 'op.attendance.monthly'
+    _description = 'Présences mensuelles par classe'
+
+    batch_id = fields.Many2one('op.batch', 'Classe', required=True, index=True, ondelete='cascade')
+    month = fields.Date('Mois', required=True, index=True, help="Premier jour du mois")
+    total = fields.Integer('Séances')
+    present = fields.Integer('Présents')
+    late = fields.Integer('Retards')
+    absent = fields.Integer('Absents')
+    excused = fields.Integer('Excusés')
+
+    _sql_constraints = [
+        ('batch_month_uniq', 'unique(batch_id, month)', 'Un seul agrégat par classe et par mois.'),
+    ]
+
+    @api.model
+    def _refresh(self, keys):
+        """Recalculer les agrégats des couples (batch_id, premier jour du mois) depuis les faits"""
+        keys = tuple(keys)
+        if not keys:
+            return
+        self.env.cr.execute("DELETE FROM op_attendance_monthly WHERE (batch_id, month) IN %s", [keys])
+        self.env.cr.execute("""
+            INSERT INTO op_attendance_monthly
+                   (batch_id, month, total, present, late, absent, excused,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT batch_id, date_trunc('month', date)::date, COUNT(*),
+                   COUNT(*) FILTER (WHERE state = 'present'),
+                   COUNT(*) FILTER (WHERE state = 'late'),
+                   COUNT(*) FILTER (WHERE state = 'absent'),
+                   COUNT(*) FILTER (WHERE state = 'excused'),
+                   %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC'
+              FROM op_attendance_fact
+             WHERE (batch_id, date_trunc('month', date)::date) IN %s
+             GROUP BY batch_id, date_trunc('month', date)::date
+        """, [self.env.uid, self.env.uid, keys])
+        self.invalidate_model()
+
+    @api.model
+    def get_batch_totals(self, batch_ids, date_from=None, date_to=None):
+        """Totaux par classe sur les mois couvrant la période
+
+        :return: {batch_id: {total, present, late, absent, excused}}
+        """
+        self.env['op.attendance.fact']._ensure_ready()
+        conditions = ["batch_id = ANY(%s)"]
+        params = [list(batch_ids)]
+        if date_from:
+            conditions.append("month >= date_trunc('month', %s::date)")
+            params.append(date_from)
+        if date_to:
+            conditions.append("month <= %s")
+            params.append(date_to)
+        self.env.cr.execute("""
+            SELECT batch_id, SUM(total), SUM(present), SUM(late), SUM(absent), SUM(excused)
+              FROM op_attendance_monthly
+             WHERE {conditions}
+             GROUP BY batch_id
+        """.format(conditions=' AND '.join(conditions)), params)
+        return {row[0]: dict(zip(ROLLUP_COLUMNS, row[1:])) for row in self.env.cr.fetchall()}
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+
+# Champs des feuilles d'appel repris dans les faits de présence
+ATTENDANCE_LINE_FACT_FIELDS = ('student_id', 'attendance_id', 'attendance_date', 'present', 'late', 'excused', 'absent')
+
+
+class OpAttendanceLine(models.Model):
+    _inherit = 'op.attendance.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env['op.attendance.fact']._mark_lines_dirty(lines)
+        lines.mapped('attendance_id.session_id')._refresh_frozen_stats()
+        return lines
+
+    def write(self, vals):
+        fact_changed = any(field in vals for field in ATTENDANCE_LINE_FACT_FIELDS)
+        sessions = self.mapped('attendance_id.session_id')
+        if fact_changed:
+            self.env['op.attendance.fact']._mark_lines_dirty(self)
+        result = super().write(vals)
+        if fact_changed:
+            self.env['op.attendance.fact']._mark_lines_dirty(self)
+            (sessions | self.mapped('attendance_id.session_id'))._refresh_frozen_stats()
+        return result
+
+    def unlink(self):
+        self.env['op.attendance.fact']._mark_lines_dirty(self)
+        sessions = self.mapped('attendance_id.session_id')
+        result = super().unlink()
+        sessions._refresh_frozen_stats()
+        return result
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from datetime import datetime, timedelta, timezone
+import logging
+
+from .op_resource_occupancy import parse_hour
+
+_logger = logging.getLogger(__name__)
+
+SYNC_OPERATION_TYPES = ('attendance', 'session_note')
+# Clés d'idempotence conservées (en jours) : au-delà, un rejeu est traité comme une nouvelle saisie
+SYNC_KEY_RETENTION_DAYS = 30
+# Chevauchement du jeton : les transactions validées après la lecture précédente ne sont pas perdues
+SYNC_TOKEN_OVERLAP_SECONDS = 60
+# Premier envoi sans jeton : sessions récentes seulement
+SYNC_INITIAL_DAYS = 7
+
+
+def parse_client_timestamp(value):
+    """Horodatage ISO 8601 du client -> datetime UTC naïf ; None si invalide"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class OpSyncOperation(models.Model):
+    """Journal des opérations synchronisées depuis les tablettes
+
+    Chaque opération envoyée par un client hors ligne porte une clé
+    d'idempotence : un rejeu après une coupure réseau renvoie le résultat
+    enregistré sans rien réappliquer. Les saisies concurrentes sur un même
+    couple (session, étudiant) sont arbitrées par leur horodatage client, la
+    plus récente l'emporte.
+    """
+    _name = 'op.sync.operation'
+    _description = 'Opération de synchronisation hors ligne'
+
+    key = fields.Char('Clé d\'idempotence', required=True, index=True)
+    device_id = fields.Char('Appareil')
+    operation_type = fields.Selection([
+        ('attendance', 'Présence'),
+        ('session_note', 'Notes de session'),
+    ], string='Type', required=True)
+    session_id = fields.Integer('Session')
+    client_timestamp = fields.Datetime('Horodatage client')
+    status = fields.Selection([
+        ('applied', 'Appliquée'),
+        ('stale', 'Ignorée (saisie plus récente sur le serveur)'),
+        ('rejected', 'Rejetée'),
+    ], string='Résultat', required=True)
+    message = fields.Char('Message')
+
+    _sql_constraints = [
+        ('key_uniq', 'unique(key)', 'Une opération est appliquée une seule fois.'),
+    ]
+
+    # ------------------------------------------------------------------
+    # Application d'un lot
+    # ------------------------------------------------------------------
+
+    @api.model
+    def sync(self, operations, sync_token=None, faculty_id=None, device_id=None):
+        """Appliquer un lot d'opérations puis renvoyer les changements du serveur
+
+        :param operations: liste de dicts key, type, session_id, client_ts et
+                           student_id/state/arrival_time (présence) ou notes
+        :param sync_token: jeton renvoyé par la synchronisation précédente
+        :param faculty_id: enseignant dont les sessions sont synchronisées
+        :return: dict results, changes, sync_token
+        """
+        results = self._apply(operations, device_id)
+        since = parse_client_timestamp(sync_token)
+        self.env.cr.execute("SELECT NOW() AT TIME ZONE 'UTC'")
+        server_now = self.env.cr.fetchone()[0]
+        return {
+            'results': results,
+            'changes': self._get_changes(since, faculty_id, operations),
+            'sync_token': server_now.isoformat(),
+        }
+
+    @api.model
+    def _apply(self, operations, device_id=None):
+        """Appliquer les opérations nouvelles en deux écritures groupées
+
+        :return: liste de dicts key, status et message, dans l'ordre reçu
+        """
+        keys = [operation.get('key') for operation in operations if operation.get('key')]
+        done = {}
+        if keys:
+            self.env.cr.execute("""
+                SELECT key, status, message FROM op_sync_operation WHERE key = ANY(%s)
+            """, [keys])
+            done = {key: (status, message) for key, status, message in self.env.cr.fetchall()}
+
+        new_operations = [operation for operation in operations
+                          if operation.get('key') and operation['key'] not in done]
+        sessions, enrolments, departures = self._prefetch(new_operations)
+        outcomes = {}
+        attendance_rows = {}
+        note_rows = {}
+        pending = []
+        for operation in new_operations:
+            key = operation['key']
+            if key in outcomes:
+                continue
+            row, error = self._validate(operation, sessions, enrolments, departures)
+            if error:
+                outcomes[key] = ('rejected', error)
+                continue
+            pending.append((key, operation, row))
+            if operation['type'] == 'attendance':
+                group, target = (row['session_id'], row['student_id']), attendance_rows
+            else:
+                group, target = row['session_id'], note_rows
+            # Dans un même lot, la saisie la plus récente l'emporte
+            if group not in target or target[group]['marked_date'] < row['marked_date']:
+                target[group] = row
+
+        written = set(self.env['op.attendance'].sudo()._upsert_attendance(
+            list(attendance_rows.values()), last_writer_wins=True))
+        written_notes = self._apply_notes(list(note_rows.values()))
+        for key, operation, row in pending:
+            if operation['type'] == 'attendance':
+                group = (row['session_id'], row['student_id'])
+                applied = group in written and attendance_rows[group] is row
+            else:
+                applied = row['session_id'] in written_notes and note_rows[row['session_id']] is row
+            outcomes[key] = ('applied', None) if applied else ('stale', None)
+
+        self._log(operations, outcomes, device_id)
+        results = []
+        for operation in operations:
+            key = operation.get('key')
+            if not key:
+                results.append({'key': None, 'status': 'rejected', 'message': 'Clé d\'idempotence manquante'})
+                continue
+            status, message = done.get(key) or outcomes[key]
+            results.append({'key': key, 'status': status, 'message': message, 'duplicate': key in done})
+        return results
+
+    @api.model
+    def _prefetch(self, operations):
+        """Sessions, inscriptions et heures de départ utiles à la validation, en trois lectures
+
+        :return: ({session_id: op.session}, {(batch_id, student_id)},
+                  {(session_id, student_id): departure_time})
+        """
+        session_ids = {to_int(operation.get('session_id')) for operation in operations} - {None}
+        sessions = {session.id: session for session in self.env['op.session'].sudo().browse(list(session_ids)).exists()}
+        student_ids = {to_int(operation.get('student_id')) for operation in operations
+                       if operation.get('type') == 'attendance'} - {None}
+        batch_ids = {session.batch_id.id for session in sessions.values() if session.batch_id}
+        enrolments = set()
+        if student_ids and batch_ids:
+            for enrolment in self.env['op.student.course'].sudo().search_read([
+                ('batch_id', 'in', list(batch_ids)),
+                ('student_id', 'in', list(student_ids)),
+            ], ['batch_id', 'student_id']):
+                enrolments.add((enrolment['batch_id'][0], enrolment['student_id'][0]))
+        departures = {}
+        if student_ids and sessions:
+            for attendance in self.env['op.attendance'].sudo().search_read([
+                ('session_id', 'in', list(sessions)),
+                ('student_id', 'in', list(student_ids)),
+                ('departure_time', '>', 0),
+            ], ['session_id', 'student_id', 'departure_time']):
+                departures[(attendance['session_id'][0], attendance['student_id'][0])] = attendance['departure_time']
+        return sessions, enrolments, departures
+
+    @api.model
+    def _validate(self, operation, sessions, enrolments, departures):
+        """Normaliser une opération ; renvoie (ligne, erreur)"""
+        if operation.get('type') not in SYNC_OPERATION_TYPES:
+            return None, 'Type d\'opération invalide'
+        marked_date = parse_client_timestamp(operation.get('client_ts'))
+        if not marked_date:
+            return None, 'client_ts invalide (ISO 8601 attendu)'
+        # Une horloge de tablette en avance ne doit pas gagner contre toutes les saisies futures
+        marked_date = min(marked_date, fields.Datetime.now())
+        session = sessions.get(to_int(operation.get('session_id')))
+        if not session:
+            return None, 'Session non trouvée'
+
+        if operation['type'] == 'session_note':
+            return {'session_id': session.id, 'notes': operation.get('notes') or '', 'marked_date': marked_date}, None
+
+        student_id = to_int(operation.get('student_id'))
+        if not student_id:
+            return None, 'student_id invalide'
+        states = dict(self.env['op.attendance']._fields['state'].selection)
+        state = operation.get('state') or 'present'
+        if state not in states:
+            return None, 'État invalide (%s)' % ', '.join(states)
+        arrival_time = parse_hour(operation.get('arrival_time'))
+        if operation.get('arrival_time') not in (None, '') and arrival_time is None:
+            return None, 'arrival_time invalide'
+        if session.batch_id and (session.batch_id.id, student_id) not in enrolments:
+            return None, 'Étudiant hors de la classe de la session'
+        departure_time = departures.get((session.id, student_id))
+        if arrival_time and departure_time and arrival_time >= departure_time:
+            return None, 'arrival_time postérieure à l\'heure de départ déjà saisie'
+        return {
+            'session_id': session.id,
+            'student_id': student_id,
+            'state': state,
+            'arrival_time': arrival_time,
+            'marked_date': marked_date,
+        }, None
+
+    @api.model
+    def _apply_notes(self, rows):
+        """Notes de session, dernière saisie gagnante ; renvoie les sessions écrites"""
+        if not rows:
+            return set()
+        self.env['op.session'].flush_model(['notes', 'notes_modified_at'])
+        self.env.cr.execute("""
+            UPDATE op_session s
+               SET notes = u.notes, notes_modified_at = u.marked_date,
+                   write_uid = %s, write_date = NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::text[], %s::timestamp[]) AS u(session_id, notes, marked_date)
+             WHERE s.id = u.session_id
+               AND (s.notes_modified_at IS NULL OR s.notes_modified_at < u.marked_date)
+            RETURNING s.id
+        """, [
+            self.env.uid,
+            [row['session_id'] for row in rows],
+            [row['notes'] for row in rows],
+            [row['marked_date'] for row in rows],
+        ])
+        written = {row[0] for row in self.env.cr.fetchall()}
+        self.env['op.session'].browse(list(written)).invalidate_recordset(['notes', 'notes_modified_at'])
+        return written
+
+    @api.model
+    def _log(self, operations, outcomes, device_id=None):
+        """Enregistrer le résultat des opérations nouvelles sous leur clé"""
+        rows = []
+        logged = set()
+        for operation in operations:
+            key = operation.get('key')
+            if key not in outcomes or key in logged:
+                continue
+            logged.add(key)
+            status, message = outcomes[key]
+            operation_type = operation.get('type')
+            rows.append((
+                key,
+                operation_type if operation_type in SYNC_OPERATION_TYPES else 'attendance',
+                to_int(operation.get('session_id')),
+                parse_client_timestamp(operation.get('client_ts')),
+                status,
+                message,
+            ))
+        if not rows:
+            return
+        self.env.cr.execute("""
+            INSERT INTO op_sync_operation
+                   (key, device_id, operation_type, session_id, client_timestamp, status, message,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT u.key, %s, u.operation_type, u.session_id, u.client_timestamp, u.status, u.message,
+                   %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::varchar[], %s::varchar[], %s::int[], %s::timestamp[], %s::varchar[], %s::varchar[])
+                   AS u(key, operation_type, session_id, client_timestamp, status, message)
+            ON CONFLICT (key) DO NOTHING
+        """, [
+            device_id, self.env.uid, self.env.uid,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            [row[3] for row in rows],
+            [row[4] for row in rows],
+            [row[5] for row in rows],
+        ])
+
+    # ------------------------------------------------------------------
+    # Changements côté serveur
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_changes(self, since, faculty_id=None, operations=None):
+        """Présences et notes modifiées depuis le jeton, pour les sessions du client
+
+        Le périmètre est celui de l'enseignant, ou à défaut celui des sessions
+        présentes dans le lot.
+        """
+        session_ids = list({to_int(operation.get('session_id')) for operation in operations or []} - {None})
+        if not faculty_id and not session_ids:
+            return {'attendance': [], 'sessions': []}
+        self.env['op.attendance'].flush_model()
+        self.env['op.session'].flush_model(['notes', 'notes_modified_at', 'state', 'faculty_id'])
+
+        conditions = []
+        params = []
+        if faculty_id:
+            conditions.append("s.faculty_id = %s")
+            params.append(faculty_id)
+        else:
+            conditions.append("s.id = ANY(%s)")
+            params.append(session_ids)
+        if since:
+            changed_since = since - timedelta(seconds=SYNC_TOKEN_OVERLAP_SECONDS)
+        else:
+            conditions.append("s.date >= %s")
+            params.append(fields.Date.today() - timedelta(days=SYNC_INITIAL_DAYS))
+            changed_since = datetime.min
+        where = ' AND '.join(conditions)
+
+        self.env.cr.execute("""
+            SELECT a.session_id, a.student_id, a.state, a.arrival_time, a.marked_date
+              FROM op_attendance a
+              JOIN op_session s ON s.id = a.session_id
+             WHERE {where} AND a.write_date > %s
+             ORDER BY a.session_id, a.student_id
+        """.format(where=where), params + [changed_since])
+        attendance = [{
+            'session_id': session_id,
+            'student_id': student_id,
+            'state': state,
+            'arrival_time': arrival_time,
+            'marked_at': marked_date.isoformat() if marked_date else None,
+        } for session_id, student_id, state, arrival_time, marked_date in self.env.cr.fetchall()]
+
+        self.env.cr.execute("""
+            SELECT s.id, s.state, s.notes, s.notes_modified_at
+              FROM op_session s
+             WHERE {where} AND s.write_date > %s
+             ORDER BY s.id
+        """.format(where=where), params + [changed_since])
+        sessions = [{
+            'id': session_id,
+            'state': state,
+            'notes': notes or '',
+            'notes_modified_at': notes_modified_at.isoformat() if notes_modified_at else None,
+        } for session_id, state, notes, notes_modified_at in self.env.cr.fetchall()]
+        return {'attendance': attendance, 'sessions': sessions}
+
+    @api.model
+    def _cron_purge(self):
+        """Oublier les clés d'idempotence anciennes"""
+        limit = fields.Datetime.now() - timedelta(days=SYNC_KEY_RETENTION_DAYS)
+        self.env.cr.execute("DELETE FROM op_sync_operation WHERE create_date < %s", [limit])
+        _logger.info("%s opération(s) de synchronisation purgée(s)", self.env.cr.rowcount)
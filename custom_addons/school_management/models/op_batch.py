@@ -4,6 +4,8 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
+from .op_attendance_fact import absence_rate
+
 class OpBatchExtended(models.Model):
     """
     Extension du modèle op.batch pour gérer les promotions/classes
@@ -168,10 +170,10 @@ class OpBatchExtended(models.Model):
     
     @api.depends('course_id')
     def _compute_absence_rate(self):
-        """Calcule le taux d'absentéisme"""
+        """Taux d'absentéisme de chaque classe, lu dans les agrégats mensuels de présence"""
+        totals = self.env['op.attendance.monthly'].sudo().get_batch_totals(self.ids)
         for batch in self:
-            # TODO: Implémenter le calcul réel basé sur les présences
-            batch.absence_rate = 0.0
+            batch.absence_rate = absence_rate(totals[batch.id]) if batch.id in totals else 0.0
     
     # ==================== CONTRAINTES ====================
     
@@ -225,7 +227,34 @@ class OpBatchExtended(models.Model):
             education_level = self.course_id.education_level
             if education_level in level_to_cycle:
                 self.school_cycle = level_to_cycle[education_level]
-    
+
+    def _get_solver_courses(self):
+        """Cours hebdomadaires suivis par chaque classe, pour le solveur d'emploi du temps
+
+        Un op.course correspond ici à une matière pour un niveau : la classe suit
+        son cours et tous les cours actifs du même niveau (et de la même filière).
+
+        :return: dict {batch_id: op.course}
+        """
+        courses_by_level = {}
+        result = {}
+        for batch in self:
+            course = batch.course_id
+            if not course or not course.class_level:
+                result[batch.id] = course
+                continue
+            level_key = (course.education_level, course.class_level, course.track)
+            if level_key not in courses_by_level:
+                courses_by_level[level_key] = self.env['op.course'].search([
+                    ('education_level', '=', course.education_level),
+                    ('class_level', '=', course.class_level),
+                    ('track', '=', course.track),
+                    ('state', 'not in', ('cancelled', 'done')),
+                    ('weekly_hours', '>', 0),
+                ])
+            result[batch.id] = course | courses_by_level[level_key]
+        return result
+
     # ==================== ACTIONS ====================
     
     def action_view_students(self):
@@ -3,9 +3,66 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 from datetime import datetime, date
+import base64
+import hashlib
 import json
+import logging
 import random
 
+_logger = logging.getLogger(__name__)
+
+# États pris en compte pour le classement et les moyennes de classe
+RANKED_STATES = ('calculated', 'validated', 'published')
+
+# Champs dont la modification impose un reclassement de la classe
+RANKING_FIELDS = {'state', 'batch_id', 'trimestre_id', 'moyenne_generale'}
+
+RANKING_PRECOMMIT_KEY = 'op.bulletin.ranking'
+SUBJECT_STATS_PRECOMMIT_KEY = 'op.bulletin.subject.stats'
+NOTES_PRECOMMIT_KEY = 'op.bulletin.notes'
+
+# États des bulletins dont les lignes suivent les notes des évaluations
+NOTES_TRACKED_STATES = ('draft', 'calculated')
+
+# Version de la mise en page PDF : à incrémenter à chaque modification du rendu
+PDF_TEMPLATE_VERSION = '3'
+
+# Champs du cache PDF, dont l'écriture ne doit pas invalider le cache lui-même
+PDF_CACHE_FIELDS = {'pdf_cache', 'pdf_cache_key'}
+
+# Contenu figé dans l'instantané publié : non modifiable tant que le bulletin est publié
+PUBLISHED_LOCKED_FIELDS = {
+    'numero_bulletin', 'student_id', 'course_id', 'batch_id', 'trimestre_id',
+    'date_creation', 'date_edition', 'moyenne_generale', 'appreciation_generale',
+    'decision_conseil', 'absence_non_justifiees', 'absence_justifiees', 'retards', 'note_lines',
+}
+# Champs des lignes repris dans l'instantané publié
+LINE_LOCKED_FIELDS = {
+    'bulletin_id', 'subject_id', 'note_controle', 'note_composition', 'note_devoir', 'note_oral',
+    'note_tp', 'moyenne_matiere', 'coefficient', 'appreciation', 'nombre_evaluations',
+    'note_mini', 'note_maxi',
+}
+
+# Durée de vie d'un instantané de statistiques (minutes), purgé ensuite par la tâche planifiée
+STATS_SNAPSHOT_TTL_MINUTES = 10
+
+# Mode de traitement en masse : pas de suivi par champ ni de message par bulletin
+# États de départ autorisés pour chaque action en masse
+BULK_ACTION_STATES = {
+    'calculate': ('draft', 'calculated'),
+    'validate': ('calculated',),
+    'publish': ('validated',),
+    'archive': ('draft', 'calculated', 'validated', 'published'),
+}
+
+BULK_MODE_CONTEXT = {
+    'bulletin_bulk_mode': True,
+    'tracking_disable': True,
+    'mail_notrack': True,
+    'mail_create_nolog': True,
+    'mail_create_nosubscribe': True,
+}
+
 class OpTrimestre(models.Model):
     _name = 'op.trimestre'
     _description = 'Trimestre Scolaire'
@@ -38,7 +95,7 @@ class OpBulletin(models.Model):
 
     # Informations générales
     numero_bulletin = fields.Char('Numéro de Bulletin', required=True, copy=False, readonly=True, default='Nouveau')
-    student_id = fields.Many2one('op.student', string='Étudiant', required=True, tracking=True)
+    student_id = fields.Many2one('op.student', string='Étudiant', required=True, tracking=True, index=True)
     course_id = fields.Many2one('op.course', string='Cours', required=True, tracking=True)
     batch_id = fields.Many2one('op.batch', string='Classe', required=True, tracking=True)
     trimestre_id = fields.Many2one('op.trimestre', string='Trimestre', required=True, tracking=True)
@@ -60,11 +117,12 @@ class OpBulletin(models.Model):
     # Notes et moyennes
     note_lines = fields.One2many('op.bulletin.line', 'bulletin_id', string='Notes par Matière')
     moyenne_generale = fields.Float('Moyenne Générale', compute='_compute_moyennes', store=True, digits=(5, 2))
-    moyenne_generale_classe = fields.Float('Moyenne de la Classe', compute='_compute_moyenne_classe', store=True, digits=(5, 2))
+    # Moyenne de classe et classement : maintenus par _refresh_class_ranking
+    moyenne_generale_classe = fields.Float('Moyenne de la Classe', readonly=True, copy=False, digits=(5, 2))
     
     # Classement
-    rang_classe = fields.Integer('Rang dans la Classe', compute='_compute_rang', store=True)
-    total_eleves_classe = fields.Integer('Total Élèves Classe', compute='_compute_rang', store=True)
+    rang_classe = fields.Integer('Rang dans la Classe', readonly=True, copy=False)
+    total_eleves_classe = fields.Integer('Total Élèves Classe', readonly=True, copy=False)
     
     # Appréciations
     appreciation_generale = fields.Text('Appréciation Générale', tracking=True)
@@ -96,12 +154,133 @@ class OpBulletin(models.Model):
     created_by = fields.Many2one('res.users', string='Créé par', default=lambda self: self.env.user)
     validated_by = fields.Many2one('res.users', string='Validé par')
     published_by = fields.Many2one('res.users', string='Publié par')
+
+    # Cache du PDF rendu, stocké en ir.attachment et indexé par _get_pdf_cache_key
+    pdf_cache = fields.Binary('PDF en Cache', attachment=True, copy=False, readonly=True)
+    pdf_cache_key = fields.Char('Clé du PDF en Cache', copy=False, readonly=True)
+
+    # Bulletin figé à la publication : {'api': ..., 'pdf': ...}
+    published_snapshot = fields.Json('Instantané Publié', copy=False, readonly=True)
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        to_number = [vals for vals in vals_list if vals.get('numero_bulletin', 'Nouveau') == 'Nouveau']
+        if len(to_number) > 1:
+            # Réserver tous les numéros en un seul appel à la séquence
+            for vals, numero in zip(to_number, self._reserve_bulletin_numbers(len(to_number))):
+                vals['numero_bulletin'] = numero
+        else:
+            for vals in to_number:
+                vals['numero_bulletin'] = self.env['ir.sequence'].next_by_code('op.bulletin') or 'Nouveau'
+        bulletins = super(OpBulletin, self).create(vals_list)
+        bulletins._mark_class_ranking_dirty()
+        return bulletins
+
     @api.model
-    def create(self, vals):
-        if vals.get('numero_bulletin', 'Nouveau') == 'Nouveau':
-            vals['numero_bulletin'] = self.env['ir.sequence'].next_by_code('op.bulletin') or 'Nouveau'
-        return super(OpBulletin, self).create(vals)
+    def _reserve_bulletin_numbers(self, count):
+        """Réserver un bloc de numéros de bulletin consécutifs
+
+        Une séquence standard est avancée par un seul nextval() sur
+        generate_series ; une séquence sans trou est verrouillée une seule fois
+        et avancée de tout le bloc. Les séquences par plage de dates passent
+        par next_by_code() numéro par numéro.
+        """
+        sequence = self.env['ir.sequence'].sudo().search([
+            ('code', '=', 'op.bulletin'),
+            ('company_id', 'in', [self.env.company.id, False])
+        ], order='company_id', limit=1)
+        if not sequence or sequence.use_date_range:
+            return [self.env['ir.sequence'].next_by_code('op.bulletin') or 'Nouveau' for _i in range(count)]
+
+        if sequence.implementation == 'standard':
+            self.env.cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                ('ir_sequence_%03d' % sequence.id, count)
+            )
+            numbers = [row[0] for row in self.env.cr.fetchall()]
+        else:
+            increment = sequence.number_increment or 1
+            self.env.cr.execute(
+                "UPDATE ir_sequence SET number_next = number_next + %s WHERE id = %s RETURNING number_next",
+                (increment * count, sequence.id)
+            )
+            first = self.env.cr.fetchone()[0] - increment * count
+            numbers = [first + increment * i for i in range(count)]
+            sequence.invalidate_recordset(['number_next'])
+
+        prefix, suffix = sequence._get_prefix_suffix()
+        return ['%s%s%s' % (prefix, '%%0%sd' % sequence.padding % number, suffix) for number in numbers]
+
+    # ================= MODE EN MASSE =================
+
+    def _with_bulk_mode(self):
+        """Ces bulletins en mode masse : ni suivi des champs, ni message par bulletin"""
+        return self.with_context(**BULK_MODE_CONTEXT)
+
+    def _post_action_message(self, body, summary):
+        """Journaliser une action sur les bulletins
+
+        Hors mode masse, chaque bulletin reçoit son message. En mode masse, un
+        seul message récapitulatif est posté par classe et par opération.
+
+        :param body: message individuel
+        :param summary: libellé de l'opération pour le récapitulatif
+        """
+        if not self:
+            return
+        if not self.env.context.get('bulletin_bulk_mode'):
+            for bulletin in self:
+                bulletin.message_post(body=body)
+            return
+        if not self.env.context.get('bulletin_bulk_summary', True):
+            return
+
+        groups = {}
+        for bulletin in self:
+            key = (bulletin.batch_id, bulletin.trimestre_id)
+            groups[key] = groups.get(key, self.browse()) | bulletin
+        for (batch, trimestre), bulletins in groups.items():
+            numbers = sorted(bulletins.mapped('numero_bulletin'))
+            message = _('%s : %d bulletins (%s) - %s à %s') % (
+                summary, len(bulletins), trimestre.name, numbers[0], numbers[-1]
+            )
+            if hasattr(batch, 'message_post'):
+                batch.message_post(body=message)
+            else:
+                _logger.info("Classe %s - %s", batch.name, message)
+
+    def write(self, vals):
+        if vals.get('state', 'published') == 'published' and PUBLISHED_LOCKED_FIELDS.intersection(vals):
+            self._check_not_published()
+        if not PDF_CACHE_FIELDS.issuperset(vals) and any(self.mapped('pdf_cache_key')):
+            vals = dict(vals, pdf_cache=False, pdf_cache_key=False)
+        ranking_changed = bool(RANKING_FIELDS.intersection(vals))
+        if ranking_changed:
+            # Les anciennes classes doivent aussi être reclassées
+            self._mark_class_ranking_dirty()
+            self.mapped('note_lines')._mark_subject_stats_dirty()
+        res = super(OpBulletin, self).write(vals)
+        if ranking_changed:
+            self._mark_class_ranking_dirty()
+            self.mapped('note_lines')._mark_subject_stats_dirty()
+        return res
+
+    def unlink(self):
+        self._mark_class_ranking_dirty()
+        self.mapped('note_lines')._mark_subject_stats_dirty()
+        return super(OpBulletin, self).unlink()
+
+    def _check_not_published(self):
+        """Refuser la modification du contenu d'un bulletin publié
+
+        L'instantané publié est servi tel quel par l'API et le PDF : le
+        bulletin doit être dépublié, modifié puis publié à nouveau.
+        """
+        published = self.filtered(lambda bulletin: bulletin.state == 'published')
+        if published:
+            raise ValidationError(_(
+                'Le bulletin %s est publié : le dépublier avant de le modifier, puis le publier à nouveau.'
+            ) % ', '.join(published.mapped('numero_bulletin')))
     
     @api.depends('note_lines.moyenne_matiere')
     def _compute_moyennes(self):
@@ -116,192 +295,463 @@ class OpBulletin(models.Model):
             else:
                 record.moyenne_generale = 0.0
     
-    @api.depends('batch_id', 'trimestre_id')
-    def _compute_moyenne_classe(self):
-        for record in self:
-            if record.batch_id and record.trimestre_id:
-                bulletins_classe = self.search([
-                    ('batch_id', '=', record.batch_id.id),
-                    ('trimestre_id', '=', record.trimestre_id.id),
-                    ('state', 'in', ['calculated', 'validated', 'published'])
-                ])
-                if bulletins_classe:
-                    moyenne_classe = sum(b.moyenne_generale for b in bulletins_classe) / len(bulletins_classe)
-                    record.moyenne_generale_classe = moyenne_classe
-                else:
-                    record.moyenne_generale_classe = 0.0
-            else:
-                record.moyenne_generale_classe = 0.0
-    
-    @api.depends('moyenne_generale', 'batch_id', 'trimestre_id')
-    def _compute_rang(self):
-        for record in self:
-            if record.batch_id and record.trimestre_id and record.moyenne_generale > 0:
-                bulletins_classe = self.search([
-                    ('batch_id', '=', record.batch_id.id),
-                    ('trimestre_id', '=', record.trimestre_id.id),
-                    ('state', 'in', ['calculated', 'validated', 'published'])
-                ], order='moyenne_generale desc')
-                
-                record.total_eleves_classe = len(bulletins_classe)
-                
-                for index, bulletin in enumerate(bulletins_classe):
-                    if bulletin.id == record.id:
-                        record.rang_classe = index + 1
-                        break
-                else:
-                    record.rang_classe = 0
-            else:
-                record.rang_classe = 0
-                record.total_eleves_classe = 0
-    
+    # ================= CLASSEMENT =================
+
+    def _get_ranking_groups(self):
+        """Couples (batch_id, trimestre_id) concernés par ces bulletins"""
+        return {
+            (bulletin.batch_id.id, bulletin.trimestre_id.id)
+            for bulletin in self
+            if bulletin.batch_id and bulletin.trimestre_id
+        }
+
+    def _mark_class_ranking_dirty(self):
+        """Planifier le reclassement des classes concernées
+
+        Les classes sont accumulées pendant la transaction et reclassées une
+        seule fois avant le commit, quel que soit le nombre de notes modifiées.
+        """
+        groups = self._get_ranking_groups()
+        if not groups:
+            return
+        pending = self.env.cr.precommit.data.setdefault(RANKING_PRECOMMIT_KEY, set())
+        if not pending:
+            self.env.cr.precommit.add(self._flush_class_ranking)
+        pending.update(groups)
+
+    @api.model
+    def _flush_class_ranking(self):
+        """Reclasser les classes marquées pendant la transaction"""
+        pending = self.env.cr.precommit.data.pop(RANKING_PRECOMMIT_KEY, set())
+        if pending:
+            self._refresh_class_ranking(pending)
+
+    @api.model
+    def _refresh_class_ranking(self, groups):
+        """Recalculer rang, effectif et moyenne de classe en une passe SQL
+
+        Le rang utilise RANK() : les ex aequo partagent le même rang et le rang
+        suivant est sauté (1, 2, 2, 4). Seuls les bulletins calculés, validés ou
+        publiés avec une moyenne non nulle sont classés.
+
+        :param groups: itérable de couples (batch_id, trimestre_id)
+        """
+        groups = tuple(set(groups))
+        if not groups:
+            return
+
+        pending = self.env.cr.precommit.data.get(RANKING_PRECOMMIT_KEY)
+        if pending:
+            pending.difference_update(groups)
+
+        self.flush_model([
+            'batch_id', 'trimestre_id', 'state', 'moyenne_generale',
+            'rang_classe', 'total_eleves_classe', 'moyenne_generale_classe', 'pdf_cache_key',
+        ])
+        # Seuls les bulletins dont les valeurs changent sont écrits ; leur PDF
+        # en cache imprime le rang et l'effectif, il est abandonné
+        self.env.cr.execute("""
+            WITH ranked AS (
+                SELECT id,
+                       RANK() OVER w AS rang,
+                       COUNT(*) OVER (PARTITION BY batch_id, trimestre_id) AS total,
+                       AVG(moyenne_generale) OVER (PARTITION BY batch_id, trimestre_id) AS moyenne_classe
+                  FROM op_bulletin
+                 WHERE state IN %(states)s
+                   AND (batch_id, trimestre_id) IN %(groups)s
+                WINDOW w AS (PARTITION BY batch_id, trimestre_id ORDER BY moyenne_generale DESC)
+            ),
+            class_avg AS (
+                SELECT DISTINCT b.batch_id, b.trimestre_id, r.moyenne_classe
+                  FROM ranked r
+                  JOIN op_bulletin b ON b.id = r.id
+            ),
+            computed AS (
+                SELECT g.id,
+                       CASE WHEN g.moyenne_generale > 0 THEN COALESCE(r.rang, 0) ELSE 0 END AS rang,
+                       CASE WHEN g.moyenne_generale > 0 THEN COALESCE(r.total, 0) ELSE 0 END AS total,
+                       ROUND(COALESCE(a.moyenne_classe, 0)::numeric, 2) AS moyenne_classe
+                  FROM op_bulletin g
+             LEFT JOIN ranked r ON r.id = g.id
+             LEFT JOIN class_avg a ON a.batch_id = g.batch_id AND a.trimestre_id = g.trimestre_id
+                 WHERE (g.batch_id, g.trimestre_id) IN %(groups)s
+            )
+            UPDATE op_bulletin b
+               SET rang_classe = c.rang,
+                   total_eleves_classe = c.total,
+                   moyenne_generale_classe = c.moyenne_classe,
+                   pdf_cache_key = NULL
+              FROM computed c
+             WHERE c.id = b.id
+               AND (b.rang_classe, b.total_eleves_classe, b.moyenne_generale_classe)
+                   IS DISTINCT FROM (c.rang, c.total, c.moyenne_classe)
+        """, {'states': RANKED_STATES, 'groups': groups})
+        self.invalidate_model(['rang_classe', 'total_eleves_classe', 'moyenne_generale_classe', 'pdf_cache_key'])
+
+        # Les statistiques de ces classes ne sont plus à jour
+        self.env['op.bulletin.stats.snapshot']._invalidate(groups)
+
+    @api.model
+    def _rebuild_class_statistics(self):
+        """Recalculer toutes les valeurs de classe stockées des bulletins existants
+
+        Classement et moyenne de classe, statistiques par matière, puis nombre
+        d'évaluations et notes extrêmes des lignes, classe par classe. Utilisé
+        après la migration de ces champs calculés vers des colonnes stockées.
+        """
+        self.flush_model()
+        self.env['op.bulletin.line'].flush_model()
+        cr = self.env.cr
+        cr.execute("""
+            SELECT DISTINCT batch_id, trimestre_id FROM op_bulletin
+             WHERE batch_id IS NOT NULL AND trimestre_id IS NOT NULL
+        """)
+        groups = cr.fetchall()
+        self._refresh_class_ranking(groups)
+
+        Line = self.env['op.bulletin.line']
+        subject_groups = set()
+        for batch_id, trimestre_id in groups:
+            lines = Line.search([
+                ('bulletin_id.batch_id', '=', batch_id),
+                ('bulletin_id.trimestre_id', '=', trimestre_id),
+            ])
+            if not lines:
+                continue
+            subject_groups.update(lines._get_subject_stats_groups())
+            _evaluated, notes_by_key = self._load_class_notes(
+                self.env['op.batch'].browse(batch_id),
+                self.env['op.trimestre'].browse(trimestre_id),
+                lines.mapped('bulletin_id.student_id').ids,
+                subject_ids=lines.mapped('subject_id').ids,
+            )
+            counts = []
+            for line in lines:
+                notes = [note for note, _type, _coefficient in
+                         notes_by_key.get((line.bulletin_id.student_id.id, line.subject_id.id), [])]
+                counts.append((line.id, len(notes), min(notes) if notes else 0.0, max(notes) if notes else 0.0))
+            cr.execute("""
+                UPDATE op_bulletin_line l
+                   SET nombre_evaluations = u.nombre, note_mini = u.mini, note_maxi = u.maxi
+                  FROM unnest(%s::int[], %s::int[], %s::float8[], %s::float8[]) AS u(id, nombre, mini, maxi)
+                 WHERE l.id = u.id
+            """, [[row[0] for row in counts], [row[1] for row in counts],
+                  [row[2] for row in counts], [row[3] for row in counts]])
+        Line.invalidate_model(['nombre_evaluations', 'note_mini', 'note_maxi'])
+
+        self.env['op.bulletin.subject.stats']._refresh(subject_groups)
+        _logger.info("Statistiques de classe recalculées pour %s classe(s)-trimestre(s)", len(groups))
+
     @api.depends('student_id', 'trimestre_id')
     def _compute_presence(self):
+        """Totaux de présence de tous les bulletins en une requête groupée par trimestre"""
+        totals = self._read_presence_totals()
+        for record in self:
+            total_sessions, absences, retards = totals.get(
+                (record.student_id.id, record.trimestre_id.id), (0, 0, 0)
+            )
+            record.total_jours_cours = total_sessions
+            record.total_absences = absences
+            record.total_retards = retards
+            record.taux_presence = ((total_sessions - absences) / total_sessions * 100) if total_sessions > 0 else 0
+
+    def _read_presence_totals(self):
+        """Compter les présences par (étudiant, trimestre) pour tout le recordset
+
+        Lues dans l'agrégat journalier des présences : une requête par trimestre.
+
+        :return: {(student_id, trimestre_id): (total, absences, retards)}
+        """
+        students_by_trimestre = {}
         for record in self:
             if record.student_id and record.trimestre_id:
-                domain = [
-                    ('student_id', '=', record.student_id.id),
-                    ('attendance_date', '>=', record.trimestre_id.date_debut),
-                    ('attendance_date', '<=', record.trimestre_id.date_fin)
-                ]
-                
-                attendances = self.env['op.attendance.line'].search(domain)
-                total_sessions = len(attendances)
-                absences = len(attendances.filtered(lambda a: not a.present))
-                retards = len(attendances.filtered(lambda a: a.present and getattr(a, 'late', False)))
-                
-                record.total_jours_cours = total_sessions
-                record.total_absences = absences
-                record.total_retards = retards
-                record.taux_presence = ((total_sessions - absences) / total_sessions * 100) if total_sessions > 0 else 0
-            else:
-                record.total_jours_cours = 0
-                record.total_absences = 0
-                record.total_retards = 0
-                record.taux_presence = 0
+                students_by_trimestre.setdefault(record.trimestre_id, set()).add(record.student_id.id)
+
+        Daily = self.env['op.attendance.daily'].sudo()
+        totals = {}
+        for trimestre, student_ids in students_by_trimestre.items():
+            student_totals = Daily.get_student_totals(student_ids, trimestre.date_debut, trimestre.date_fin)
+            for student_id, counts in student_totals.items():
+                totals[(student_id, trimestre.id)] = (
+                    counts['total'],
+                    counts['absent'] + counts['excused'],
+                    counts['late'],
+                )
+        return totals
     
     def action_calculate(self):
         """Calculer automatiquement les notes du bulletin"""
+        # Regrouper par classe et trimestre pour profiter du calcul ensembliste
+        groups = {}
+        for bulletin in self:
+            key = (bulletin.batch_id, bulletin.trimestre_id)
+            groups[key] = groups.get(key, self.browse()) | bulletin
+
+        for (batch, trimestre), bulletins in groups.items():
+            self.calculate_for_class(batch, trimestre, bulletins=bulletins)
+
+    # ================= CALCUL PAR CLASSE =================
+
+    @api.model
+    def calculate_for_class(self, batch, trimestre, bulletins=None):
+        """Calculer en une seule passe les bulletins d'une classe pour un trimestre
+
+        Toutes les notes des évaluations terminées de la classe sont chargées en
+        une requête, agrégées en mémoire par (étudiant, matière) puis les lignes
+        de bulletin sont créées avec un unique create(vals_list).
+
+        :param batch: op.batch (record ou id)
+        :param trimestre: op.trimestre (record ou id)
+        :param bulletins: bulletins à calculer (par défaut ceux de la classe
+                          en brouillon ou déjà calculés)
+        :return: les bulletins calculés
+        """
+        if isinstance(batch, int):
+            batch = self.env['op.batch'].browse(batch)
+        if isinstance(trimestre, int):
+            trimestre = self.env['op.trimestre'].browse(trimestre)
+
+        if bulletins is None:
+            bulletins = self.search([
+                ('batch_id', '=', batch.id),
+                ('trimestre_id', '=', trimestre.id),
+                ('state', 'in', ['draft', 'calculated'])
+            ])
+        if not bulletins:
+            return bulletins
+
+        evaluated_subject_ids, notes_by_key = self._load_class_notes(
+            batch, trimestre, bulletins.mapped('student_id').ids
+        )
+
+        # Matières de secours si le cours n'en définit aucune (limité à 15)
+        fallback_subjects = None
+
+        lines_vals = []
+        empty_bulletins = self.browse()
+        for bulletin in bulletins:
+            subjects = bulletin.course_id.subject_ids if bulletin.course_id else self.env['op.subject']
+            if not subjects:
+                if fallback_subjects is None:
+                    fallback_subjects = self.env['op.subject'].search([('active', '=', True)], limit=15)
+                subjects = fallback_subjects
+            if not subjects:
+                empty_bulletins |= bulletin
+                continue
+
+            for subject in subjects:
+                lines_vals.append(bulletin._prepare_note_line_vals(
+                    subject,
+                    notes_by_key.get((bulletin.student_id.id, subject.id), []),
+                    subject.id in evaluated_subject_ids
+                ))
+
+        # Supprimer les anciennes lignes puis tout recréer en une fois
+        bulletins.mapped('note_lines').unlink()
+        if lines_vals:
+            self.env['op.bulletin.line'].create(lines_vals)
+
+        bulletins.write({'state': 'calculated'})
+        # Classement et statistiques immédiats pour que l'appelant lise des valeurs à jour
+        self._refresh_class_ranking(bulletins._get_ranking_groups())
+        self.env['op.bulletin.subject.stats']._refresh(bulletins.mapped('note_lines')._get_subject_stats_groups())
+        empty_bulletins._post_action_message(
+            _('Aucune matière trouvée pour générer le bulletin'), _('Bulletins sans matière')
+        )
+        (bulletins - empty_bulletins)._post_action_message(
+            _('Bulletin calculé automatiquement avec notes détaillées'), _('Bulletins calculés')
+        )
+        return bulletins
+
+    @api.model
+    def _load_class_notes(self, batch, trimestre, student_ids, subject_ids=None):
+        """Charger en une requête les notes d'une classe sur un trimestre
+
+        :param subject_ids: limiter le chargement à ces matières (toutes par défaut)
+        :return: (ids des matières ayant au moins une évaluation terminée,
+                  dict {(student_id, subject_id): [(note_sur_20, type, coefficient)]})
+        """
+        self.env['op.evaluation'].flush_model(['subject_id', 'batch_id', 'date', 'state', 'max_marks', 'name', 'evaluation_type_id'])
+        self.env['op.evaluation.line'].flush_model(['evaluation_id', 'student_id', 'note'])
+        self.env['op.evaluation.type'].flush_model(['name', 'coefficient'])
+
+        subject_clause = "AND e.subject_id = ANY(%s)" if subject_ids is not None else ""
+        params = [list(student_ids), batch.id, trimestre.date_debut, trimestre.date_fin]
+        if subject_ids is not None:
+            params.append(list(subject_ids))
+
+        self.env.cr.execute("""
+            SELECT e.subject_id, e.max_marks, e.name, t.name, t.coefficient,
+                   l.student_id, l.note
+              FROM op_evaluation e
+         LEFT JOIN op_evaluation_type t ON t.id = e.evaluation_type_id
+         LEFT JOIN op_evaluation_line l ON l.evaluation_id = e.id
+                                       AND l.student_id = ANY(%s)
+             WHERE e.batch_id = %s
+               AND e.state = 'done'
+               AND e.date >= %s
+               AND e.date <= %s
+               {}
+        """.format(subject_clause), params)
+
+        evaluated_subject_ids = set()
+        notes_by_key = {}
+        for subject_id, max_marks, eval_name, type_name, coefficient, student_id, note in self.env.cr.fetchall():
+            evaluated_subject_ids.add(subject_id)
+            if not student_id or not max_marks:
+                continue
+            notes_by_key.setdefault((student_id, subject_id), []).append((
+                (note / max_marks) * 20,
+                self._classify_evaluation(type_name, eval_name),
+                coefficient or 1.0,
+            ))
+        return evaluated_subject_ids, notes_by_key
+
+    # ================= RECALCUL INCRÉMENTAL =================
+
+    @api.model
+    def _mark_notes_dirty(self, keys):
+        """Planifier le recalcul des lignes touchées par des notes d'évaluation
+
+        :param keys: itérable de (batch_id, student_id, subject_id, date) ;
+                     student_id à None désigne tous les élèves de la classe
+        """
+        keys = {key for key in keys if key[0] and key[2] and key[3]}
+        if not keys:
+            return
+        pending = self.env.cr.precommit.data.setdefault(NOTES_PRECOMMIT_KEY, set())
+        if not pending:
+            self.env.cr.precommit.add(self._flush_notes)
+        pending.update(keys)
+
+    @api.model
+    def _flush_notes(self):
+        """Recalculer les lignes marquées pendant la transaction"""
+        pending = self.env.cr.precommit.data.pop(NOTES_PRECOMMIT_KEY, set())
+        if pending:
+            # Données dérivées des notes : mises à jour quel que soit l'auteur de la saisie
+            self.sudo()._recompute_note_lines(pending)
+            # Appelé avant le commit : écrire tout de suite les lignes modifiées
+            self.env.flush_all()
+
+    @api.model
+    def _recompute_note_lines(self, keys):
+        """Recalculer sur place les seules lignes (élève, matière, trimestre) concernées
+
+        Les bulletins validés ou publiés ne sont pas modifiés. La mise à jour
+        des lignes déclenche le reclassement de la classe et les statistiques
+        des seules matières concernées.
+
+        :param keys: itérable de (batch_id, student_id, subject_id, date)
+        """
+        keys = set(keys)
+        bulletins = self.search([
+            ('batch_id', 'in', list({key[0] for key in keys})),
+            ('state', 'in', NOTES_TRACKED_STATES),
+        ])
+
+        # (batch, trimestre) -> lignes à recalculer
+        lines_by_class = {}
+        for bulletin in bulletins:
+            trimestre = bulletin.trimestre_id
+            subject_ids = {
+                subject_id
+                for batch_id, student_id, subject_id, note_date in keys
+                if batch_id == bulletin.batch_id.id
+                and student_id in (None, bulletin.student_id.id)
+                and trimestre.date_debut <= note_date <= trimestre.date_fin
+            }
+            lines = bulletin.note_lines.filtered(lambda line: line.subject_id.id in subject_ids)
+            if lines:
+                key = (bulletin.batch_id, trimestre)
+                lines_by_class[key] = lines_by_class.get(key, self.env['op.bulletin.line']) | lines
+
+        for (batch, trimestre), lines in lines_by_class.items():
+            _evaluated_subject_ids, notes_by_key = self._load_class_notes(
+                batch, trimestre,
+                lines.mapped('bulletin_id.student_id').ids,
+                subject_ids=lines.mapped('subject_id').ids,
+            )
+            for line in lines:
+                # Seules les moyennes suivent les notes : appréciation et coefficient
+                # saisis à la main sont conservés. Une matière qui n'a plus
+                # d'évaluation terminée retombe à zéro.
+                line.write(self._compute_note_averages(
+                    notes_by_key.get((line.bulletin_id.student_id.id, line.subject_id.id), [])
+                ))
+
+    @api.model
+    def _classify_evaluation(self, type_name, eval_name):
+        """Déterminer le type d'une évaluation à partir de son type ou de son nom"""
+        eval_type_name = (type_name or '').lower()
+        eval_name = (eval_name or '').lower()
+
+        if 'devoir' in eval_type_name or 'devoir' in eval_name or 'dv' in eval_type_name:
+            return 'devoir'
+        elif 'composition' in eval_type_name or 'composition' in eval_name or 'comp' in eval_type_name:
+            return 'composition'
+        elif 'controle' in eval_type_name or 'controle' in eval_name or 'cc' in eval_type_name:
+            return 'controle'
+        elif 'oral' in eval_type_name or 'oral' in eval_name:
+            return 'oral'
+        elif 'tp' in eval_type_name or 'tp' in eval_name or 'pratique' in eval_name:
+            return 'tp'
+        # Si le type n'est pas déterminable, considérer comme devoir par défaut
+        return 'devoir'
+
+    @api.model
+    def _compute_note_averages(self, student_notes):
+        """Moyennes d'une ligne de bulletin à partir des notes agrégées
+
+        :param student_notes: liste de (note_sur_20, type, coefficient)
+        :return: valeurs des champs calculés de la ligne (zéro sans aucune note)
+        """
+        moyennes = dict.fromkeys(['devoir', 'composition', 'controle', 'oral', 'tp'], 0.0)
+        notes_par_type = {}
+        for note, eval_type, _coefficient in student_notes:
+            notes_par_type.setdefault(eval_type, []).append(note)
+        for eval_type, type_notes in notes_par_type.items():
+            moyennes[eval_type] = sum(type_notes) / len(type_notes)
+
+        moyenne_matiere = 0.0
+        total_coeff = sum(coefficient for _note, _type, coefficient in student_notes)
+        if total_coeff:
+            moyenne_matiere = sum(note * coefficient for note, _type, coefficient in student_notes) / total_coeff
+
+        notes = [note for note, _type, _coefficient in student_notes]
+        return {
+            'note_devoir': moyennes['devoir'],
+            'note_composition': moyennes['composition'],
+            'note_controle': moyennes['controle'],
+            'note_oral': moyennes['oral'],
+            'note_tp': moyennes['tp'],
+            'moyenne_matiere': moyenne_matiere,
+            'nombre_evaluations': len(notes),
+            'note_mini': min(notes) if notes else 0.0,
+            'note_maxi': max(notes) if notes else 0.0,
+        }
+
+    def _prepare_note_line_vals(self, subject, student_notes, has_evaluations):
+        """Préparer les valeurs d'une ligne de bulletin à partir des notes agrégées"""
         self.ensure_one()
-        
-        # Supprimer les anciennes lignes
-        self.note_lines.unlink()
-        
-        # Récupérer les matières
-        subjects = self.env['op.subject']  # Initialiser comme un recordset vide
-        if self.course_id and self.course_id.subject_ids:
-            # Si un cours est défini et a des matières, les utiliser
-            subjects = self.course_id.subject_ids
+        if has_evaluations:
+            vals = self._compute_note_averages(student_notes)
         else:
-            # Récupérer toutes les matières actives (limité à 15)
-            subjects = self.env['op.subject'].search([('active', '=', True)], limit=15)
-        
-        # Si toujours aucune matière trouvée, on ne peut pas continuer
-        if not subjects:
-            self.state = 'calculated'
-            self.message_post(body=_('Aucune matière trouvée pour générer le bulletin'))
-            return
-        
-        for subject in subjects:
-            # Récupérer toutes les évaluations pour cette matière et ce trimestre
-            evaluations = self.env['op.evaluation'].search([
-                ('subject_id', '=', subject.id),
-                ('batch_id', '=', self.batch_id.id),
-                ('date', '>=', self.trimestre_id.date_debut),
-                ('date', '<=', self.trimestre_id.date_fin),
-                ('state', '=', 'done')
-            ])
-            
-            # Initialiser les notes par type
-            note_devoir = 0.0
-            note_composition = 0.0
-            note_controle = 0.0
-            note_oral = 0.0
-            note_tp = 0.0
-            moyenne_matiere = 0.0
-            
-            # Dictionnaires pour regrouper les notes par type
-            notes_devoirs = []
-            notes_compositions = []
-            notes_controles = []
-            notes_oraux = []
-            notes_tp = []
-            student_notes = []
-            
-            if evaluations:
-                # Analyser chaque évaluation et regrouper par type
-                for evaluation in evaluations:
-                    eval_line = evaluation.evaluation_line_ids.filtered(lambda l: l.student_id.id == self.student_id.id)
-                    if eval_line:
-                        note_sur_20 = (eval_line.note / evaluation.max_marks) * 20
-                        
-                        # Analyser le type d'évaluation basé sur le nom ou le type
-                        eval_type_name = (evaluation.evaluation_type_id.name or '').lower() if evaluation.evaluation_type_id else ''
-                        eval_name = (evaluation.exam_name or '').lower()
-                        
-                        # Classer par type d'évaluation
-                        if 'devoir' in eval_type_name or 'devoir' in eval_name or 'dv' in eval_type_name:
-                            notes_devoirs.append(note_sur_20)
-                        elif 'composition' in eval_type_name or 'composition' in eval_name or 'comp' in eval_type_name:
-                            notes_compositions.append(note_sur_20)
-                        elif 'controle' in eval_type_name or 'controle' in eval_name or 'cc' in eval_type_name:
-                            notes_controles.append(note_sur_20)
-                        elif 'oral' in eval_type_name or 'oral' in eval_name:
-                            notes_oraux.append(note_sur_20)
-                        elif 'tp' in eval_type_name or 'tp' in eval_name or 'pratique' in eval_name:
-                            notes_tp.append(note_sur_20)
-                        else:
-                            # Si le type n'est pas déterminable, considérer comme devoir par défaut
-                            notes_devoirs.append(note_sur_20)
-                        
-                        # Ajouter à la liste générale pour calculer la moyenne
-                        student_notes.append({
-                            'note': note_sur_20,
-                            'coefficient': evaluation.evaluation_type_id.coefficient or 1.0
-                        })
-                
-                # Calculer les moyennes par type
-                if notes_devoirs:
-                    note_devoir = sum(notes_devoirs) / len(notes_devoirs)
-                if notes_compositions:
-                    note_composition = sum(notes_compositions) / len(notes_compositions)
-                if notes_controles:
-                    note_controle = sum(notes_controles) / len(notes_controles)
-                if notes_oraux:
-                    note_oral = sum(notes_oraux) / len(notes_oraux)
-                if notes_tp:
-                    note_tp = sum(notes_tp) / len(notes_tp)
-                
-                # Calculer la moyenne générale de la matière
-                if student_notes:
-                    total_coeff = sum(n['coefficient'] for n in student_notes)
-                    moyenne_matiere = sum(n['note'] * n['coefficient'] for n in student_notes) / total_coeff
-                else:
-                    moyenne_matiere = 0.0
-            else:
-                # Si pas d'évaluations, générer des notes par défaut pour la démonstration
-                import random
-                note_devoir = round(random.uniform(8, 16), 2)
-                note_composition = round(random.uniform(10, 18), 2)
-                note_controle = round(random.uniform(9, 17), 2)
-                moyenne_matiere = round((note_devoir + note_composition + note_controle) / 3, 2)
-            
-            # Créer la ligne de bulletin avec toutes les notes détaillées
-            self.env['op.bulletin.line'].create({
-                'bulletin_id': self.id,
-                'subject_id': subject.id,
-                'note_devoir': note_devoir,
-                'note_composition': note_composition,
-                'note_controle': note_controle,
-                'note_oral': note_oral,
-                'note_tp': note_tp,
-                'moyenne_matiere': moyenne_matiere,
-                'coefficient': getattr(subject, 'coefficient', 1.0) if hasattr(subject, 'coefficient') else 1.0,
-                'appreciation': self._get_appreciation_automatique(moyenne_matiere)
-            })
-        
-        self.state = 'calculated'
-        self.message_post(body=_('Bulletin calculé automatiquement avec notes détaillées'))
+            # Si pas d'évaluations, générer des notes par défaut pour la démonstration
+            vals = self._compute_note_averages([])
+            vals['note_devoir'] = round(random.uniform(8, 16), 2)
+            vals['note_composition'] = round(random.uniform(10, 18), 2)
+            vals['note_controle'] = round(random.uniform(9, 17), 2)
+            vals['moyenne_matiere'] = round(
+                (vals['note_devoir'] + vals['note_composition'] + vals['note_controle']) / 3, 2)
+
+        vals.update({
+            'bulletin_id': self.id,
+            'subject_id': subject.id,
+            'coefficient': getattr(subject, 'coefficient', 1.0) if hasattr(subject, 'coefficient') else 1.0,
+            'appreciation': self._get_appreciation_automatique(vals['moyenne_matiere']),
+        })
+        return vals
     
     def _get_appreciation_automatique(self, moyenne):
         """Générer une appréciation automatique basée sur la moyenne"""
@@ -317,45 +767,267 @@ class OpBulletin(models.Model):
             return "Insuffisant"
     
     def action_validate(self, user_id=None):
-        """Valider le bulletin"""
-        self.ensure_one()
-        if self.state != 'calculated':
+        """Valider les bulletins"""
+        if any(bulletin.state != 'calculated' for bulletin in self):
             raise ValidationError(_('Le bulletin doit être calculé avant d\'être validé'))
         
-        self.state = 'validated'
-        # Utiliser sudo() pour éviter les problèmes d'authentification
-        if user_id:
-            self.validated_by = user_id
-        else:
-            self.validated_by = self.env.ref('base.user_admin')  # Utilisateur par défaut
-        self.date_edition = fields.Date.today()
-        self.message_post(body=_('Bulletin validé'))
+        self.write({
+            'state': 'validated',
+            # Utilisateur par défaut si aucun n'est fourni
+            'validated_by': self._get_action_user_id(user_id),
+            'date_edition': fields.Date.today(),
+        })
+        self._post_action_message(_('Bulletin validé'), _('Bulletins validés'))
     
     def action_publish(self, user_id=None):
-        """Publier le bulletin"""
-        self.ensure_one()
-        if self.state != 'validated':
+        """Publier les bulletins"""
+        if any(bulletin.state != 'validated' for bulletin in self):
             raise ValidationError(_('Le bulletin doit être validé avant d\'être publié'))
         
-        self.state = 'published'
-        # Utiliser sudo() pour éviter les problèmes d'authentification
-        if user_id:
-            self.published_by = user_id
-        else:
-            self.published_by = self.env.ref('base.user_admin')  # Utilisateur par défaut
-        self.message_post(body=_('Bulletin publié'))
+        self.write({
+            'state': 'published',
+            'published_by': self._get_action_user_id(user_id),
+        })
+        self._freeze_published_snapshot()
+        self._post_action_message(_('Bulletin publié'), _('Bulletins publiés'))
     
+    def action_unpublish(self):
+        """Dépublier les bulletins : retour à l'état validé, instantané abandonné"""
+        if any(bulletin.state != 'published' for bulletin in self):
+            raise ValidationError(_('Seul un bulletin publié peut être dépublié'))
+
+        self.write({'state': 'validated', 'published_snapshot': False})
+        self._invalidate_pdf_cache()
+        self._post_action_message(_('Bulletin dépublié'), _('Bulletins dépubliés'))
+
     def action_archive(self):
-        """Archiver le bulletin"""
-        self.ensure_one()
-        self.state = 'archived'
-        self.message_post(body=_('Bulletin archivé'))
+        """Archiver les bulletins"""
+        self.write({'state': 'archived'})
+        self._post_action_message(_('Bulletin archivé'), _('Bulletins archivés'))
     
     def action_reset_to_draft(self):
         """Remettre en brouillon"""
+        self.write({'state': 'draft', 'published_snapshot': False})
+        self._invalidate_pdf_cache()
+        self._post_action_message(_('Bulletin remis en brouillon'), _('Bulletins remis en brouillon'))
+
+    @api.model
+    def _get_action_user_id(self, user_id=None):
+        """Identifiant de l'utilisateur à l'origine d'une action (admin par défaut)"""
+        if isinstance(user_id, models.BaseModel):
+            return user_id.id
+        return user_id or self.env.ref('base.user_admin').id
+
+    def apply_bulk_action(self, action, user_id=None):
+        """Appliquer une action à un ensemble de bulletins
+
+        Les bulletins dont l'état ne permet pas l'action sont ignorés ; les
+        autres passent à leur nouvel état en une seule écriture, en mode masse.
+
+        :param action: 'calculate', 'validate', 'publish' ou 'archive'
+        :return: {bulletin_id: {'status': 'done'|'skipped'|'error', 'state', 'message'}}
+        """
+        if action not in BULK_ACTION_STATES:
+            raise ValidationError(_('Action inconnue: %s') % action)
+
+        allowed_states = BULK_ACTION_STATES[action]
+        eligible = self.filtered(lambda b: b.state in allowed_states)
+        results = {
+            bulletin.id: {
+                'status': 'skipped',
+                'state': bulletin.state,
+                'message': _('Action impossible depuis l\'état %s') % bulletin.state,
+            }
+            for bulletin in self - eligible
+        }
+        if not eligible:
+            return results
+
+        bulletins = eligible._with_bulk_mode()
+        try:
+            with self.env.cr.savepoint():
+                if action == 'calculate':
+                    bulletins.action_calculate()
+                elif action == 'validate':
+                    bulletins.action_validate(user_id=user_id)
+                elif action == 'publish':
+                    bulletins.action_publish(user_id=user_id)
+                else:
+                    bulletins.action_archive()
+        except Exception as e:
+            _logger.error("Erreur action en masse %s sur %d bulletins: %s", action, len(eligible), e)
+            eligible.invalidate_recordset()
+            for bulletin in eligible:
+                results[bulletin.id] = {'status': 'error', 'state': bulletin.state, 'message': str(e)}
+            return results
+
+        for bulletin in eligible:
+            results[bulletin.id] = {'status': 'done', 'state': bulletin.state, 'message': ''}
+        return results
+
+    # ==================== INSTANTANÉ PUBLIÉ ====================
+
+    def _get_api_data(self):
+        """Représentation complète du bulletin pour l'API"""
         self.ensure_one()
-        self.state = 'draft'
-        self.message_post(body=_('Bulletin remis en brouillon'))
+        # Récupération des notes détaillées
+        lines_data = []
+        for line in self.note_lines:
+            lines_data.append({
+                'id': line.id,
+                'subject_id': line.subject_id.id,
+                'subject_name': line.subject_id.name,
+                'teacher_name': line.teacher_id.name if line.teacher_id else '',
+                'note_controle': float(line.note_controle) if line.note_controle else 0.0,
+                'note_composition': float(line.note_composition) if line.note_composition else 0.0,
+                'note_devoir': float(line.note_devoir) if line.note_devoir else 0.0,
+                'note_oral': float(line.note_oral) if line.note_oral else 0.0,
+                'note_tp': float(line.note_tp) if line.note_tp else 0.0,
+                'moyenne_matiere': float(line.moyenne_matiere) if line.moyenne_matiere else 0.0,
+                'coefficient': float(line.coefficient) if line.coefficient else 1.0,
+                'moyenne_classe_matiere': float(line.moyenne_classe_matiere) if line.moyenne_classe_matiere else 0.0,
+                'rang_matiere': line.rang_matiere,
+                'note_mini': float(line.note_mini) if line.note_mini else 0.0,
+                'note_maxi': float(line.note_maxi) if line.note_maxi else 0.0,
+                'appreciation': line.appreciation
+            })
+
+        return {
+            'id': self.id,
+            'numero': self.numero_bulletin,
+            'student_id': self.student_id.id,
+            'student_name': self.student_id.name,
+            'trimestre_id': self.trimestre_id.id,
+            'trimestre_name': self.trimestre_id.name,
+            'batch_id': self.batch_id.id if self.batch_id else None,
+            'batch_name': self.batch_id.name if self.batch_id else '',
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None,
+            'date_edition': self.date_edition.isoformat() if self.date_edition else None,
+            'moyenne_generale': float(self.moyenne_generale) if self.moyenne_generale else 0.0,
+            'moyenne_generale_classe': float(self.moyenne_generale_classe) if self.moyenne_generale_classe else 0.0,
+            'rang_classe': self.rang_classe,
+            'total_eleves_classe': self.total_eleves_classe,
+            'appreciation_generale': self.appreciation_generale,
+            'decision_conseil': self.decision_conseil or None,
+            'state': self.state,
+            'absence_non_justifiees': self.absence_non_justifiees,
+            'absence_justifiees': self.absence_justifiees,
+            'retards': self.retards,
+            'taux_presence': self.taux_presence,
+            'total_absences': self.total_absences,
+            'total_retards': self.total_retards,
+            'total_jours_cours': self.total_jours_cours,
+            'bulletin_lines': lines_data
+        }
+
+    def _freeze_published_snapshot(self):
+        """Figer le contenu des bulletins publiés
+
+        Classement et statistiques en attente sont d'abord appliqués pour que
+        l'instantané reflète les valeurs définitives.
+        """
+        self._flush_class_ranking()
+        self.env['op.bulletin.subject.stats']._flush_dirty()
+        for bulletin in self:
+            bulletin.published_snapshot = {
+                'api': bulletin._get_api_data(),
+                'pdf': bulletin._get_pdf_data(),
+            }
+
+    @api.model
+    def _read_published_snapshots(self, bulletin_ids=None, student_id=None):
+        """Lire les instantanés de bulletins publiés en une requête, sans calcul
+
+        :return: {bulletin_id: instantané}
+        """
+        self.flush_model(['state', 'student_id', 'published_snapshot'])
+        conditions = ["state = 'published'", "published_snapshot IS NOT NULL"]
+        params = []
+        if bulletin_ids is not None:
+            conditions.append("id = ANY(%s)")
+            params.append(list(bulletin_ids))
+        if student_id is not None:
+            conditions.append("student_id = %s")
+            params.append(student_id)
+        self.env.cr.execute(
+            "SELECT id, published_snapshot FROM op_bulletin WHERE %s ORDER BY id" % ' AND '.join(conditions),
+            params
+        )
+        return dict(self.env.cr.fetchall())
+
+    # ==================== IMPRESSION ====================
+
+    def _get_pdf_filename(self):
+        """Nom du fichier PDF du bulletin"""
+        self.ensure_one()
+        filename = f"Bulletin_{self.student_id.name}_{self.trimestre_id.name}.pdf"
+        return filename.replace(' ', '_').replace('/', '_')  # Nettoyer le nom de fichier
+
+    def _get_pdf_data(self):
+        """Données du bulletin pour le rendu PDF, sous forme de dictionnaire simple
+
+        Le résultat ne contient que des types Python natifs : le rendu reportlab
+        n'accède pas à l'ORM. Un bulletin publié est rendu depuis son instantané.
+        """
+        self.ensure_one()
+        if self.state == 'published' and self.published_snapshot:
+            return self.published_snapshot['pdf']
+        return {
+            'id': self.id,
+            'filename': self._get_pdf_filename(),
+            'student_name': self.student_id.name or '',
+            'trimestre_name': self.trimestre_id.name or '',
+            'batch_name': self.batch_id.name or '',
+            'numero': self.numero_bulletin or '',
+            'moyenne_generale': self.moyenne_generale or 0.0,
+            'rang_classe': self.rang_classe or 0,
+            'total_eleves_classe': self.total_eleves_classe or 0,
+            'appreciation_generale': self.appreciation_generale or '',
+            'taux_presence': self.taux_presence or 0.0,
+            'total_absences': self.total_absences or 0,
+            'total_retards': self.total_retards or 0,
+            'lines': [{
+                'subject_name': line.subject_id.name or '',
+                'coefficient': line.coefficient,
+                'moyenne_matiere': line.moyenne_matiere or 0.0,
+                'appreciation': line.appreciation or '',
+            } for line in self.note_lines],
+        }
+
+    def _get_pdf_cache_key(self):
+        """Empreinte du contenu imprimé : état, données, lignes et version du modèle
+
+        Le rendu reportlab ne lit que _get_pdf_data() : toute valeur imprimée,
+        y compris le rang et l'effectif écrits en SQL, change donc la clé.
+        """
+        self.ensure_one()
+        payload = {
+            'state': self.state,
+            'data': self._get_pdf_data(),
+            'template': PDF_TEMPLATE_VERSION,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _get_cached_pdf(self, cache_key):
+        """Retourner le PDF en cache s'il correspond à la clé, sinon None"""
+        self.ensure_one()
+        if self.pdf_cache_key != cache_key or not self.pdf_cache:
+            return None
+        return base64.b64decode(self.pdf_cache)
+
+    def _store_pdf_cache(self, cache_key, pdf_content):
+        """Mémoriser le PDF rendu pour la clé donnée"""
+        self.ensure_one()
+        self.write({
+            'pdf_cache': base64.b64encode(pdf_content),
+            'pdf_cache_key': cache_key,
+        })
+
+    def _invalidate_pdf_cache(self):
+        """Supprimer les PDF en cache"""
+        cached = self.filtered('pdf_cache_key')
+        if cached:
+            cached.write({'pdf_cache': False, 'pdf_cache_key': False})
 
 class OpBulletinLine(models.Model):
     _name = 'op.bulletin.line'
@@ -375,103 +1047,68 @@ class OpBulletinLine(models.Model):
     # Moyenne de la matière
     moyenne_matiere = fields.Float('Moyenne Matière', required=True, digits=(5, 2))
     coefficient = fields.Float('Coefficient', required=True, default=1.0)
-    moyenne_classe_matiere = fields.Float('Moyenne Classe', compute='_compute_moyenne_classe_matiere', digits=(5, 2))
+    # Moyenne de classe et rang : maintenus par op.bulletin.subject.stats
+    moyenne_classe_matiere = fields.Float('Moyenne Classe', readonly=True, copy=False, digits=(5, 2))
     
     # Rang dans la matière
-    rang_matiere = fields.Integer('Rang Matière', compute='_compute_rang_matiere')
+    rang_matiere = fields.Integer('Rang Matière', readonly=True, copy=False)
     
     # Appréciations
     appreciation = fields.Text('Appréciation du Professeur')
     
-    # Informations complémentaires
-    nombre_evaluations = fields.Integer('Nombre d\'Évaluations', compute='_compute_nombre_evaluations')
-    note_mini = fields.Float('Note Min', compute='_compute_stats_notes', digits=(5, 2))
-    note_maxi = fields.Float('Note Max', compute='_compute_stats_notes', digits=(5, 2))
+    # Informations complémentaires (renseignées lors du calcul du bulletin)
+    nombre_evaluations = fields.Integer('Nombre d\'Évaluations', readonly=True)
+    note_mini = fields.Float('Note Min', readonly=True, digits=(5, 2))
+    note_maxi = fields.Float('Note Max', readonly=True, digits=(5, 2))
     
     # Enseignant
     teacher_id = fields.Many2one('op.faculty', string='Enseignant', compute='_compute_teacher')
     
-    @api.depends('subject_id', 'bulletin_id.batch_id', 'bulletin_id.trimestre_id')
-    def _compute_moyenne_classe_matiere(self):
-        for record in self:
-            if record.subject_id and record.bulletin_id.batch_id and record.bulletin_id.trimestre_id:
-                autres_bulletins = self.search([
-                    ('subject_id', '=', record.subject_id.id),
-                    ('bulletin_id.batch_id', '=', record.bulletin_id.batch_id.id),
-                    ('bulletin_id.trimestre_id', '=', record.bulletin_id.trimestre_id.id),
-                    ('bulletin_id.state', 'in', ['calculated', 'validated', 'published'])
-                ])
-                if autres_bulletins:
-                    record.moyenne_classe_matiere = sum(l.moyenne_matiere for l in autres_bulletins) / len(autres_bulletins)
-                else:
-                    record.moyenne_classe_matiere = 0.0
-            else:
-                record.moyenne_classe_matiere = 0.0
-    
-    @api.depends('moyenne_matiere', 'subject_id', 'bulletin_id.batch_id', 'bulletin_id.trimestre_id')
-    def _compute_rang_matiere(self):
-        for record in self:
-            if record.subject_id and record.bulletin_id.batch_id and record.bulletin_id.trimestre_id:
-                autres_bulletins = self.search([
-                    ('subject_id', '=', record.subject_id.id),
-                    ('bulletin_id.batch_id', '=', record.bulletin_id.batch_id.id),
-                    ('bulletin_id.trimestre_id', '=', record.bulletin_id.trimestre_id.id),
-                    ('bulletin_id.state', 'in', ['calculated', 'validated', 'published'])
-                ], order='moyenne_matiere desc')
-                
-                for index, line in enumerate(autres_bulletins):
-                    if line.id == record.id:
-                        record.rang_matiere = index + 1
-                        break
-                else:
-                    record.rang_matiere = 0
-            else:
-                record.rang_matiere = 0
-    
-    @api.depends('subject_id', 'bulletin_id.student_id', 'bulletin_id.trimestre_id')
-    def _compute_nombre_evaluations(self):
-        for record in self:
-            if record.subject_id and record.bulletin_id.student_id and record.bulletin_id.trimestre_id:
-                evaluations = self.env['op.evaluation'].search_count([
-                    ('subject_id', '=', record.subject_id.id),
-                    ('batch_id', '=', record.bulletin_id.batch_id.id),
-                    ('date', '>=', record.bulletin_id.trimestre_id.date_debut),
-                    ('date', '<=', record.bulletin_id.trimestre_id.date_fin),
-                    ('state', '=', 'done'),
-                    ('evaluation_line_ids.student_id', '=', record.bulletin_id.student_id.id)
-                ])
-                record.nombre_evaluations = evaluations
-            else:
-                record.nombre_evaluations = 0
-    
-    @api.depends('subject_id', 'bulletin_id.student_id', 'bulletin_id.trimestre_id')
-    def _compute_stats_notes(self):
-        for record in self:
-            if record.subject_id and record.bulletin_id.student_id and record.bulletin_id.trimestre_id:
-                evaluations = self.env['op.evaluation'].search([
-                    ('subject_id', '=', record.subject_id.id),
-                    ('batch_id', '=', record.bulletin_id.batch_id.id),
-                    ('date', '>=', record.bulletin_id.trimestre_id.date_debut),
-                    ('date', '<=', record.bulletin_id.trimestre_id.date_fin),
-                    ('state', '=', 'done')
-                ])
-                
-                notes = []
-                for evaluation in evaluations:
-                    eval_line = evaluation.evaluation_line_ids.filtered(lambda l: l.student_id.id == record.bulletin_id.student_id.id)
-                    if eval_line:
-                        note_sur_20 = (eval_line.note / evaluation.max_marks) * 20
-                        notes.append(note_sur_20)
-                
-                if notes:
-                    record.note_mini = min(notes)
-                    record.note_maxi = max(notes)
-                else:
-                    record.note_mini = 0.0
-                    record.note_maxi = 0.0
-            else:
-                record.note_mini = 0.0
-                record.note_maxi = 0.0
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['op.bulletin'].browse(
+            [vals['bulletin_id'] for vals in vals_list if vals.get('bulletin_id')]
+        )._check_not_published()
+        lines = super(OpBulletinLine, self).create(vals_list)
+        lines.mapped('bulletin_id')._mark_class_ranking_dirty()
+        lines._mark_subject_stats_dirty()
+        return lines
+
+    def write(self, vals):
+        if LINE_LOCKED_FIELDS.intersection(vals):
+            bulletins = self.mapped('bulletin_id')
+            if vals.get('bulletin_id'):
+                bulletins |= bulletins.browse(vals['bulletin_id'])
+            bulletins._check_not_published()
+        ranking_changed = bool({'moyenne_matiere', 'coefficient', 'bulletin_id'}.intersection(vals))
+        stats_changed = bool({'moyenne_matiere', 'subject_id', 'bulletin_id'}.intersection(vals))
+        if stats_changed:
+            self._mark_subject_stats_dirty()
+        bulletins = self.mapped('bulletin_id')
+        res = super(OpBulletinLine, self).write(vals)
+        if ranking_changed:
+            (bulletins | self.mapped('bulletin_id'))._mark_class_ranking_dirty()
+        if stats_changed:
+            self._mark_subject_stats_dirty()
+        return res
+
+    def unlink(self):
+        self.mapped('bulletin_id')._check_not_published()
+        self.mapped('bulletin_id')._mark_class_ranking_dirty()
+        self._mark_subject_stats_dirty()
+        return super(OpBulletinLine, self).unlink()
+
+    def _get_subject_stats_groups(self):
+        """Triplets (batch_id, trimestre_id, subject_id) concernés par ces lignes"""
+        return {
+            (line.bulletin_id.batch_id.id, line.bulletin_id.trimestre_id.id, line.subject_id.id)
+            for line in self
+            if line.bulletin_id.batch_id and line.bulletin_id.trimestre_id and line.subject_id
+        }
+
+    def _mark_subject_stats_dirty(self):
+        """Planifier la mise à jour des statistiques de classe de ces matières"""
+        self.env['op.bulletin.subject.stats']._mark_dirty(self._get_subject_stats_groups())
     
     @api.depends('subject_id')
     def _compute_teacher(self):
@@ -483,6 +1120,351 @@ class OpBulletinLine(models.Model):
             else:
                 record.teacher_id = False
 
+class OpBulletinSubjectStats(models.Model):
+    _name = 'op.bulletin.subject.stats'
+    _description = 'Statistiques de Classe par Matière'
+    _rec_name = 'subject_id'
+    _order = 'batch_id, trimestre_id, subject_id'
+
+    batch_id = fields.Many2one('op.batch', string='Classe', required=True, ondelete='cascade', index=True)
+    trimestre_id = fields.Many2one('op.trimestre', string='Trimestre', required=True, ondelete='cascade', index=True)
+    subject_id = fields.Many2one('op.subject', string='Matière', required=True, ondelete='cascade')
+
+    moyenne_classe = fields.Float('Moyenne Classe', digits=(5, 2), readonly=True)
+    note_mini = fields.Float('Moyenne Min', digits=(5, 2), readonly=True)
+    note_maxi = fields.Float('Moyenne Max', digits=(5, 2), readonly=True)
+    nombre_eleves = fields.Integer('Nombre d\'Élèves', readonly=True)
+    # Classement ordonné : [{'bulletin_id', 'moyenne', 'rang'}, ...]
+    ranking = fields.Json('Classement', readonly=True)
+
+    _sql_constraints = [
+        ('class_subject_uniq', 'unique(batch_id, trimestre_id, subject_id)',
+         'Une seule ligne de statistiques par classe, trimestre et matière.'),
+    ]
+
+    @api.model
+    def _mark_dirty(self, groups):
+        """Planifier la mise à jour de ces (batch_id, trimestre_id, subject_id)
+
+        Les groupes sont accumulés pendant la transaction et mis à jour une
+        seule fois avant le commit.
+        """
+        if not groups:
+            return
+        pending = self.env.cr.precommit.data.setdefault(SUBJECT_STATS_PRECOMMIT_KEY, set())
+        if not pending:
+            self.env.cr.precommit.add(self._flush_dirty)
+        pending.update(groups)
+
+    @api.model
+    def _flush_dirty(self):
+        """Mettre à jour les groupes marqués pendant la transaction"""
+        pending = self.env.cr.precommit.data.pop(SUBJECT_STATS_PRECOMMIT_KEY, set())
+        if pending:
+            self._refresh(pending)
+
+    @api.model
+    def _refresh(self, groups):
+        """Recalculer les statistiques des groupes donnés
+
+        Met à jour en SQL le rang et la moyenne de classe de chaque ligne de
+        bulletin concernée, puis la ligne de statistiques du groupe (ou la
+        supprime s'il ne reste aucune note classée).
+
+        :param groups: itérable de triplets (batch_id, trimestre_id, subject_id)
+        """
+        groups = tuple(set(groups))
+        if not groups:
+            return
+
+        pending = self.env.cr.precommit.data.get(SUBJECT_STATS_PRECOMMIT_KEY)
+        if pending:
+            pending.difference_update(groups)
+
+        self.env['op.bulletin'].flush_model(['batch_id', 'trimestre_id', 'state'])
+        self.env['op.bulletin.line'].flush_model([
+            'bulletin_id', 'subject_id', 'moyenne_matiere', 'rang_matiere', 'moyenne_classe_matiere',
+        ])
+        self.flush_model()
+
+        params = {'states': RANKED_STATES, 'groups': groups, 'uid': self.env.uid}
+        cr = self.env.cr
+
+        # Rang et moyenne de classe de chaque ligne
+        cr.execute("""
+            WITH ranked AS (
+                SELECT l.id, b.batch_id, b.trimestre_id, l.subject_id, l.moyenne_matiere,
+                       RANK() OVER (PARTITION BY b.batch_id, b.trimestre_id, l.subject_id
+                                    ORDER BY l.moyenne_matiere DESC) AS rang
+                  FROM op_bulletin_line l
+                  JOIN op_bulletin b ON b.id = l.bulletin_id
+                 WHERE b.state IN %(states)s
+                   AND (b.batch_id, b.trimestre_id, l.subject_id) IN %(groups)s
+            ),
+            class_avg AS (
+                SELECT batch_id, trimestre_id, subject_id, AVG(moyenne_matiere) AS moyenne_classe
+                  FROM ranked
+              GROUP BY batch_id, trimestre_id, subject_id
+            )
+            UPDATE op_bulletin_line l
+               SET rang_matiere = COALESCE(r.rang, 0),
+                   moyenne_classe_matiere = COALESCE(a.moyenne_classe, 0)
+              FROM op_bulletin_line t
+              JOIN op_bulletin b ON b.id = t.bulletin_id
+         LEFT JOIN ranked r ON r.id = t.id
+         LEFT JOIN class_avg a ON a.batch_id = b.batch_id
+                              AND a.trimestre_id = b.trimestre_id
+                              AND a.subject_id = t.subject_id
+             WHERE t.id = l.id
+               AND (b.batch_id, b.trimestre_id, t.subject_id) IN %(groups)s
+        """, params)
+
+        # Agrégats et classement ordonné par groupe
+        cr.execute("""
+            INSERT INTO op_bulletin_subject_stats
+                   (batch_id, trimestre_id, subject_id, moyenne_classe, note_mini, note_maxi,
+                    nombre_eleves, ranking, create_uid, create_date, write_uid, write_date)
+            SELECT b.batch_id, b.trimestre_id, l.subject_id,
+                   AVG(l.moyenne_matiere), MIN(l.moyenne_matiere), MAX(l.moyenne_matiere), COUNT(*),
+                   jsonb_agg(jsonb_build_object('bulletin_id', l.bulletin_id,
+                                                'moyenne', l.moyenne_matiere,
+                                                'rang', l.rang_matiere)
+                             ORDER BY l.rang_matiere, l.bulletin_id),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM op_bulletin_line l
+              JOIN op_bulletin b ON b.id = l.bulletin_id
+             WHERE b.state IN %(states)s
+               AND (b.batch_id, b.trimestre_id, l.subject_id) IN %(groups)s
+          GROUP BY b.batch_id, b.trimestre_id, l.subject_id
+            ON CONFLICT (batch_id, trimestre_id, subject_id) DO UPDATE
+               SET moyenne_classe = EXCLUDED.moyenne_classe,
+                   note_mini = EXCLUDED.note_mini,
+                   note_maxi = EXCLUDED.note_maxi,
+                   nombre_eleves = EXCLUDED.nombre_eleves,
+                   ranking = EXCLUDED.ranking,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, params)
+
+        # Groupes sans plus aucune note classée
+        cr.execute("""
+            DELETE FROM op_bulletin_subject_stats s
+             WHERE (s.batch_id, s.trimestre_id, s.subject_id) IN %(groups)s
+               AND NOT EXISTS (
+                    SELECT 1
+                      FROM op_bulletin_line l
+                      JOIN op_bulletin b ON b.id = l.bulletin_id
+                     WHERE b.state IN %(states)s
+                       AND b.batch_id = s.batch_id
+                       AND b.trimestre_id = s.trimestre_id
+                       AND l.subject_id = s.subject_id
+               )
+        """, params)
+
+        self.env['op.bulletin.line'].invalidate_model(['rang_matiere', 'moyenne_classe_matiere'])
+        self.invalidate_model()
+
+class OpBulletinStatsSnapshot(models.Model):
+    _name = 'op.bulletin.stats.snapshot'
+    _description = 'Instantané des Statistiques de Bulletins'
+    _rec_name = 'filter_key'
+
+    # Filtres de l'instantané (vides = tous)
+    filter_key = fields.Char('Clé des Filtres', required=True, readonly=True)
+    batch_id = fields.Many2one('op.batch', string='Classe', ondelete='cascade', index=True, readonly=True)
+    trimestre_id = fields.Many2one('op.trimestre', string='Trimestre', ondelete='cascade', index=True, readonly=True)
+    state = fields.Char('État Filtré', readonly=True)
+    data = fields.Json('Statistiques', readonly=True)
+    # Nombre et somme des dates de modification des bulletins et lignes filtrés au moment du calcul
+    watermark = fields.Char('Filigrane', readonly=True)
+
+    _sql_constraints = [
+        ('filter_key_uniq', 'unique(filter_key)', 'Un seul instantané par combinaison de filtres.'),
+    ]
+
+    @api.model
+    def get_stats(self, trimestre_id=None, batch_id=None, state=None):
+        """Statistiques des bulletins pour ces filtres, depuis l'instantané si disponible
+
+        Un instantané n'est servi que si son filigrane correspond encore aux
+        données et qu'il a moins de STATS_SNAPSHOT_TTL_MINUTES : un calcul
+        concurrent d'une modification ne peut pas être servi au-delà.
+        """
+        trimestre_id = int(trimestre_id) if trimestre_id else None
+        batch_id = int(batch_id) if batch_id else None
+        state = state or None
+        filter_key = f"{trimestre_id or ''}:{batch_id or ''}:{state or ''}"
+        watermark = self._get_watermark(trimestre_id, batch_id, state)
+
+        self.env.cr.execute("""
+            SELECT data FROM op_bulletin_stats_snapshot
+             WHERE filter_key = %s AND watermark = %s
+               AND write_date > NOW() AT TIME ZONE 'UTC' - make_interval(mins => %s)
+        """, (filter_key, watermark, STATS_SNAPSHOT_TTL_MINUTES))
+        row = self.env.cr.fetchone()
+        if row:
+            return row[0]
+
+        data = self._compute_stats(trimestre_id, batch_id, state)
+        # ON CONFLICT : deux requêtes simultanées peuvent calculer le même instantané
+        self.env.cr.execute("""
+            INSERT INTO op_bulletin_stats_snapshot
+                   (filter_key, batch_id, trimestre_id, state, data, watermark,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+            ON CONFLICT (filter_key) DO UPDATE
+               SET data = EXCLUDED.data,
+                   watermark = EXCLUDED.watermark,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, (filter_key, batch_id, trimestre_id, state, json.dumps(data), watermark, self.env.uid, self.env.uid))
+        self.invalidate_model()
+        return data
+
+    @api.model
+    def _get_watermark(self, trimestre_id=None, batch_id=None, state=None):
+        """Filigrane des données filtrées, en une requête
+
+        Nombre de bulletins et de lignes et somme de leurs dates de
+        modification : une écriture avance la date de la ligne modifiée même
+        si une autre transaction a écrit plus tard, ce qu'un MAX() manquerait.
+        Toute création, modification ou suppression validée change donc le
+        filigrane.
+        """
+        self.env['op.bulletin'].flush_model(['trimestre_id', 'batch_id', 'state'])
+        self.env['op.bulletin.line'].flush_model(['bulletin_id'])
+        conditions = ['TRUE']
+        params = []
+        for column, value in (('trimestre_id', trimestre_id), ('batch_id', batch_id), ('state', state)):
+            if value:
+                conditions.append('b.%s = %%s' % column)
+                params.append(value)
+        self.env.cr.execute("""
+            WITH filtered AS (
+                SELECT b.id, b.write_date FROM op_bulletin b WHERE {conditions}
+            )
+            SELECT (SELECT COUNT(*) FROM filtered),
+                   (SELECT SUM(EXTRACT(EPOCH FROM write_date)) FROM filtered),
+                   COUNT(l.id), SUM(EXTRACT(EPOCH FROM l.write_date))
+              FROM op_bulletin_line l
+              JOIN filtered f ON f.id = l.bulletin_id
+        """.format(conditions=' AND '.join(conditions)), params)
+        return ':'.join(str(value) for value in self.env.cr.fetchone())
+
+    @api.model
+    def _compute_stats(self, trimestre_id=None, batch_id=None, state=None):
+        """Calculer les statistiques avec des agrégats SQL (read_group, ORDER BY ... LIMIT)"""
+        Bulletin = self.env['op.bulletin']
+        Line = self.env['op.bulletin.line']
+
+        domain = []
+        line_domain = []
+        if trimestre_id:
+            domain.append(('trimestre_id', '=', trimestre_id))
+            line_domain.append(('bulletin_id.trimestre_id', '=', trimestre_id))
+        if batch_id:
+            domain.append(('batch_id', '=', batch_id))
+            line_domain.append(('bulletin_id.batch_id', '=', batch_id))
+        if state:
+            domain.append(('state', '=', state))
+            line_domain.append(('bulletin_id.state', '=', state))
+
+        # Nombre de bulletins par état
+        bulletins_by_state = {}
+        total_bulletins = 0
+        for group in Bulletin.read_group(domain, ['state'], ['state'], lazy=False):
+            bulletins_by_state[group['state'] or 'brouillon'] = group['__count']
+            total_bulletins += group['__count']
+
+        # Moyenne générale des bulletins ayant une moyenne
+        average_group = Bulletin.read_group(
+            domain + [('moyenne_generale', '>', 0)], ['moyenne_generale:avg'], [], lazy=False
+        )
+        bulletins_with_moyenne = average_group[0]['__count'] if average_group else 0
+        average_generale = (average_group[0]['moyenne_generale'] or 0.0) if bulletins_with_moyenne else 0.0
+
+        def performer_data(bulletins):
+            return [{
+                'name': bulletin.student_id.name,
+                'moyenne': float(bulletin.moyenne_generale),
+                'batch': bulletin.batch_id.name if bulletin.batch_id else 'Non définie',
+                'trimestre': bulletin.trimestre_id.name
+            } for bulletin in bulletins]
+
+        # Top étudiants (moyenne >= 16) et étudiants en difficulté (moyenne < 10)
+        top_students = performer_data(Bulletin.search(
+            domain + [('moyenne_generale', '>=', 16)], order='moyenne_generale desc, id', limit=5
+        ))
+        low_performers = performer_data(Bulletin.search(
+            domain + [('moyenne_generale', '>', 0), ('moyenne_generale', '<', 10)],
+            order='moyenne_generale asc, id', limit=5
+        ))
+
+        # Moyennes par matière
+        subject_averages = []
+        for group in Line.read_group(
+            line_domain + [('moyenne_matiere', '>', 0)],
+            ['moyenne_matiere:avg', 'min_note:min(moyenne_matiere)', 'max_note:max(moyenne_matiere)'],
+            ['subject_id'], lazy=False
+        ):
+            subject_averages.append({
+                'subject': group['subject_id'][1] if group['subject_id'] else 'Matière inconnue',
+                'moyenne': round(group['moyenne_matiere'] or 0.0, 2),
+                'count': group['__count'],
+                'min_note': group['min_note'] or 0,
+                'max_note': group['max_note'] or 0
+            })
+
+        published_count = bulletins_by_state.get('publie', 0) + bulletins_by_state.get('published', 0)
+        pending_count = (bulletins_by_state.get('brouillon', 0) +
+                         bulletins_by_state.get('draft', 0) +
+                         bulletins_by_state.get('calcule', 0) +
+                         bulletins_by_state.get('calculated', 0))
+
+        return {
+            'total_bulletins': total_bulletins,
+            'bulletins_by_state': bulletins_by_state,
+            'average_generale': round(average_generale, 2),
+            'published': published_count,
+            'pending': pending_count,
+            'avg_general': round(average_generale, 2),  # Alias pour compatibilité
+            'top_students': top_students,
+            'low_performers': low_performers,
+            'subject_averages': subject_averages,
+            'bulletins_with_moyenne': bulletins_with_moyenne
+        }
+
+    @api.model
+    def _invalidate(self, groups):
+        """Supprimer les instantanés couvrant ces (batch_id, trimestre_id)
+
+        Un instantané sans filtre de classe ou de trimestre couvre toutes les
+        classes ou tous les trimestres.
+        """
+        groups = tuple(set(groups))
+        if not groups:
+            return
+        self.flush_model()
+        self.env.cr.execute("""
+            DELETE FROM op_bulletin_stats_snapshot s
+             WHERE EXISTS (
+                    SELECT 1
+                      FROM (VALUES %s) AS g(batch_id, trimestre_id)
+                     WHERE (s.batch_id IS NULL OR s.batch_id = g.batch_id)
+                       AND (s.trimestre_id IS NULL OR s.trimestre_id = g.trimestre_id)
+               )
+        """ % ', '.join(['(%s, %s)'] * len(groups)), [value for group in groups for value in group])
+        self.invalidate_model()
+
+    @api.model
+    def _cron_purge(self):
+        """Supprimer les instantanés expirés : une combinaison de filtres oubliée ne reste pas en base"""
+        self.env.cr.execute("""
+            DELETE FROM op_bulletin_stats_snapshot
+             WHERE write_date <= NOW() AT TIME ZONE 'UTC' - make_interval(mins => %s)
+        """, [STATS_SNAPSHOT_TTL_MINUTES])
+        self.invalidate_model()
+
 class OpBulletinTemplate(models.Model):
     _name = 'op.bulletin.template'
     _description = 'Modèle de Bulletin'
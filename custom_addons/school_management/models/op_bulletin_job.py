@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class OpBulletinGenerationJob(models.Model):
+    _name = 'op.bulletin.generation.job'
+    _description = 'Tâche de Génération de Bulletins'
+    _order = 'id desc'
+
+    # Paramètres de la génération
+    batch_id = fields.Many2one('op.batch', string='Classe', required=True, ondelete='cascade')
+    trimestre_id = fields.Many2one('op.trimestre', string='Trimestre', required=True, ondelete='cascade')
+    regenerate_existing = fields.Boolean('Régénérer les bulletins existants', default=False)
+    auto_calculate = fields.Boolean('Calculer automatiquement', default=True)
+    auto_validate = fields.Boolean('Valider automatiquement après calcul', default=False)
+    chunk_size = fields.Integer('Taille des lots', default=25,
+                                help="Nombre d'étudiants traités entre deux commits")
+
+    # File d'attente : inscriptions à traiter, dans l'ordre
+    student_course_ids = fields.Many2many('op.student.course', string='Inscriptions')
+    bulletin_ids = fields.Many2many('op.bulletin', string='Bulletins Générés')
+
+    # Avancement
+    state = fields.Selection([
+        ('pending', 'En Attente'),
+        ('running', 'En Cours'),
+        ('done', 'Terminé'),
+        ('failed', 'Échoué')
+    ], string='État', default='pending', required=True, index=True)
+    total_count = fields.Integer('Total Étudiants', readonly=True)
+    processed_count = fields.Integer('Étudiants Traités', readonly=True)
+    created_count = fields.Integer('Bulletins Créés', readonly=True)
+    updated_count = fields.Integer('Bulletins Mis à Jour', readonly=True)
+    skipped_count = fields.Integer('Bulletins Ignorés', readonly=True)
+    error_count = fields.Integer('Erreurs', readonly=True)
+    error_log = fields.Json('Erreurs par Étudiant', readonly=True)
+    summary = fields.Text('Résumé', readonly=True)
+    date_start = fields.Datetime('Début', readonly=True)
+    date_end = fields.Datetime('Fin', readonly=True)
+
+    @api.model
+    def enqueue(self, batch, trimestre, regenerate_existing=False, auto_calculate=True, auto_validate=False):
+        """Créer une tâche de génération pour une classe et déclencher son traitement"""
+        student_courses = self.env['op.student.course'].search([
+            ('batch_id', '=', batch.id),
+            ('state', '=', 'running')
+        ], order='id')
+
+        job = self.create({
+            'batch_id': batch.id,
+            'trimestre_id': trimestre.id,
+            'regenerate_existing': regenerate_existing,
+            'auto_calculate': auto_calculate,
+            'auto_validate': auto_validate,
+            'student_course_ids': [(6, 0, student_courses.ids)],
+            'total_count': len(student_courses),
+            'error_log': [],
+        })
+
+        cron = self.env.ref('school_management.ir_cron_bulletin_generation_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return job
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Traiter les tâches en attente ou interrompues"""
+        for job in self.search([('state', 'in', ['pending', 'running'])], order='id'):
+            job._run()
+
+    def _run(self, commit=True):
+        """Traiter la tâche lot par lot, avec un commit après chaque lot
+
+        Une tâche interrompue (timeout, redémarrage) reprend au premier
+        étudiant non traité lors du prochain passage du cron.
+        """
+        self.ensure_one()
+        if self.state in ('done', 'failed'):
+            return
+
+        if self.state == 'pending':
+            self.write({'state': 'running', 'date_start': fields.Datetime.now()})
+            self._commit(commit)
+
+        try:
+            while self.processed_count < self.total_count:
+                self._process_chunk()
+                self._commit(commit)
+        except Exception as e:
+            if not commit:
+                raise
+            self.env.cr.rollback()
+            _logger.exception("Erreur tâche de génération de bulletins %s", self.id)
+            self.write({
+                'state': 'failed',
+                'date_end': fields.Datetime.now(),
+                'summary': _('Génération interrompue: %s') % str(e),
+            })
+            self._commit(commit)
+            return
+
+        self.write({
+            'state': 'done',
+            'date_end': fields.Datetime.now(),
+            'summary': _('Génération terminée: %d créés, %d mis à jour, %d ignorés, %d erreurs') % (
+                self.created_count, self.updated_count, self.skipped_count, self.error_count
+            ),
+        })
+        # Un seul message pour toute la génération, sur la classe
+        if hasattr(self.batch_id, 'message_post'):
+            self.batch_id.message_post(body=_('%s - %s') % (self.trimestre_id.name, self.summary))
+        self._commit(commit)
+
+    def _commit(self, commit):
+        if commit and not self.env.registry.in_test_mode():
+            self.env.cr.commit()
+
+    def _process_chunk(self):
+        """Créer, calculer et valider les bulletins du prochain lot d'étudiants"""
+        self.ensure_one()
+        # Mode masse sans récapitulatif par lot : le récapitulatif est posté en fin de tâche
+        Bulletin = self.env['op.bulletin']._with_bulk_mode().with_context(bulletin_bulk_summary=False)
+        chunk = self.student_course_ids[self.processed_count:self.processed_count + max(self.chunk_size, 1)]
+
+        existing_by_student = {}
+        for existing in Bulletin.search([
+            ('batch_id', '=', self.batch_id.id),
+            ('trimestre_id', '=', self.trimestre_id.id),
+            ('student_id', 'in', chunk.mapped('student_id').ids)
+        ]):
+            existing_by_student.setdefault(existing.student_id.id, Bulletin)
+            existing_by_student[existing.student_id.id] |= existing
+
+        created = updated = skipped = 0
+        errors = []
+        generated = Bulletin
+        to_generate = []
+        for student_course in chunk:
+            existing = existing_by_student.get(student_course.student_id.id)
+            if existing and not self.regenerate_existing:
+                skipped += 1
+                continue
+            to_generate.append((student_course, existing))
+
+        try:
+            # Tout le lot en un create() : les numéros sont réservés en un bloc
+            with self.env.cr.savepoint():
+                for _student_course, existing in to_generate:
+                    if existing:
+                        existing.unlink()
+                generated = Bulletin.create([
+                    self._prepare_bulletin_vals(student_course) for student_course, _existing in to_generate
+                ])
+            updated = len([1 for _student_course, existing in to_generate if existing])
+            created = len(to_generate) - updated
+        except Exception:
+            # Repli étudiant par étudiant pour isoler les erreurs
+            for student_course, existing in to_generate:
+                student = student_course.student_id
+                try:
+                    with self.env.cr.savepoint():
+                        if existing:
+                            existing.unlink()
+                        generated |= Bulletin.create(self._prepare_bulletin_vals(student_course))
+                    if existing:
+                        updated += 1
+                    else:
+                        created += 1
+                except Exception as e:
+                    errors.append({'student_id': student.id, 'student_name': student.name, 'message': str(e)})
+
+        if self.auto_calculate and generated:
+            try:
+                with self.env.cr.savepoint():
+                    Bulletin.calculate_for_class(self.batch_id, self.trimestre_id, bulletins=generated)
+                    if self.auto_validate:
+                        generated.filtered(lambda b: b.state == 'calculated').action_validate()
+            except Exception as e:
+                for bulletin in generated:
+                    errors.append({
+                        'student_id': bulletin.student_id.id,
+                        'student_name': bulletin.student_id.name,
+                        'message': _('Erreur de calcul: %s') % str(e),
+                    })
+
+        self.write({
+            'processed_count': self.processed_count + len(chunk),
+            'created_count': self.created_count + created,
+            'updated_count': self.updated_count + updated,
+            'skipped_count': self.skipped_count + skipped,
+            'error_count': self.error_count + len(errors),
+            'error_log': (self.error_log or []) + errors,
+            'bulletin_ids': [(4, bulletin_id) for bulletin_id in generated.ids],
+        })
+
+    def _prepare_bulletin_vals(self, student_course):
+        """Valeurs du bulletin d'une inscription"""
+        return {
+            'student_id': student_course.student_id.id,
+            'course_id': student_course.course_id.id,
+            'batch_id': self.batch_id.id,
+            'trimestre_id': self.trimestre_id.id,
+        }
+
+    def get_job_data(self):
+        """Représentation JSON de la tâche pour l'API"""
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'batch_id': self.batch_id.id,
+            'batch_name': self.batch_id.name,
+            'trimestre_id': self.trimestre_id.id,
+            'trimestre_name': self.trimestre_id.name,
+            'state': self.state,
+            'total': self.total_count,
+            'processed': self.processed_count,
+            'progress': round(self.processed_count * 100.0 / self.total_count, 1) if self.total_count else 100.0,
+            'created_count': self.created_count,
+            'updated_count': self.updated_count,
+            'skipped_count': self.skipped_count,
+            'error_count': self.error_count,
+            'errors': self.error_log or [],
+            'summary': self.summary or '',
+            'bulletins': [{
+                'id': bulletin.id,
+                'numero': bulletin.numero_bulletin,
+                'student_name': bulletin.student_id.name,
+                'state': bulletin.state
+            } for bulletin in self.bulletin_ids] if self.state == 'done' else [],
+            'date_start': self.date_start.isoformat() if self.date_start else None,
+            'date_end': self.date_end.isoformat() if self.date_end else None,
+        }
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from datetime import datetime, timedelta
+import hashlib
+import logging
+
+from .op_schedule_grid import format_hour
+
+_logger = logging.getLogger(__name__)
+
+# Type de flux -> modèle de la ressource
+CALENDAR_FEED_KINDS = {
+    'batch': 'op.batch',
+    'faculty': 'op.faculty',
+    'student': 'op.student',
+}
+# Fenêtre publiée autour d'aujourd'hui (en jours)
+CALENDAR_PAST_DAYS = 30
+CALENDAR_FUTURE_DAYS = 180
+
+
+class OpCalendarFeed(models.AbstractModel):
+    """Flux iCalendar des classes, enseignants et étudiants
+
+    Les sessions de la fenêtre publiée deviennent des événements datés ; les
+    créneaux des emplois du temps actifs deviennent des événements
+    hebdomadaires récurrents, sans les dates déjà couvertes par une session.
+    """
+    _name = 'op.calendar.feed'
+    _description = 'Flux iCalendar des emplois du temps'
+
+    @api.model
+    def _get_window(self):
+        today = fields.Date.today()
+        return today - timedelta(days=CALENDAR_PAST_DAYS), today + timedelta(days=CALENDAR_FUTURE_DAYS)
+
+    @api.model
+    def _get_scope(self, kind, resource_id):
+        """Colonne commune à op_session et op_timetable_slot, et identifiants à filtrer
+
+        :return: (column, ids) ; (None, []) si la ressource n'existe pas
+        """
+        resource = self.env[CALENDAR_FEED_KINDS[kind]].browse(resource_id).exists()
+        if not resource:
+            return None, []
+        if kind == 'student':
+            return 'batch_id', resource.course_detail_ids.mapped('batch_id').ids
+        return '%s_id' % kind, [resource.id]
+
+    @api.model
+    def get_feed_version(self, kind, resource_id):
+        """Version du flux, en deux agrégats SQL sans lire les sessions
+
+        Le nombre de lignes couvre les suppressions, la date de dernière
+        modification couvre les créations et les mises à jour.
+
+        :return: dict etag et last_modified (datetime UTC ou None), None si la ressource n'existe pas
+        """
+        column, ids = self._get_scope(kind, resource_id)
+        if not column:
+            return None
+        window_start, window_end = self._get_window()
+        self.env['op.session'].flush_model()
+        self.env['op.timetable.slot'].flush_model()
+        self.env['op.timetable'].flush_model()
+        cr = self.env.cr
+
+        cr.execute("""
+            SELECT COUNT(*), MAX(write_date) FROM op_session
+             WHERE {column} = ANY(%s) AND date BETWEEN %s AND %s
+        """.format(column=column), [ids, window_start, window_end])
+        session_count, session_date = cr.fetchone()
+
+        slot_column = 't.batch_id' if column == 'batch_id' else 's.%s' % column
+        cr.execute("""
+            SELECT COUNT(*), GREATEST(MAX(s.write_date), MAX(t.write_date))
+              FROM op_timetable_slot s
+              JOIN op_timetable t ON t.id = s.timetable_id
+             WHERE t.state = 'active' AND {column} = ANY(%s)
+               AND t.end_date >= %s AND t.start_date <= %s
+        """.format(column=slot_column), [ids, window_start, window_end])
+        slot_count, slot_date = cr.fetchone()
+
+        dates = [value for value in (session_date, slot_date) if value]
+        last_modified = max(dates).replace(microsecond=0) if dates else None
+        signature = '%s:%s:%s:%s:%s:%s:%s' % (kind, resource_id, ','.join(map(str, ids)), window_start,
+                                              session_count, slot_count, last_modified)
+        return {
+            'etag': hashlib.sha1(signature.encode('utf-8')).hexdigest(),
+            'last_modified': last_modified,
+        }
+
+    @api.model
+    def get_feed(self, kind, resource_id):
+        """Nom du calendrier et événements prêts à sérialiser
+
+        :return: (name, events) ; name vaut None si la ressource n'existe pas
+        """
+        resource = self.env[CALENDAR_FEED_KINDS[kind]].browse(resource_id).exists()
+        if not resource:
+            return None, []
+        column, ids = self._get_scope(kind, resource_id)
+        window_start, window_end = self._get_window()
+        events = []
+
+        sessions = self.env['op.session'].search([
+            (column, 'in', ids),
+            ('date', '>=', window_start),
+            ('date', '<=', window_end),
+        ], order='start_datetime')
+        # (classe, matière, date, début) : un créneau déjà transformé en session n'est pas répété
+        session_keys = set()
+        for session in sessions:
+            session_keys.add((session.batch_id.id, session.subject_id.id, session.date, format_hour(session.start_time)))
+            events.append({
+                'uid': 'session-%s@school-management' % session.id,
+                'start': session.start_datetime,
+                'end': session.end_datetime,
+                'summary': session.subject_id.name or session.name,
+                'location': session.classroom_id.name,
+                'description': ' - '.join(name for name in (session.batch_id.name, session.faculty_id.name) if name),
+                'status': 'CANCELLED' if session.state == 'cancel' else 'CONFIRMED',
+                'last_modified': session.write_date,
+            })
+
+        slot_field = 'timetable_id.batch_id' if column == 'batch_id' else column
+        slots = self.env['op.timetable.slot'].search([
+            (slot_field, 'in', ids),
+            ('timetable_id.state', '=', 'active'),
+            ('timetable_id.end_date', '>=', window_start),
+            ('timetable_id.start_date', '<=', window_end),
+        ])
+        for slot in slots:
+            timetable = slot.timetable_id
+            first_day = max(timetable.start_date, window_start)
+            first_day += timedelta(days=(int(slot.day_of_week) - first_day.weekday()) % 7)
+            last_day = min(timetable.end_date, window_end)
+            if first_day > last_day:
+                continue
+            start_hour = format_hour(slot.start_time)
+            exdates = []
+            day = first_day
+            while day <= last_day:
+                if (timetable.batch_id.id, slot.subject_id.id, day, start_hour) in session_keys:
+                    exdates.append(datetime.combine(day, datetime.min.time()) + timedelta(hours=slot.start_time))
+                day += timedelta(days=7)
+            day_start = datetime.combine(first_day, datetime.min.time())
+            events.append({
+                'uid': 'slot-%s@school-management' % slot.id,
+                'start': day_start + timedelta(hours=slot.start_time),
+                'end': day_start + timedelta(hours=slot.end_time),
+                'until': last_day,
+                'exdates': exdates,
+                'summary': slot.subject_id.name or timetable.name,
+                'location': slot.classroom_id.name,
+                'description': ' - '.join(name for name in (timetable.batch_id.name, slot.faculty_id.name) if name),
+                'status': 'CONFIRMED',
+                'last_modified': max(slot.write_date, timetable.write_date),
+            })
+
+        return resource.name, events
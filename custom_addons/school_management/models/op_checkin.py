@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.modules.registry import Registry
+from datetime import timedelta
+import atexit
+import logging
+import threading
+import time
+
+from .checkin_buffer import CheckinBuffer
+
+_logger = logging.getLogger(__name__)
+
+# Passages écrits par lot : tous les N passages ou au plus tard après T millisecondes
+CHECKIN_FLUSH_SIZE = 100
+CHECKIN_FLUSH_INTERVAL_MS = 500
+# Durée de vie de l'index des badges ; un badge inconnu force une relecture au plus toutes les 30 s
+CHECKIN_INDEX_TTL_SECONDS = 300
+CHECKIN_INDEX_MISS_REFRESH_SECONDS = 30
+# Intervalle de vérification de la version des badges en base : un badge retiré
+# ou réattribué dans un autre worker cesse d'être accepté après ce délai
+CHECKIN_INDEX_VERSION_CHECK_SECONDS = 5
+# Tolérance avant qu'un passage après le début du premier cours ne compte comme un retard
+CHECKIN_LATE_GRACE_MINUTES = 5
+# Champs de op.student lus dans l'index des badges
+STUDENT_TOKEN_FIELDS = ('checkin_token', 'gr_no')
+
+# Par base de données : tampon d'écriture et index {badge: (student_id, nom)}
+_buffers = {}
+_token_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def _write_checkins(dbname, rows):
+    """Insérer un lot de passages dans sa propre transaction"""
+    with Registry(dbname).cursor() as cr:
+        cr.execute("""
+            INSERT INTO op_checkin
+                   (student_id, scanned_at, method, gate, reconciled,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT u.student_id, u.scanned_at, u.method, u.gate, FALSE,
+                   u.uid, NOW() AT TIME ZONE 'UTC', u.uid, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::timestamp[], %s::varchar[], %s::varchar[], %s::int[])
+                   AS u(student_id, scanned_at, method, gate, uid)
+        """, [
+            [row['student_id'] for row in rows],
+            [row['scanned_at'] for row in rows],
+            [row['method'] for row in rows],
+            [row['gate'] for row in rows],
+            [row['uid'] for row in rows],
+        ])
+
+
+def get_checkin_buffer(dbname):
+    with _registry_lock:
+        buffer = _buffers.get(dbname)
+        if buffer is None:
+            buffer = _buffers[dbname] = CheckinBuffer(
+                lambda rows: _write_checkins(dbname, rows),
+                flush_size=CHECKIN_FLUSH_SIZE,
+                flush_interval_ms=CHECKIN_FLUSH_INTERVAL_MS,
+            )
+        return buffer
+
+
+@atexit.register
+def _flush_all_buffers():
+    """Arrêt du serveur : écrire les passages encore en mémoire"""
+    for buffer in list(_buffers.values()):
+        buffer.flush()
+
+
+class OpCheckin(models.Model):
+    """Journal des passages au portail (badge ou QR code)
+
+    Chaque passage est validé contre un index des badges gardé en mémoire,
+    puis ajouté à un tampon écrit par lots dans sa propre transaction : la
+    requête de scan ne fait aucune écriture. Une tâche planifiée reporte
+    ensuite le premier passage de chaque élève sur la présence de son premier
+    cours de la journée.
+    """
+    _name = 'op.checkin'
+    _description = 'Passage au portail'
+    _order = 'scanned_at desc, id desc'
+
+    student_id = fields.Many2one('op.student', 'Étudiant', required=True, index=True, ondelete='cascade')
+    scanned_at = fields.Datetime('Passage', required=True, index=True)
+    method = fields.Selection([
+        ('badge', 'Badge'),
+        ('qr', 'QR code'),
+    ], string='Moyen', required=True, default='badge')
+    gate = fields.Char('Portail')
+    reconciled = fields.Boolean('Reporté sur les présences', default=False, index=True)
+
+    # ------------------------------------------------------------------
+    # Index des badges
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _load_token_index(self):
+        """Construire l'index {badge: (student_id, nom)} des élèves actifs"""
+        tokens = {}
+        for student in self.env['op.student'].sudo().search_read(
+                [], list(STUDENT_TOKEN_FIELDS) + ['first_name', 'middle_name', 'last_name']):
+            name = ' '.join(part for part in (student['first_name'], student['middle_name'], student['last_name']) if part)
+            for field_name in STUDENT_TOKEN_FIELDS:
+                if student.get(field_name):
+                    tokens.setdefault(student[field_name].strip(), (student['id'], name))
+        return tokens
+
+    @api.model
+    def _get_token_index_version(self):
+        """Version des badges en base, partagée par tous les workers
+
+        Nombre d'élèves et somme de leurs dates de modification : toute
+        attribution, modification, archivage ou suppression validée la change.
+        """
+        self.env['op.student'].flush_model()
+        self.env.cr.execute("SELECT COUNT(*), SUM(EXTRACT(EPOCH FROM write_date)) FROM op_student")
+        return self.env.cr.fetchone()
+
+    @api.model
+    def _resolve_token(self, token):
+        """Élève d'un badge ; l'index est relu à expiration, sur badge inconnu
+        ou quand la version des badges en base a changé
+
+        :return: (student_id, nom) ou None
+        """
+        token = (token or '').strip()
+        if not token:
+            return None
+        dbname = self.env.cr.dbname
+        now = time.monotonic()
+        index = _token_indexes.get(dbname)
+        stale = index is None or now - index['loaded_at'] > CHECKIN_INDEX_TTL_SECONDS
+        if not stale and token not in index['tokens'] and now - index['loaded_at'] > CHECKIN_INDEX_MISS_REFRESH_SECONDS:
+            stale = True
+        version = None
+        if not stale and now - index['checked_at'] > CHECKIN_INDEX_VERSION_CHECK_SECONDS:
+            version = self._get_token_index_version()
+            stale = version != index['version']
+            index['checked_at'] = now
+        if stale:
+            version = version or self._get_token_index_version()
+            index = _token_indexes[dbname] = {
+                'tokens': self._load_token_index(),
+                'version': version,
+                'loaded_at': now,
+                'checked_at': now,
+            }
+        return index['tokens'].get(token)
+
+    @api.model
+    def _invalidate_token_index(self):
+        _token_indexes.pop(self.env.cr.dbname, None)
+
+    # ------------------------------------------------------------------
+    # Enregistrement
+    # ------------------------------------------------------------------
+
+    @api.model
+    def record_scan(self, token, method='badge', gate=None, scanned_at=None):
+        """Valider un badge et mettre le passage en attente d'écriture
+
+        :return: dict student_id, name, buffered ; None si le badge est inconnu
+        """
+        student = self._resolve_token(token)
+        if not student:
+            return None
+        buffer = get_checkin_buffer(self.env.cr.dbname)
+        buffered = buffer.add({
+            'student_id': student[0],
+            'scanned_at': scanned_at or fields.Datetime.now(),
+            'method': method,
+            'gate': gate,
+            'uid': self.env.uid,
+        })
+        return {'student_id': student[0], 'name': student[1], 'buffered': buffered, 'pending': len(buffer)}
+
+    # ------------------------------------------------------------------
+    # Report sur les présences
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _local_datetime(self, value):
+        """Heure UTC d'un passage -> heure locale naïve, comme les horaires des sessions"""
+        return fields.Datetime.context_timestamp(self, value).replace(tzinfo=None)
+
+    @api.model
+    def _cron_reconcile(self):
+        """Reporter les passages en attente sur le premier cours du jour de chaque élève"""
+        get_checkin_buffer(self.env.cr.dbname).flush()
+        # Passages en attente, avec ceux déjà reportés des mêmes jours pour retrouver le premier
+        self.env.cr.execute("""
+            SELECT id, student_id, scanned_at, reconciled FROM op_checkin
+             WHERE scanned_at >= (SELECT MIN(scanned_at) FROM op_checkin WHERE NOT reconciled) - INTERVAL '1 day'
+             ORDER BY scanned_at
+        """)
+        # Premier passage de chaque (élève, jour local) et identifiants des passages en attente
+        first_scans = {}
+        checkin_ids = {}
+        for checkin_id, student_id, scanned_at, reconciled in self.env.cr.fetchall():
+            local = self._local_datetime(scanned_at)
+            key = (student_id, local.date())
+            first_scans.setdefault(key, (scanned_at, local, reconciled))
+            if not reconciled:
+                checkin_ids.setdefault(key, []).append(checkin_id)
+        # Le premier passage de la journée est déjà reporté : les suivants n'y changent rien
+        done_keys = [key for key in checkin_ids if first_scans[key][2]]
+        first_scans = {key: first_scans[key][:2] for key in checkin_ids if not first_scans[key][2]}
+
+        student_ids = list({student_id for student_id, _day in first_scans})
+        days = list({day for _student_id, day in first_scans})
+        batches_by_student = {}
+        for enrolment in self.env['op.student.course'].sudo().search_read(
+                [('student_id', 'in', student_ids), ('state', '=', 'running')], ['student_id', 'batch_id']):
+            if enrolment['batch_id']:
+                batches_by_student.setdefault(enrolment['student_id'][0], set()).add(enrolment['batch_id'][0])
+
+        first_sessions = {}
+        batch_ids = list({batch_id for batch_ids in batches_by_student.values() for batch_id in batch_ids})
+        for session in self.env['op.session'].sudo().search_read([
+            ('batch_id', 'in', batch_ids),
+            ('date', 'in', days),
+            ('state', '!=', 'cancel'),
+        ], ['batch_id', 'date', 'start_datetime'], order='start_datetime'):
+            first_sessions.setdefault((session['batch_id'][0], session['date']), session)
+
+        rows = []
+        today = fields.Date.context_today(self)
+        for (student_id, day), (scanned_at, local) in first_scans.items():
+            candidates = [first_sessions[(batch_id, day)] for batch_id in batches_by_student.get(student_id, ())
+                          if (batch_id, day) in first_sessions]
+            if not candidates:
+                # Pas de cours ce jour : rien à reporter une fois la journée passée
+                if day < today:
+                    done_keys.append((student_id, day))
+                continue
+            session = min(candidates, key=lambda candidate: candidate['start_datetime'])
+            late = local > session['start_datetime'] + timedelta(minutes=CHECKIN_LATE_GRACE_MINUTES)
+            rows.append({
+                'session_id': session['id'],
+                'student_id': student_id,
+                'state': 'late' if late else 'present',
+                'arrival_time': local.hour + local.minute / 60.0,
+                'marked_date': scanned_at,
+            })
+            done_keys.append((student_id, day))
+
+        # Un appel du professeur saisi après le passage l'emporte
+        written = self.env['op.attendance'].sudo()._upsert_attendance(rows, last_writer_wins=True)
+        reconciled_ids = [checkin_id for key in done_keys for checkin_id in checkin_ids[key]]
+        if reconciled_ids:
+            self.env.cr.execute("""
+                UPDATE op_checkin SET reconciled = TRUE,
+                       write_uid = %s, write_date = NOW() AT TIME ZONE 'UTC'
+                 WHERE id = ANY(%s)
+            """, [self.env.uid, reconciled_ids])
+            self.invalidate_model(['reconciled'])
+        _logger.info("Passages au portail : %s présence(s) reportée(s) sur %s élève(s)-jour", len(written), len(done_keys))
+        return len(written)
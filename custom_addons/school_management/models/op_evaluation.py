@@ -3,6 +3,9 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 
+# Champs d'une évaluation dont dépendent les lignes de bulletin
+EVALUATION_NOTES_FIELDS = {'state', 'subject_id', 'batch_id', 'date', 'max_marks', 'evaluation_type_id', 'name'}
+
 class OpEvaluationType(models.Model):
     _name = 'op.evaluation.type'
     _description = 'Type d\'évaluation'
@@ -49,6 +52,34 @@ class OpEvaluationLine(models.Model):
             if record.note < 0 or record.note > record.evaluation_id.max_marks:
                 raise ValidationError(_('La note doit être comprise entre 0 et la note maximale.'))
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super(OpEvaluationLine, self).create(vals_list)
+        lines._mark_bulletin_notes_dirty()
+        return lines
+
+    def write(self, vals):
+        notes_changed = bool({'note', 'student_id', 'evaluation_id'}.intersection(vals))
+        if notes_changed:
+            self._mark_bulletin_notes_dirty()
+        res = super(OpEvaluationLine, self).write(vals)
+        if notes_changed:
+            self._mark_bulletin_notes_dirty()
+        return res
+
+    def unlink(self):
+        self._mark_bulletin_notes_dirty()
+        return super(OpEvaluationLine, self).unlink()
+
+    def _mark_bulletin_notes_dirty(self):
+        """Planifier le recalcul des lignes de bulletin des élèves concernés"""
+        self.env['op.bulletin']._mark_notes_dirty({
+            (line.evaluation_id.batch_id.id, line.student_id.id,
+             line.evaluation_id.subject_id.id, line.evaluation_id.date)
+            for line in self
+            if line.evaluation_id.state == 'done'
+        })
+
 class OpEvaluation(models.Model):
     _name = 'op.evaluation'
     _description = 'Évaluation'
@@ -73,6 +104,31 @@ class OpEvaluation(models.Model):
     ], string='État', default='draft', tracking=True)
     evaluation_line_ids = fields.One2many('op.evaluation.line', 'evaluation_id', string='Notes')
 
+    def write(self, vals):
+        notes_changed = bool(EVALUATION_NOTES_FIELDS.intersection(vals))
+        if notes_changed:
+            self._mark_bulletin_notes_dirty()
+        res = super(OpEvaluation, self).write(vals)
+        if notes_changed:
+            self._mark_bulletin_notes_dirty()
+        return res
+
+    def unlink(self):
+        self._mark_bulletin_notes_dirty()
+        return super(OpEvaluation, self).unlink()
+
+    def _mark_bulletin_notes_dirty(self):
+        """Planifier le recalcul de la matière pour toute la classe
+
+        Une évaluation terminée compte pour tous les élèves de la classe, même
+        ceux sans note : elle détermine si la matière a été évaluée.
+        """
+        self.env['op.bulletin']._mark_notes_dirty({
+            (evaluation.batch_id.id, None, evaluation.subject_id.id, evaluation.date)
+            for evaluation in self
+            if evaluation.state == 'done'
+        })
+
     @api.onchange('course_id')
     def _onchange_course_id(self):
         if self.course_id:
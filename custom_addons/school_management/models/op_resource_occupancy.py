@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+import math
+
+_logger = logging.getLogger(__name__)
+
+# Découpage d'une journée en tranches de 15 minutes : 96 bits par jour
+BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+# Sessions passées conservées dans l'index (en jours)
+OCCUPANCY_HISTORY_DAYS = 7
+OCCUPANCY_PRECOMMIT_KEY = 'op.resource.occupancy'
+# Type de ressource -> colonne commune à op_timetable_slot et op_session
+RESOURCE_FIELDS = {
+    'classroom': 'classroom_id',
+    'faculty': 'faculty_id',
+}
+
+
+def interval_mask(start, end):
+    """Masque des tranches couvertes par [start, end[ (heures décimales)"""
+    first = max(0, int(math.floor(start * 60 / BUCKET_MINUTES + 1e-9)))
+    last = min(BUCKETS_PER_DAY, int(math.ceil(end * 60 / BUCKET_MINUTES - 1e-9)))
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def parse_hour(value):
+    """'08:30', '8h30' ou '8.5' -> 8.5 ; None si la valeur est invalide"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower().replace('h', ':')
+    try:
+        if ':' in text:
+            hours, minutes = text.split(':', 1)
+            return int(hours) + int(minutes or 0) / 60.0
+        return float(text)
+    except ValueError:
+        return None
+
+
+class OpResourceOccupancy(models.Model):
+    """Occupation des salles et des enseignants, en bitmaps de 15 minutes
+
+    Une ligne sans date décrit une semaine type (créneaux des emplois du temps
+    actifs), valable sur la période de son emploi du temps ; une ligne datée
+    décrit un jour précis (sessions). La disponibilité d'une ressource pour un
+    jour se lit en un OU binaire des deux, quel que soit le nombre de créneaux
+    et de sessions.
+    """
+    _name = 'op.resource.occupancy'
+    _description = 'Occupation des salles et des enseignants'
+
+    resource_type = fields.Selection([
+        ('classroom', 'Salle'),
+        ('faculty', 'Enseignant'),
+    ], string='Type de ressource', required=True, index=True)
+    resource_id = fields.Integer('Ressource', required=True, index=True)
+    date = fields.Date('Date', index=True, help="Vide pour la semaine type des emplois du temps actifs")
+    day_of_week = fields.Integer('Jour de la semaine', required=True, help="0 = lundi")
+    # Période de l'emploi du temps d'une ligne de semaine type
+    valid_from = fields.Date('Valable du')
+    valid_to = fields.Date('Valable jusqu\'au')
+    bitmap = fields.Char('Occupation', required=True, help="Tranches de 15 minutes occupées (hexadécimal)")
+
+    # ------------------------------------------------------------------
+    # Maintenance de l'index
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_record_resources(self, records):
+        """Ressources (type, id) utilisées par des créneaux ou des sessions"""
+        resources = set()
+        records = records.sudo()
+        for resource_type, field_name in RESOURCE_FIELDS.items():
+            for resource in records.mapped(field_name):
+                resources.add((resource_type, resource.id))
+        return resources
+
+    @api.model
+    def _mark_dirty(self, resources):
+        """Recalculer l'occupation de ces ressources avant le commit"""
+        resources = {resource for resource in resources if resource[1]}
+        if not resources:
+            return
+        pending = self.env.cr.precommit.data.setdefault(OCCUPANCY_PRECOMMIT_KEY, set())
+        if not pending:
+            self.env.cr.precommit.add(self._flush_dirty)
+        pending.update(resources)
+
+    @api.model
+    def _mark_records_dirty(self, records):
+        self._mark_dirty(self._get_record_resources(records))
+
+    @api.model
+    def _flush_dirty(self):
+        pending = self.env.cr.precommit.data.pop(OCCUPANCY_PRECOMMIT_KEY, set())
+        if pending:
+            self._recompute(pending)
+
+    @api.model
+    def _recompute(self, resources):
+        """Reconstruire en SQL les bitmaps des ressources données
+
+        :param resources: itérable de couples (resource_type, resource_id)
+        """
+        ids_by_type = {}
+        for resource_type, resource_id in resources:
+            ids_by_type.setdefault(resource_type, set()).add(resource_id)
+        if not ids_by_type:
+            return
+
+        self.env['op.timetable.slot'].flush_model()
+        self.env['op.timetable'].flush_model(['state', 'start_date', 'end_date'])
+        self.env['op.session'].flush_model()
+        cr = self.env.cr
+        since = fields.Date.today() - timedelta(days=OCCUPANCY_HISTORY_DAYS)
+
+        for resource_type, resource_ids in ids_by_type.items():
+            column = RESOURCE_FIELDS[resource_type]
+            resource_ids = list(resource_ids)
+            masks = {}
+
+            # Semaine type par période d'emploi du temps : une salle n'est pas
+            # occupée en dehors des dates de son emploi du temps
+            cr.execute("""
+                SELECT s.{column}, s.day_of_week, s.start_time, s.end_time, t.start_date, t.end_date
+                  FROM op_timetable_slot s
+                  JOIN op_timetable t ON t.id = s.timetable_id
+                 WHERE t.state = 'active' AND s.{column} = ANY(%s)
+                   AND t.end_date >= %s
+            """.format(column=column), [resource_ids, since])
+            for resource_id, day_of_week, start, end, valid_from, valid_to in cr.fetchall():
+                key = (resource_id, None, int(day_of_week), valid_from, valid_to)
+                masks[key] = masks.get(key, 0) | interval_mask(start, end)
+
+            cr.execute("""
+                SELECT {column}, date, start_time, end_time
+                  FROM op_session
+                 WHERE {column} = ANY(%s)
+                   AND date >= %s
+                   AND COALESCE(state, '') != 'cancel'
+            """.format(column=column), [resource_ids, since])
+            for resource_id, day, start, end in cr.fetchall():
+                key = (resource_id, day, day.weekday(), None, None)
+                masks[key] = masks.get(key, 0) | interval_mask(start, end)
+
+            cr.execute("""
+                DELETE FROM op_resource_occupancy
+                 WHERE resource_type = %s AND resource_id = ANY(%s)
+            """, [resource_type, resource_ids])
+            rows = [(key, mask) for key, mask in masks.items() if mask]
+            if rows:
+                cr.execute("""
+                    INSERT INTO op_resource_occupancy
+                           (resource_type, resource_id, date, day_of_week, valid_from, valid_to, bitmap,
+                            create_uid, create_date, write_uid, write_date)
+                    SELECT %s, u.resource_id, u.date, u.day_of_week, u.valid_from, u.valid_to, u.bitmap,
+                           %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC'
+                      FROM unnest(%s::int[], %s::date[], %s::int[], %s::date[], %s::date[], %s::varchar[])
+                           AS u(resource_id, date, day_of_week, valid_from, valid_to, bitmap)
+                """, [
+                    resource_type, self.env.uid, self.env.uid,
+                    [key[0] for key, _mask in rows],
+                    [key[1] for key, _mask in rows],
+                    [key[2] for key, _mask in rows],
+                    [key[3] for key, _mask in rows],
+                    [key[4] for key, _mask in rows],
+                    ['%x' % mask for _key, mask in rows],
+                ])
+        self.invalidate_model()
+
+    @api.model
+    def _rebuild_all(self):
+        """Reconstruire tout l'index (ressources des emplois du temps actifs et des sessions récentes)"""
+        self.env['op.timetable.slot'].flush_model()
+        self.env['op.timetable'].flush_model(['state', 'end_date'])
+        self.env['op.session'].flush_model()
+        since = fields.Date.today() - timedelta(days=OCCUPANCY_HISTORY_DAYS)
+        resources = set()
+        for resource_type, column in RESOURCE_FIELDS.items():
+            self.env.cr.execute("""
+                SELECT s.{column}
+                  FROM op_timetable_slot s
+                  JOIN op_timetable t ON t.id = s.timetable_id
+                 WHERE t.state = 'active' AND t.end_date >= %s AND s.{column} IS NOT NULL
+                 UNION
+                SELECT {column} FROM op_session WHERE {column} IS NOT NULL AND date >= %s
+            """.format(column=column), [since, since])
+            resources.update((resource_type, row[0]) for row in self.env.cr.fetchall())
+        self.env.cr.execute("DELETE FROM op_resource_occupancy")
+        self._recompute(resources)
+        _logger.info("Index d'occupation reconstruit pour %s ressources", len(resources))
+
+    @api.model
+    def _cron_rebuild(self):
+        """Reconstruction quotidienne : purge les jours passés"""
+        self._rebuild_all()
+
+    # ------------------------------------------------------------------
+    # Interrogation
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _read_masks(self, resource_type, day):
+        """Occupation de chaque ressource pour un jour
+
+        L'index est construit à l'installation et à la mise à jour du module,
+        puis entretenu par les écritures et la tâche planifiée : une lecture
+        ne le reconstruit jamais.
+
+        :param day: date précise, ou jour de la semaine (0 = lundi) pour la
+                    seule semaine type des emplois du temps en cours ou à venir
+        :return: dict {resource_id: masque}
+        """
+        if isinstance(day, int):
+            self.env.cr.execute("""
+                SELECT resource_id, bitmap FROM op_resource_occupancy
+                 WHERE resource_type = %s AND date IS NULL AND day_of_week = %s
+                   AND valid_to >= %s
+            """, [resource_type, day, fields.Date.context_today(self)])
+        else:
+            self.env.cr.execute("""
+                SELECT resource_id, bitmap FROM op_resource_occupancy
+                 WHERE resource_type = %s
+                   AND (date = %s OR (date IS NULL AND day_of_week = %s
+                                      AND %s BETWEEN valid_from AND valid_to))
+            """, [resource_type, day, day.weekday(), day])
+        masks = {}
+        for resource_id, bitmap in self.env.cr.fetchall():
+            masks[resource_id] = masks.get(resource_id, 0) | int(bitmap, 16)
+        return masks
+
+    @api.model
+    def get_free_resources(self, resource_type, day, start, end, resource_ids):
+        """Ressources libres sur [start, end[ parmi resource_ids
+
+        :return: liste d'identifiants, dans l'ordre de resource_ids
+        """
+        wanted = interval_mask(start, end)
+        masks = self._read_masks(resource_type, day)
+        return [resource_id for resource_id in resource_ids
+                if not masks.get(resource_id, 0) & wanted]
+
+    @api.model
+    def get_busy_minutes(self, resource_type, day):
+        """Minutes occupées par ressource pour un jour (charge du jour)"""
+        return {resource_id: bin(mask).count('1') * BUCKET_MINUTES
+                for resource_id, mask in self._read_masks(resource_type, day).items()}
+
+    @api.model
+    def get_weekly_load(self, resource_type, week_start):
+        """Minutes occupées par ressource sur la semaine commençant à week_start
+
+        Semaine type et sessions datées sont combinées jour par jour : une
+        session générée depuis un créneau n'est pas comptée deux fois.
+        """
+        # Une ligne de semaine type ne compte que si son jour de la semaine tombe dans sa période
+        self.env.cr.execute("""
+            SELECT resource_id, day_of_week, bitmap FROM op_resource_occupancy
+             WHERE resource_type = %s
+               AND (date BETWEEN %s AND %s
+                    OR (date IS NULL
+                        AND %s::date + (day_of_week - %s + 7) %% 7 BETWEEN valid_from AND valid_to))
+        """, [resource_type, week_start, week_start + timedelta(days=6), week_start, week_start.weekday()])
+        masks = {}
+        for resource_id, day_of_week, bitmap in self.env.cr.fetchall():
+            key = (resource_id, day_of_week)
+            masks[key] = masks.get(key, 0) | int(bitmap, 16)
+        load = {}
+        for (resource_id, _day), mask in masks.items():
+            load[resource_id] = load.get(resource_id, 0) + bin(mask).count('1') * BUCKET_MINUTES
+        return load
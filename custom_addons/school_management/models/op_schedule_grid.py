@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from datetime import timedelta
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+SCHEDULE_GRID_PRECOMMIT_KEY = 'op.schedule.grid'
+# Type de grille -> (modèle de la ressource, champ sur op.session et op.timetable.slot)
+SCHEDULE_GRID_KINDS = {
+    'batch': ('op.batch', 'batch_id'),
+    'faculty': ('op.faculty', 'faculty_id'),
+    'classroom': ('op.classroom', 'classroom_id'),
+}
+# Durée de vie d'une grille : les noms (matières, salles...) sont rafraîchis au moins une fois par jour
+SCHEDULE_GRID_MAX_AGE_HOURS = 24
+DAY_NAMES = ('Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche')
+
+
+def format_hour(value):
+    """8.5 -> '08:30'"""
+    value = value or 0.0
+    hours = int(value)
+    minutes = int(round((value - hours) * 60))
+    if minutes == 60:
+        hours, minutes = hours + 1, 0
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def week_start_of(day):
+    """Lundi de la semaine contenant day"""
+    return day - timedelta(days=day.weekday())
+
+
+class OpScheduleGrid(models.Model):
+    """Grille hebdomadaire précalculée d'une classe, d'un enseignant ou d'une salle
+
+    Construite depuis les sessions de la semaine et les créneaux des emplois du
+    temps actifs, puis servie telle quelle jusqu'à la prochaine modification
+    d'une session ou d'un créneau concerné.
+    """
+    _name = 'op.schedule.grid'
+    _description = 'Grille hebdomadaire d\'emploi du temps'
+
+    kind = fields.Selection([
+        ('batch', 'Classe'),
+        ('faculty', 'Enseignant'),
+        ('classroom', 'Salle'),
+    ], string='Type', required=True, readonly=True)
+    resource_id = fields.Integer('Ressource', required=True, readonly=True)
+    week_start = fields.Date('Début de semaine', required=True, readonly=True)
+    data = fields.Json('Grille', readonly=True)
+    version = fields.Char('Version des Données', readonly=True)
+
+    _sql_constraints = [
+        ('grid_uniq', 'unique(kind, resource_id, week_start)', 'Une seule grille par ressource et par semaine.'),
+    ]
+
+    # ------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------
+
+    @api.model
+    def get_grid(self, kind, resource_id, day=None):
+        """Grille de la semaine contenant day (aujourd'hui par défaut)"""
+        week_start = week_start_of(day or fields.Date.today())
+        return self._get_grids(kind, [resource_id], week_start)[resource_id]
+
+    @api.model
+    def _get_grids(self, kind, resource_ids, week_start):
+        """Grilles d'une semaine pour plusieurs ressources
+
+        Une grille n'est servie que si sa version correspond aux données
+        actuelles : une grille calculée par une lecture concurrente avant une
+        écriture peut être enregistrée après la suppression faite par cette
+        écriture, mais elle porte l'ancienne version et n'est jamais servie.
+        Versions et grilles en cache sont lues en deux requêtes quel que soit
+        le nombre de ressources ; seules les grilles manquantes sont calculées.
+
+        :return: dict {resource_id: grille}
+        """
+        resource_ids = list(dict.fromkeys(resource_ids))
+        if not resource_ids:
+            return {}
+        versions = self._get_versions(kind, resource_ids, week_start)
+        self.env.cr.execute("""
+            SELECT resource_id, data, version FROM op_schedule_grid
+             WHERE kind = %s AND resource_id = ANY(%s) AND week_start = %s
+               AND write_date > NOW() AT TIME ZONE 'UTC' - make_interval(hours => %s)
+        """, [kind, resource_ids, week_start, SCHEDULE_GRID_MAX_AGE_HOURS])
+        grids = {
+            resource_id: data
+            for resource_id, data, version in self.env.cr.fetchall()
+            if version == versions[resource_id]
+        }
+
+        for resource_id in resource_ids:
+            if resource_id in grids:
+                continue
+            data = grids[resource_id] = self._compute_grid(kind, resource_id, week_start)
+            # ON CONFLICT : grille expirée ou périmée, ou calculée en même temps par une autre requête
+            self.env.cr.execute("""
+                INSERT INTO op_schedule_grid
+                       (kind, resource_id, week_start, data, version,
+                        create_uid, create_date, write_uid, write_date)
+                VALUES (%s, %s, %s, %s, %s, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC')
+                ON CONFLICT (kind, resource_id, week_start)
+                DO UPDATE SET data = EXCLUDED.data, version = EXCLUDED.version,
+                              write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+            """, (kind, resource_id, week_start, json.dumps(data), versions[resource_id],
+                  self.env.uid, self.env.uid))
+        return grids
+
+    @api.model
+    def _get_versions(self, kind, resource_ids, week_start):
+        """Version des sessions et créneaux de la semaine de chaque ressource
+
+        Nombre de lignes et somme de leurs dates de modification, comme le
+        filigrane des statistiques de bulletins : une écriture validée par une
+        transaction commencée plus tôt change la somme, ce qu'un MAX()
+        manquerait. Les suppressions et les sorties de périmètre changent le
+        nombre.
+
+        :return: dict {resource_id: version}
+        """
+        _model, field_name = SCHEDULE_GRID_KINDS[kind]
+        self.env['op.session'].flush_model()
+        self.env['op.timetable.slot'].flush_model()
+        self.env['op.timetable'].flush_model()
+        slot_column = 't.batch_id' if kind == 'batch' else 's.%s' % field_name
+        self.env.cr.execute("""
+            WITH sessions AS (
+                SELECT {column} AS resource_id, COUNT(*) AS total,
+                       SUM(EXTRACT(EPOCH FROM write_date)) AS stamp
+                  FROM op_session
+                 WHERE {column} = ANY(%(ids)s) AND date BETWEEN %(start)s AND %(end)s
+              GROUP BY {column}
+            ),
+            slots AS (
+                SELECT {slot_column} AS resource_id, COUNT(*) AS total,
+                       SUM(EXTRACT(EPOCH FROM s.write_date) + EXTRACT(EPOCH FROM t.write_date)) AS stamp
+                  FROM op_timetable_slot s
+                  JOIN op_timetable t ON t.id = s.timetable_id
+                 WHERE t.state = 'active' AND {slot_column} = ANY(%(ids)s)
+                   AND t.start_date <= %(end)s AND t.end_date >= %(start)s
+              GROUP BY {slot_column}
+            )
+            SELECT r.id, COALESCE(se.total, 0), se.stamp, COALESCE(sl.total, 0), sl.stamp
+              FROM unnest(%(ids)s::int[]) AS r(id)
+         LEFT JOIN sessions se ON se.resource_id = r.id
+         LEFT JOIN slots sl ON sl.resource_id = r.id
+        """.format(column=field_name, slot_column=slot_column), {
+            'ids': resource_ids,
+            'start': week_start,
+            'end': week_start + timedelta(days=6),
+        })
+        return {row[0]: ':'.join(str(value) for value in row[1:]) for row in self.env.cr.fetchall()}
+
+    @api.model
+    def get_day_entries(self, kind, resource_ids, day, entry_type=None):
+        """Entrées d'un jour pour plusieurs ressources, triées par heure"""
+        return self.get_range_entries(kind, resource_ids, day, day, entry_type)
+
+    @api.model
+    def get_range_entries(self, kind, resource_ids, date_from, date_to, entry_type=None):
+        """Entrées de plusieurs ressources entre deux dates incluses
+
+        Chaque entrée porte sa date ; elles sont triées par date puis par heure.
+        """
+        entries = []
+        week_start = week_start_of(date_from)
+        while week_start <= date_to:
+            for grid in self._get_grids(kind, resource_ids, week_start).values():
+                for grid_day in grid['days']:
+                    if not date_from.isoformat() <= grid_day['date'] <= date_to.isoformat():
+                        continue
+                    entries.extend(dict(entry, date=grid_day['date']) for entry in grid_day['entries']
+                                   if not entry_type or entry['type'] == entry_type)
+            week_start += timedelta(days=7)
+        entries.sort(key=lambda entry: (entry['date'], entry['start_time'], entry['end_time']))
+        return entries
+
+    @api.model
+    def get_school_entries(self, date_from, date_to, entry_type=None):
+        """Entrées de toute l'école entre deux dates, lues dans les grilles des classes
+
+        Une session n'appartient qu'à une classe : chaque entrée n'apparaît
+        qu'une fois.
+        """
+        self.env['op.session'].flush_model(['batch_id', 'date'])
+        self.env.cr.execute("""
+            SELECT batch_id FROM op_session
+             WHERE batch_id IS NOT NULL AND date BETWEEN %(start)s AND %(end)s
+            UNION
+            SELECT t.batch_id FROM op_timetable t
+             WHERE %(slots)s AND t.batch_id IS NOT NULL AND t.state = 'active'
+               AND t.start_date <= %(end)s AND t.end_date >= %(start)s
+        """, {'start': date_from, 'end': date_to, 'slots': entry_type != 'session'})
+        batch_ids = sorted(row[0] for row in self.env.cr.fetchall())
+        return self.get_range_entries('batch', batch_ids, date_from, date_to, entry_type)
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _compute_grid(self, kind, resource_id, week_start):
+        """Sessions de la semaine et créneaux actifs, en deux lectures"""
+        model_name, field_name = SCHEDULE_GRID_KINDS[kind]
+        week_end = week_start + timedelta(days=6)
+        resource = self.env[model_name].browse(resource_id).exists()
+
+        session_fields = ['name', 'date', 'start_time', 'end_time', 'state',
+                          'subject_id', 'faculty_id', 'batch_id', 'classroom_id']
+        sessions = self.env['op.session'].search_read([
+            (field_name, '=', resource_id),
+            ('date', '>=', week_start),
+            ('date', '<=', week_end),
+        ], session_fields, order='date, start_time')
+
+        slot_field = 'timetable_id.batch_id' if kind == 'batch' else field_name
+        slots = self.env['op.timetable.slot'].search_read([
+            (slot_field, '=', resource_id),
+            ('timetable_id.state', '=', 'active'),
+            ('timetable_id.start_date', '<=', week_end),
+            ('timetable_id.end_date', '>=', week_start),
+        ], ['timetable_id', 'day_of_week', 'start_time', 'end_time',
+            'subject_id', 'faculty_id', 'classroom_id', 'session_type'])
+        timetables = {
+            timetable.id: timetable
+            for timetable in self.env['op.timetable'].browse(
+                list({slot['timetable_id'][0] for slot in slots}))
+        }
+
+        subject_codes = {
+            subject['id']: subject['code']
+            for subject in self.env['op.subject'].browse(list({
+                record['subject_id'][0] for record in sessions + slots if record['subject_id']
+            })).read(['code'])
+        }
+
+        def relation(value):
+            return {'id': value[0], 'name': value[1]} if value else None
+
+        def subject_relation(value):
+            return dict(relation(value), code=subject_codes.get(value[0]) or '') if value else None
+
+        days = []
+        for offset in range(7):
+            day = week_start + timedelta(days=offset)
+            entries = []
+            # (classe, matière, début) des sessions : un créneau déjà transformé en session n'est pas répété
+            session_keys = set()
+            for session in sessions:
+                if session['date'] != day:
+                    continue
+                session_keys.add((
+                    session['batch_id'] and session['batch_id'][0],
+                    session['subject_id'] and session['subject_id'][0],
+                    format_hour(session['start_time']),
+                ))
+                entries.append({
+                    'type': 'session',
+                    'id': session['id'],
+                    'name': session['name'],
+                    'state': session['state'],
+                    'start_time': format_hour(session['start_time']),
+                    'end_time': format_hour(session['end_time']),
+                    'subject': subject_relation(session['subject_id']),
+                    'faculty': relation(session['faculty_id']),
+                    'batch': relation(session['batch_id']),
+                    'classroom': relation(session['classroom_id']),
+                })
+            for slot in slots:
+                timetable = timetables[slot['timetable_id'][0]]
+                if int(slot['day_of_week']) != offset or not timetable.start_date <= day <= timetable.end_date:
+                    continue
+                batch = timetable.batch_id
+                key = (batch.id, slot['subject_id'] and slot['subject_id'][0], format_hour(slot['start_time']))
+                if key in session_keys:
+                    continue
+                entries.append({
+                    'type': 'slot',
+                    'id': slot['id'],
+                    'name': slot['subject_id'][1] if slot['subject_id'] else '',
+                    'session_type': slot['session_type'],
+                    'start_time': format_hour(slot['start_time']),
+                    'end_time': format_hour(slot['end_time']),
+                    'subject': subject_relation(slot['subject_id']),
+                    'faculty': relation(slot['faculty_id']),
+                    'batch': {'id': batch.id, 'name': batch.name} if batch else None,
+                    'classroom': relation(slot['classroom_id']),
+                })
+            entries.sort(key=lambda entry: (entry['start_time'], entry['end_time']))
+            days.append({
+                'date': day.isoformat(),
+                'day_of_week': offset,
+                'day_name': DAY_NAMES[offset],
+                'entries': entries,
+            })
+
+        return {
+            'kind': kind,
+            'resource': {'id': resource_id, 'name': resource.name if resource else None},
+            'week_start': week_start.isoformat(),
+            'week_end': week_end.isoformat(),
+            'days': days,
+        }
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _mark_dirty(self, keys):
+        """Supprimer ces grilles avant le commit
+
+        :param keys: itérable de (kind, resource_id, week_start ou None pour toutes les semaines)
+        """
+        keys = {key for key in keys if key[1]}
+        if not keys:
+            return
+        pending = self.env.cr.precommit.data.setdefault(SCHEDULE_GRID_PRECOMMIT_KEY, set())
+        if not pending:
+            self.env.cr.precommit.add(self._flush_dirty)
+        pending.update(keys)
+
+    @api.model
+    def _mark_sessions_dirty(self, sessions):
+        keys = set()
+        for session in sessions.sudo():
+            week_start = week_start_of(session.date) if session.date else None
+            for kind, (_model, field_name) in SCHEDULE_GRID_KINDS.items():
+                keys.add((kind, session[field_name].id, week_start))
+        self._mark_dirty(keys)
+
+    @api.model
+    def _mark_slots_dirty(self, slots):
+        """Un créneau vaut pour toutes les semaines de son emploi du temps"""
+        keys = set()
+        for slot in slots.sudo():
+            keys.add(('batch', slot.timetable_id.batch_id.id, None))
+            keys.add(('faculty', slot.faculty_id.id, None))
+            keys.add(('classroom', slot.classroom_id.id, None))
+        self._mark_dirty(keys)
+
+    @api.model
+    def _flush_dirty(self):
+        pending = self.env.cr.precommit.data.pop(SCHEDULE_GRID_PRECOMMIT_KEY, set())
+        if pending:
+            self._invalidate(pending)
+
+    @api.model
+    def _invalidate(self, keys):
+        all_weeks = {(kind, resource_id) for kind, resource_id, week_start in keys if week_start is None}
+        one_week = [(kind, resource_id, week_start) for kind, resource_id, week_start in keys
+                    if week_start is not None and (kind, resource_id) not in all_weeks]
+        if all_weeks:
+            self.env.cr.execute("""
+                DELETE FROM op_schedule_grid WHERE (kind, resource_id) IN %s
+            """, [tuple(all_weeks)])
+        if one_week:
+            self.env.cr.execute("""
+                DELETE FROM op_schedule_grid WHERE (kind, resource_id, week_start) IN %s
+            """, [tuple(one_week)])
+        self.invalidate_model()
@@ -4,14 +4,30 @@ from odoo import models, fields, api, exceptions, _
 from datetime import datetime, timedelta
 import logging
 
+from .op_resource_occupancy import interval_mask
+
 _logger = logging.getLogger(__name__)
 
+# Ordre de préférence des remplaçants
+SUBSTITUTE_QUALIFICATION_RANK = {'course': 0, 'subject': 1, 'none': 2}
+# Champs qui modifient l'occupation des salles et des enseignants
+SESSION_OCCUPANCY_FIELDS = ('start_datetime', 'end_datetime', 'classroom_id', 'faculty_id', 'state')
+# Champs affichés dans les grilles hebdomadaires
+SESSION_GRID_FIELDS = SESSION_OCCUPANCY_FIELDS + ('name', 'batch_id', 'subject_id')
+# Champs des présences repris dans les faits de présence
+ATTENDANCE_FACT_FIELDS = ('session_id', 'student_id', 'date', 'state')
+# Champs d'une saisie de présence : leur modification met à jour marked_date
+ATTENDANCE_MARK_FIELDS = ('state', 'arrival_time', 'departure_time')
+# États d'une session close : ses statistiques de présence sont figées
+SESSION_CLOSED_STATES = ('done',)
+
 class OpSession(models.Model):
     _inherit = 'op.session'
     _description = 'Session de Cours - Extension'
 
     # Champs supplémentaires pour notre extension
     notes = fields.Text('Notes internes')
+    notes_modified_at = fields.Datetime('Notes modifiées le', readonly=True, copy=False)
     is_makeup = fields.Boolean('Cours de rattrapage', default=False)
     original_session_id = fields.Many2one('op.session', 'Session originale', help="Si c'est un rattrapage")
     
@@ -33,10 +49,60 @@ class OpSession(models.Model):
     absent_count = fields.Integer('Nb absents', compute='_compute_attendance_stats')
     attendance_rate = fields.Float('Taux de présence (%)', compute='_compute_attendance_stats')
     attendance_ids = fields.One2many('op.attendance', 'session_id', 'Présences')
+    # Chiffres définitifs, enregistrés à la clôture de la session
+    stats_frozen = fields.Boolean('Statistiques figées', readonly=True, copy=False)
+    final_attendance_count = fields.Integer('Nb présents (final)', readonly=True, copy=False)
+    final_absent_count = fields.Integer('Nb absents (final)', readonly=True, copy=False)
+    final_attendance_rate = fields.Float('Taux de présence final (%)', readonly=True, copy=False)
     
     # Dates système
     updated_date = fields.Datetime('Dernière modification', default=fields.Datetime.now, readonly=True)
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        sessions = super().create(vals_list)
+        self.env['op.resource.occupancy']._mark_records_dirty(sessions)
+        self.env['op.schedule.grid']._mark_sessions_dirty(sessions)
+        return sessions
+
+    def write(self, vals):
+        if 'notes' in vals and 'notes_modified_at' not in vals:
+            vals = dict(vals, notes_modified_at=fields.Datetime.now())
+        occupancy_changed = any(field in vals for field in SESSION_OCCUPANCY_FIELDS)
+        grid_changed = any(field in vals for field in SESSION_GRID_FIELDS)
+        if occupancy_changed:
+            self.env['op.resource.occupancy']._mark_records_dirty(self)
+        if grid_changed:
+            self.env['op.schedule.grid']._mark_sessions_dirty(self)
+        result = super().write(vals)
+        if occupancy_changed:
+            self.env['op.resource.occupancy']._mark_records_dirty(self)
+        if grid_changed:
+            self.env['op.schedule.grid']._mark_sessions_dirty(self)
+        if 'batch_id' in vals:
+            self._mark_attendance_facts_dirty()
+        if 'state' in vals:
+            closed = self.filtered(lambda s: s.state in SESSION_CLOSED_STATES)
+            if closed:
+                closed._freeze_attendance_stats()
+            reopened = self.filtered(lambda s: s.stats_frozen and s.state not in SESSION_CLOSED_STATES)
+            if reopened:
+                reopened.write({'stats_frozen': False})
+        elif 'batch_id' in vals:
+            self._refresh_frozen_stats()
+        return result
+
+    def _mark_attendance_facts_dirty(self):
+        """La classe des faits de présence suit celle de la session"""
+        Fact = self.env['op.attendance.fact']
+        Fact._mark_attendances_dirty(self.sudo().mapped('attendance_ids'))
+        Fact._mark_lines_dirty(self.env['op.attendance.line'].sudo().search([('attendance_id.session_id', 'in', self.ids)]))
+
+    def unlink(self):
+        self.env['op.resource.occupancy']._mark_records_dirty(self)
+        self.env['op.schedule.grid']._mark_sessions_dirty(self)
+        return super().unlink()
+
     @api.depends('name', 'subject_id')
     def _compute_code(self):
         """Générer un code pour la session"""
@@ -77,28 +143,107 @@ class OpSession(models.Model):
             else:
                 session.duration = 0.0
     
-    @api.depends('batch_id', 'attendance_ids')
+    @api.depends('batch_id', 'attendance_ids', 'attendance_ids.state', 'stats_frozen',
+                 'final_attendance_count', 'final_absent_count', 'final_attendance_rate')
     def _compute_attendance_stats(self):
-        """Calculer les statistiques de présence"""
+        """Calculer les statistiques de présence de tout le recordset
+
+        Les sessions closes dont les chiffres sont figés ne font aucune requête.
+        """
+        stats = self.filtered(lambda s: not s.stats_frozen)._read_attendance_stats()
         for session in self:
-            # Utiliser le système de présence d'OpenEduCat si disponible
-            total_students = len(session.batch_id.student_ids) if session.batch_id else 0
-            
-            # Compter les présences dans notre système
-            present_count = len(session.attendance_ids.filtered(lambda a: a.state == 'present'))
-            
-            # Si pas de présences dans notre système, chercher dans OpenEduCat
-            if not session.attendance_ids:
-                attendance_lines = self.env['op.attendance.line'].search([
-                    ('attendance_id.session_id', '=', session.id)
-                ])
-                present_count = len(attendance_lines.filtered(lambda a: a.present))
-            
-            absent_count = total_students - present_count
-            
-            session.attendance_count = present_count
-            session.absent_count = absent_count
-            session.attendance_rate = (present_count / total_students * 100) if total_students > 0 else 0.0
+            if session.stats_frozen:
+                session.attendance_count = session.final_attendance_count
+                session.absent_count = session.final_absent_count
+                session.attendance_rate = session.final_attendance_rate
+            else:
+                session.attendance_count, session.absent_count, session.attendance_rate = stats.get(
+                    session.id, (0, 0, 0.0))
+
+    def _read_attendance_stats(self):
+        """Présents, absents et taux de présence, en deux requêtes groupées
+
+        Une requête sur op.attendance par état, une sur op.attendance.line par
+        présence, et un seul comptage des effectifs pour toutes les classes.
+        Comme avant, les feuilles d'appel OpenEduCat ne servent qu'aux
+        sessions sans présence de session.
+
+        :return: {session_id: (present_count, absent_count, attendance_rate)}
+        """
+        session_ids = [session_id for session_id in self.ids if session_id]
+        if not session_ids:
+            return {}
+        self.env['op.attendance'].flush_model(['session_id', 'state'])
+        self.env['op.attendance.line'].flush_model(['attendance_id', 'present'])
+        self.env['op.attendance.sheet'].flush_model(['session_id'])
+        cr = self.env.cr
+
+        cr.execute("""
+            SELECT session_id, state, COUNT(*) FROM op_attendance
+             WHERE session_id = ANY(%s)
+             GROUP BY session_id, state
+        """, [session_ids])
+        session_present = {}
+        for session_id, state, count in cr.fetchall():
+            session_present.setdefault(session_id, 0)
+            if state == 'present':
+                session_present[session_id] += count
+
+        cr.execute("""
+            SELECT s.session_id, COUNT(*) FILTER (WHERE l.present)
+              FROM op_attendance_line l
+              JOIN op_attendance_sheet s ON s.id = l.attendance_id
+             WHERE s.session_id = ANY(%s)
+             GROUP BY s.session_id
+        """, [session_ids])
+        sheet_present = dict(cr.fetchall())
+
+        batches = self.mapped('batch_id')
+        rosters = {}
+        if batches:
+            groups = self.env['op.student.course'].sudo().read_group(
+                [('batch_id', 'in', batches.ids), ('state', '=', 'running')],
+                ['batch_id'], ['batch_id'])
+            rosters = {group['batch_id'][0]: group['batch_id_count'] for group in groups}
+
+        stats = {}
+        for session in self:
+            if not session.id:
+                continue
+            total_students = rosters.get(session.batch_id.id, 0)
+            if session.id in session_present:
+                present_count = session_present[session.id]
+            else:
+                present_count = sheet_present.get(session.id, 0)
+            stats[session.id] = (
+                present_count,
+                total_students - present_count,
+                (present_count / total_students * 100) if total_students > 0 else 0.0,
+            )
+        return stats
+
+    def _freeze_attendance_stats(self):
+        """Enregistrer les chiffres définitifs de présence des sessions closes"""
+        stats = self._read_attendance_stats()
+        for session in self:
+            present_count, absent_count, attendance_rate = stats.get(session.id, (0, 0, 0.0))
+            session.write({
+                'stats_frozen': True,
+                'final_attendance_count': present_count,
+                'final_absent_count': absent_count,
+                'final_attendance_rate': attendance_rate,
+            })
+
+    def _refresh_frozen_stats(self):
+        """Une présence modifiée après la clôture met à jour les chiffres enregistrés"""
+        frozen = self.sudo().exists().filtered('stats_frozen')
+        if frozen:
+            frozen._freeze_attendance_stats()
+
+    def action_freeze_attendance_stats(self):
+        """Figer les statistiques de présence des sessions terminées"""
+        self.filtered(lambda s: s.state in SESSION_CLOSED_STATES)._freeze_attendance_stats()
+        return True
 
     def action_create_makeup(self):
         """Créer une session de rattrapage"""
@@ -141,6 +286,89 @@ class OpSession(models.Model):
             ('state', 'in', ['draft', 'confirm'])
         ])
 
+    @api.model
+    def find_substitutes(self, faculty_id, session_ids=None, date_from=None, date_to=None, limit=5):
+        """Remplaçants possibles pour les sessions d'un enseignant absent
+
+        Les candidats libres pendant la session (index d'occupation) sont classés
+        par qualification (enseignant du cours, puis de la matière), puis par
+        charge hebdomadaire croissante. Les index sont lus une fois par jour et
+        par semaine concernés, quel que soit le nombre de sessions.
+
+        :param session_ids: sessions précises ; sinon toutes celles de
+                            l'enseignant entre date_from et date_to
+        :return: liste de dicts {session, candidates}
+        """
+        domain = [('faculty_id', '=', faculty_id), ('state', '!=', 'cancel')]
+        if session_ids:
+            domain.append(('id', 'in', session_ids))
+        else:
+            date_from = fields.Date.to_date(date_from) or fields.Date.today()
+            date_to = fields.Date.to_date(date_to) or date_from
+            domain += [('date', '>=', date_from), ('date', '<=', date_to)]
+        sessions = self.search(domain, order='date, start_time')
+        if not sessions:
+            return []
+
+        Occupancy = self.env['op.resource.occupancy']
+        faculties = self.env['op.faculty'].search([('id', '!=', faculty_id)])
+        faculty_names = {faculty.id: faculty.name for faculty in faculties}
+
+        # Qualifications : enseignants de chaque cours et de chaque matière
+        course_teachers = {
+            course.id: set((course.main_teacher_id | course.teacher_ids).ids)
+            for course in sessions.mapped('course_id')
+        }
+        subject_teachers = {}
+        for faculty in faculties.filtered(lambda f: f.subject_ids & sessions.mapped('subject_id')):
+            for subject in faculty.subject_ids:
+                subject_teachers.setdefault(subject.id, set()).add(faculty.id)
+
+        masks_by_day = {}
+        load_by_week = {}
+        result = []
+        for session in sessions:
+            if session.date not in masks_by_day:
+                masks_by_day[session.date] = Occupancy._read_masks('faculty', session.date)
+            week_start = session.date - timedelta(days=session.date.weekday())
+            if week_start not in load_by_week:
+                load_by_week[week_start] = Occupancy.get_weekly_load('faculty', week_start)
+            masks = masks_by_day[session.date]
+            load = load_by_week[week_start]
+            wanted = interval_mask(session.start_time, session.end_time)
+            by_course = course_teachers.get(session.course_id.id, set())
+            by_subject = subject_teachers.get(session.subject_id.id, set())
+
+            candidates = []
+            for candidate_id in faculty_names:
+                if masks.get(candidate_id, 0) & wanted:
+                    continue
+                if candidate_id in by_course:
+                    qualification = 'course'
+                elif candidate_id in by_subject:
+                    qualification = 'subject'
+                else:
+                    qualification = 'none'
+                candidates.append((
+                    SUBSTITUTE_QUALIFICATION_RANK[qualification],
+                    load.get(candidate_id, 0),
+                    faculty_names[candidate_id] or '',
+                    candidate_id,
+                    qualification,
+                ))
+            candidates.sort()
+
+            result.append({
+                'session': session,
+                'candidates': [{
+                    'id': candidate_id,
+                    'name': name,
+                    'qualification': qualification,
+                    'weekly_load_hours': round(minutes / 60.0, 2),
+                } for _rank, minutes, name, candidate_id, qualification in candidates[:limit]],
+            })
+        return result
+
 
 class OpClassroom(models.Model):
     _name = 'op.classroom'
@@ -201,6 +429,38 @@ class OpAttendance(models.Model):
     # Métadonnées
     marked_by = fields.Many2one('res.users', 'Marqué par', default=lambda self: self.env.user)
     marked_date = fields.Datetime('Date de marquage', default=fields.Datetime.now)
+
+    _sql_constraints = [
+        ('session_student_uniq', 'unique(session_id, student_id)', 'Une seule présence par étudiant et par session.'),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attendances = super().create(vals_list)
+        self.env['op.attendance.fact']._mark_attendances_dirty(attendances)
+        attendances.mapped('session_id')._refresh_frozen_stats()
+        return attendances
+
+    def write(self, vals):
+        fact_changed = any(field in vals for field in ATTENDANCE_FACT_FIELDS)
+        if 'marked_date' not in vals and any(field in vals for field in ATTENDANCE_MARK_FIELDS):
+            # Horodatage de la saisie : sert d'arbitre à la synchronisation hors ligne
+            vals = dict(vals, marked_date=fields.Datetime.now())
+        sessions = self.mapped('session_id')
+        if fact_changed:
+            self.env['op.attendance.fact']._mark_attendances_dirty(self)
+        result = super().write(vals)
+        if fact_changed:
+            self.env['op.attendance.fact']._mark_attendances_dirty(self)
+            (sessions | self.mapped('session_id'))._refresh_frozen_stats()
+        return result
+
+    def unlink(self):
+        self.env['op.attendance.fact']._mark_attendances_dirty(self)
+        sessions = self.mapped('session_id')
+        result = super().unlink()
+        sessions._refresh_frozen_stats()
+        return result
     
     @api.depends('student_id', 'session_id', 'state')
     def _compute_display_name(self):
@@ -215,4 +475,118 @@ class OpAttendance(models.Model):
         for attendance in self:
             if attendance.arrival_time and attendance.departure_time:
                 if attendance.arrival_time >= attendance.departure_time:
-                    raise exceptions.ValidationError(_("L'heure de départ doit être postérieure à l'heure d'arrivée.")) 
\ No newline at end of file
+                    raise exceptions.ValidationError(_("L'heure de départ doit être postérieure à l'heure d'arrivée.")) 
+
+    @api.model
+    def upsert_session_attendance(self, session, entries):
+        """Enregistrer l'appel complet d'une session en une seule requête
+
+        Les lignes existantes (session, étudiant) sont mises à jour, les autres
+        créées. Le nom d'affichage est calculé ici pour tout l'appel au lieu
+        d'être recalculé ligne par ligne par l'ORM.
+
+        :param entries: liste de dicts student_id, state, arrival_time (float ou None)
+        :return: nombre de lignes écrites
+        """
+        rows = [dict(entry, session_id=session.id) for entry in entries]
+        if self._get_arrival_conflicts(rows):
+            raise exceptions.ValidationError(_("L'heure de départ doit être postérieure à l'heure d'arrivée."))
+        return len(self._upsert_attendance(rows))
+
+    @api.model
+    def _get_arrival_conflicts(self, rows):
+        """Heures de départ déjà saisies que ces arrivées dépasseraient
+
+        Équivalent groupé de _check_times pour les écritures en SQL : une
+        heure d'arrivée doit précéder l'heure de départ de la présence
+        existante.
+
+        :param rows: liste de dicts session_id, student_id et arrival_time
+        :return: dict {(session_id, student_id): departure_time} des lignes refusées
+        """
+        rows = [row for row in rows if row.get('arrival_time')]
+        if not rows:
+            return {}
+        self.flush_model(['session_id', 'student_id', 'departure_time'])
+        self.env.cr.execute("""
+            SELECT a.session_id, a.student_id, a.departure_time
+              FROM op_attendance a
+              JOIN unnest(%s::int[], %s::int[], %s::float8[]) AS u(session_id, student_id, arrival_time)
+                ON u.session_id = a.session_id AND u.student_id = a.student_id
+             WHERE a.departure_time > 0 AND u.arrival_time >= a.departure_time
+        """, [
+            [row['session_id'] for row in rows],
+            [row['student_id'] for row in rows],
+            [row['arrival_time'] for row in rows],
+        ])
+        return {(session_id, student_id): departure_time
+                for session_id, student_id, departure_time in self.env.cr.fetchall()}
+
+    @api.model
+    def _upsert_attendance(self, rows, last_writer_wins=False):
+        """Insérer ou mettre à jour des présences (session, étudiant) en une requête
+
+        :param rows: liste de dicts session_id, student_id, state, arrival_time
+                     et marked_date (horodatage de la saisie, maintenant par défaut)
+        :param last_writer_wins: ne remplacer une présence existante que si la
+                                 saisie est plus récente que son marked_date
+        :return: liste des couples (session_id, student_id) écrits ; une
+                 présence dont l'heure de départ précède la nouvelle heure
+                 d'arrivée n'est pas modifiée (voir _get_arrival_conflicts)
+        """
+        # Un étudiant présent deux fois pour une session : la dernière saisie l'emporte
+        rows = list({(row['session_id'], row['student_id']): row for row in rows}.values())
+        if not rows:
+            return []
+        sessions = {session.id: session for session in self.env['op.session'].browse(
+            list({row['session_id'] for row in rows}))}
+        student_names = {
+            student['id']: student['name']
+            for student in self.env['op.student'].browse(list({row['student_id'] for row in rows})).read(['name'])
+        }
+        today = fields.Date.today()
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO op_attendance
+                   (session_id, student_id, date, state, arrival_time, display_name,
+                    marked_by, marked_date, create_uid, create_date, write_uid, write_date)
+            SELECT u.session_id, u.student_id, u.date, u.state, u.arrival_time, u.display_name,
+                   %s, COALESCE(u.marked_date, NOW() AT TIME ZONE 'UTC'),
+                   %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::int[], %s::date[], %s::varchar[], %s::float8[], %s::varchar[], %s::timestamp[])
+                   AS u(session_id, student_id, date, state, arrival_time, display_name, marked_date)
+            ON CONFLICT (session_id, student_id) DO UPDATE
+               SET state = EXCLUDED.state,
+                   arrival_time = EXCLUDED.arrival_time,
+                   display_name = EXCLUDED.display_name,
+                   marked_by = EXCLUDED.marked_by,
+                   marked_date = EXCLUDED.marked_date,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+             WHERE (op_attendance.departure_time IS NULL OR op_attendance.departure_time = 0
+                    OR EXCLUDED.arrival_time IS NULL OR EXCLUDED.arrival_time = 0
+                    OR EXCLUDED.arrival_time < op_attendance.departure_time)
+             {condition}
+            RETURNING session_id, student_id
+        """.format(condition=(
+            "AND (op_attendance.marked_date IS NULL OR op_attendance.marked_date < EXCLUDED.marked_date)"
+            if last_writer_wins else ""
+        )), [
+            self.env.uid, self.env.uid, self.env.uid,
+            [row['session_id'] for row in rows],
+            [row['student_id'] for row in rows],
+            [sessions[row['session_id']].date or today for row in rows],
+            [row['state'] for row in rows],
+            [row.get('arrival_time') for row in rows],
+            [f"{student_names.get(row['student_id'], '')} - {sessions[row['session_id']].display_name} ({row['state']})"
+             for row in rows],
+            [row.get('marked_date') for row in rows],
+        ])
+        written = self.env.cr.fetchall()
+        self.invalidate_model()
+        touched = self.env['op.session'].browse(list({session_id for session_id, _student_id in written}))
+        touched.invalidate_recordset(['attendance_ids'])
+        self.env['op.attendance.fact']._mark_dirty(
+            (student_id, sessions[session_id].date or today) for session_id, student_id in written)
+        touched._refresh_frozen_stats()
+        return written
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Emplois du temps déduits des sessions.
+
+Classes sans emploi du temps saisi : leur planning est reconstitué à partir
+des sessions, regroupées par classe (bornes de dates) et par motif
+hebdomadaire (jour, horaire, matière, enseignant, salle). Deux vues SQL
+tiennent ces agrégats à jour sans recalcul côté Python.
+"""
+
+from odoo import models, fields, api, tools
+
+
+class OpSessionTimetable(models.Model):
+    _name = 'op.session.timetable'
+    _description = 'Emploi du temps déduit des sessions'
+    _auto = False
+    _order = 'batch_id'
+
+    batch_id = fields.Many2one('op.batch', 'Classe', readonly=True)
+    start_date = fields.Date('Date de début', readonly=True)
+    end_date = fields.Date('Date de fin', readonly=True)
+    sessions_count = fields.Integer('Nombre de sessions', readonly=True)
+    has_timetable = fields.Boolean('Emploi du temps saisi', readonly=True)
+    pattern_ids = fields.One2many('op.session.timetable.pattern', 'timetable_id', 'Motifs hebdomadaires')
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        # L'identifiant de la ligne est celui de la classe
+        self.env.cr.execute("""
+            CREATE OR REPLACE VIEW %s AS (
+                SELECT s.batch_id AS id,
+                       s.batch_id,
+                       MIN(s.date) AS start_date,
+                       MAX(s.date) AS end_date,
+                       COUNT(*) AS sessions_count,
+                       EXISTS (
+                           SELECT 1 FROM op_timetable t WHERE t.batch_id = s.batch_id
+                       ) AS has_timetable
+                  FROM op_session s
+                 WHERE s.batch_id IS NOT NULL
+                 GROUP BY s.batch_id
+            )
+        """ % self._table)
+
+    @api.model
+    def _get_search_domain(self, search=None):
+        """Classes sans emploi du temps saisi, filtrées sur classe, matière ou enseignant"""
+        domain = [('has_timetable', '=', False)]
+        if search:
+            domain += [
+                '|', '|',
+                ('batch_id.name', 'ilike', search),
+                ('pattern_ids.subject_id.name', 'ilike', search),
+                ('pattern_ids.faculty_id.name', 'ilike', search),
+            ]
+        return domain
+
+    def _get_api_data(self):
+        """Données au format de /api/timetables, motifs lus en une requête"""
+        patterns = self.env['op.session.timetable.pattern'].search(
+            [('timetable_id', 'in', self.ids)],
+            order='timetable_id, day_of_week, start_time',
+        )
+        patterns_by_timetable = {}
+        for pattern in patterns:
+            patterns_by_timetable.setdefault(pattern.timetable_id.id, pattern.browse())
+            patterns_by_timetable[pattern.timetable_id.id] |= pattern
+
+        result = []
+        for timetable in self:
+            timetable_patterns = patterns_by_timetable.get(timetable.id, patterns.browse())
+            result.append({
+                'id': f"timetable_{timetable.batch_id.id}",
+                'name': f"Emploi du temps - {timetable.batch_id.name}",
+                'batch': {
+                    'id': timetable.batch_id.id,
+                    'name': timetable.batch_id.name,
+                },
+                'start_date': timetable.start_date.strftime('%Y-%m-%d') if timetable.start_date else None,
+                'end_date': timetable.end_date.strftime('%Y-%m-%d') if timetable.end_date else None,
+                'state': 'active',
+                'sessions_count': timetable.sessions_count,
+                'subjects': sorted(set(timetable_patterns.mapped('subject_id.name'))),
+                'faculty': sorted(set(timetable_patterns.mapped('faculty_id.name'))),
+                'slot_ids': [pattern._get_api_data() for pattern in timetable_patterns],
+            })
+        return result
+
+
+class OpSessionTimetablePattern(models.Model):
+    _name = 'op.session.timetable.pattern'
+    _description = 'Motif hebdomadaire déduit des sessions'
+    _auto = False
+    _order = 'timetable_id, day_of_week, start_time'
+
+    timetable_id = fields.Many2one('op.session.timetable', 'Emploi du temps', readonly=True)
+    batch_id = fields.Many2one('op.batch', 'Classe', readonly=True)
+    day_of_week = fields.Integer('Jour de la semaine', readonly=True, help="0 = lundi")
+    start_time = fields.Float('Heure de début', readonly=True)
+    end_time = fields.Float('Heure de fin', readonly=True)
+    subject_id = fields.Many2one('op.subject', 'Matière', readonly=True)
+    faculty_id = fields.Many2one('op.faculty', 'Enseignant', readonly=True)
+    classroom_id = fields.Many2one('op.classroom', 'Salle de classe', readonly=True)
+    sessions_count = fields.Integer('Nombre de sessions', readonly=True)
+    first_date = fields.Date('Première session', readonly=True)
+    last_date = fields.Date('Dernière session', readonly=True)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("""
+            CREATE OR REPLACE VIEW %s AS (
+                SELECT ROW_NUMBER() OVER (
+                           ORDER BY s.batch_id, EXTRACT(ISODOW FROM s.date), s.start_time,
+                                    s.end_time, s.subject_id, s.faculty_id, s.classroom_id
+                       ) AS id,
+                       s.batch_id AS timetable_id,
+                       s.batch_id,
+                       (EXTRACT(ISODOW FROM s.date) - 1)::integer AS day_of_week,
+                       s.start_time,
+                       s.end_time,
+                       s.subject_id,
+                       s.faculty_id,
+                       s.classroom_id,
+                       COUNT(*) AS sessions_count,
+                       MIN(s.date) AS first_date,
+                       MAX(s.date) AS last_date
+                  FROM op_session s
+                 WHERE s.batch_id IS NOT NULL AND s.date IS NOT NULL
+                 GROUP BY s.batch_id, EXTRACT(ISODOW FROM s.date), s.start_time,
+                          s.end_time, s.subject_id, s.faculty_id, s.classroom_id
+            )
+        """ % self._table)
+
+    def _get_api_data(self):
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'day_of_week': self.day_of_week,
+            'start_time': f"{int(self.start_time):02d}:{int(round((self.start_time % 1) * 60)):02d}",
+            'end_time': f"{int(self.end_time):02d}:{int(round((self.end_time % 1) * 60)):02d}",
+            'subject': {
+                'id': self.subject_id.id,
+                'name': self.subject_id.name,
+            } if self.subject_id else None,
+            'faculty': {
+                'id': self.faculty_id.id,
+                'name': self.faculty_id.name,
+            } if self.faculty_id else None,
+            'classroom': {
+                'id': self.classroom_id.id,
+                'name': self.classroom_id.name,
+            } if self.classroom_id else {'name': 'Non définie'},
+            'session_type': 'lecture',
+            'sessions_count': self.sessions_count,
+            'first_date': self.first_date.strftime('%Y-%m-%d') if self.first_date else None,
+            'last_date': self.last_date.strftime('%Y-%m-%d') if self.last_date else None,
+        }
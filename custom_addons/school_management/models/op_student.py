@@ -3,6 +3,9 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+# Champs lus par l'index des badges du portail
+CHECKIN_INDEX_FIELDS = ('checkin_token', 'gr_no', 'first_name', 'middle_name', 'last_name', 'active')
+
 class OpStudent(models.Model):
     _inherit = 'op.student'
 
@@ -20,6 +23,9 @@ class OpStudent(models.Model):
     
     transport_needed = fields.Boolean('Transport Scolaire', default=False)
     school_insurance = fields.Boolean('Assurance Scolaire', default=False)
+
+    # Badge ou QR code présenté au portail (le numéro GR est aussi accepté)
+    checkin_token = fields.Char('Badge d\'accès', copy=False, index=True)
     
     # Champs pour la gestion des noms
     first_name = fields.Char('Prénom', required=True, tracking=True)
@@ -73,7 +79,14 @@ class OpStudent(models.Model):
                 # Construire le nouveau nom
                 vals['name'] = self._build_name(first_name, middle_name, last_name)
         
-        return super(OpStudent, self).write(vals)
+        result = super(OpStudent, self).write(vals)
+        if any(field in vals for field in CHECKIN_INDEX_FIELDS):
+            self.env['op.checkin']._invalidate_token_index()
+        return result
+
+    _sql_constraints = [
+        ('checkin_token_uniq', 'unique(checkin_token)', 'Ce badge est déjà attribué à un autre étudiant.'),
+    ]
 
 class OpStudentExtended(models.Model):
     _inherit = 'op.student'
@@ -4,6 +4,15 @@ from odoo import models, fields, api, exceptions, _
 from datetime import datetime, timedelta
 import logging
 
+from .timetable_index import SlotConflictIndex
+
+# Champs qui modifient l'occupation des salles et des enseignants
+TIMETABLE_OCCUPANCY_FIELDS = ('state', 'slot_ids', 'start_date', 'end_date')
+SLOT_OCCUPANCY_FIELDS = ('timetable_id', 'day_of_week', 'start_time', 'end_time', 'classroom_id', 'faculty_id')
+# Champs affichés dans les grilles hebdomadaires
+TIMETABLE_GRID_FIELDS = ('batch_id', 'start_date', 'end_date')
+SLOT_GRID_FIELDS = ('subject_id', 'session_type')
+
 _logger = logging.getLogger(__name__)
 
 class OpTimetable(models.Model):
@@ -57,6 +66,27 @@ class OpTimetable(models.Model):
                 # En cas d'erreur, utiliser un nom par défaut
                 timetable.display_name = timetable.name or 'Emploi du temps'
     
+    def write(self, vals):
+        occupancy_changed = any(field in vals for field in TIMETABLE_OCCUPANCY_FIELDS)
+        grid_changed = occupancy_changed or any(field in vals for field in TIMETABLE_GRID_FIELDS)
+        if grid_changed:
+            self._mark_slots_changed(occupancy_changed)
+        result = super().write(vals)
+        if grid_changed:
+            self._mark_slots_changed(occupancy_changed)
+        return result
+
+    def unlink(self):
+        self._mark_slots_changed()
+        return super().unlink()
+
+    def _mark_slots_changed(self, occupancy=True):
+        """Signaler aux index d'occupation et aux grilles que les créneaux changent"""
+        slots = self.mapped('slot_ids')
+        if occupancy:
+            self.env['op.resource.occupancy']._mark_records_dirty(slots)
+        self.env['op.schedule.grid']._mark_slots_dirty(slots)
+
     @api.constrains('start_date', 'end_date')
     def _check_dates(self):
         for timetable in self:
@@ -87,60 +117,128 @@ class OpTimetable(models.Model):
         self.state = 'archived'
         return True
     
+    @staticmethod
+    def _session_key(batch_id, subject_id, date, start_time):
+        """Clé d'unicité d'une session générée (heure arrondie à la minute)"""
+        return (batch_id, subject_id, date, round(start_time or 0.0, 2))
+
+    def _load_existing_session_keys(self):
+        """Clés des sessions existantes sur toute la période, en une requête"""
+        if not self:
+            return set()
+        sessions = self.env['op.session'].search_read([
+            ('batch_id', 'in', self.mapped('batch_id').ids),
+            ('date', '>=', min(self.mapped('start_date'))),
+            ('date', '<=', max(self.mapped('end_date'))),
+        ], ['batch_id', 'subject_id', 'date', 'start_time'])
+        return {
+            self._session_key(
+                session['batch_id'] and session['batch_id'][0],
+                session['subject_id'] and session['subject_id'][0],
+                session['date'],
+                session['start_time'],
+            )
+            for session in sessions
+        }
+
+    def _prepare_session_vals(self, slot, day):
+        """Valeurs d'une session pour un créneau à une date donnée"""
+        day_start = datetime.combine(day, datetime.min.time())
+        return {
+            'name': f"{slot.subject_id.name} - {self.batch_id.name}",
+            'subject_id': slot.subject_id.id,
+            'batch_id': self.batch_id.id,
+            'course_id': self.batch_id.course_id.id,
+            'faculty_id': slot.faculty_id.id,
+            'classroom_id': slot.classroom_id.id,
+            'start_datetime': day_start + timedelta(hours=slot.start_time),
+            'end_datetime': day_start + timedelta(hours=slot.end_time),
+            'topic': slot.topic,
+        }
+
+    def _generate_sessions(self, dry_run=False):
+        """Générer les sessions manquantes de plusieurs emplois du temps
+
+        Les sessions existantes de toute la période sont lues en une requête ;
+        les couples (date, créneau) manquants sont calculés en mémoire puis
+        créés en un seul ``create``.
+
+        :param dry_run: ne rien créer, seulement compter
+        :return: dict {created, existing, skipped, timetables: {id: {...}}}
+        """
+        existing_keys = self._load_existing_session_keys()
+        vals_list = []
+        summary = {'created': 0, 'existing': 0, 'skipped': 0, 'timetables': {}}
+
+        for timetable in self:
+            counts = {'name': timetable.display_name, 'created': 0, 'existing': 0, 'skipped': 0}
+            slots_by_day = {}
+            for slot in timetable.slot_ids:
+                slots_by_day.setdefault(int(slot.day_of_week), []).append(slot)
+
+            current_date = timetable.start_date
+            while current_date <= timetable.end_date:
+                for slot in slots_by_day.get(current_date.weekday(), []):
+                    if not slot.subject_id:
+                        # Une session sans matière ne peut pas être créée
+                        counts['skipped'] += 1
+                        continue
+                    key = self._session_key(
+                        timetable.batch_id.id, slot.subject_id.id, current_date, slot.start_time)
+                    if key in existing_keys:
+                        counts['existing'] += 1
+                        continue
+                    existing_keys.add(key)
+                    counts['created'] += 1
+                    if not dry_run:
+                        vals_list.append(timetable._prepare_session_vals(slot, current_date))
+                current_date += timedelta(days=1)
+
+            for counter in ('created', 'existing', 'skipped'):
+                summary[counter] += counts[counter]
+            summary['timetables'][timetable.id] = counts
+
+        if vals_list:
+            self.env['op.session'].create(vals_list)
+            _logger.info("%s sessions générées pour %s emploi(s) du temps", len(vals_list), len(self))
+        summary['dry_run'] = dry_run
+        return summary
+
+    @api.model
+    def generate_active_sessions(self, dry_run=False):
+        """Générer les sessions de tous les emplois du temps actifs"""
+        return self.search([('state', '=', 'active')])._generate_sessions(dry_run=dry_run)
+
     def action_generate_sessions(self):
         """Générer les sessions à partir de l'emploi du temps"""
-        self.ensure_one()
-        
-        if not self.slot_ids:
+        if not self.mapped('slot_ids'):
             raise exceptions.UserError(_("Aucun créneau défini dans cet emploi du temps."))
-        
-        session_count = 0
-        current_date = self.start_date
-        
-        while current_date <= self.end_date:
-            weekday = current_date.weekday()  # 0=Lundi, 6=Dimanche
-            
-            # Trouver les créneaux pour ce jour
-            day_slots = self.slot_ids.filtered(lambda s: s.day_of_week == str(weekday))
-            
-            for slot in day_slots:
-                # Vérifier si une session existe déjà
-                existing_session = self.env['op.session'].search([
-                    ('subject_id', '=', slot.subject_id.id),
-                    ('batch_id', '=', self.batch_id.id),
-                    ('date', '=', current_date),
-                    ('start_time', '=', slot.start_time),
-                ])
-                
-                if not existing_session:
-                    # Créer la session
-                    session_vals = {
-                        'name': f"{slot.subject_id.name} - {self.batch_id.name}",
-                        'subject_id': slot.subject_id.id,
-                        'batch_id': self.batch_id.id,
-                        'faculty_id': slot.faculty_id.id,
-                        'classroom_id': slot.classroom_id.id,
-                        'date': current_date,
-                        'start_time': slot.start_time,
-                        'end_time': slot.end_time,
-                        'topic': slot.topic,
-                    }
-                    
-                    self.env['op.session'].create(session_vals)
-                    session_count += 1
-            
-            current_date += timedelta(days=1)
-        
+
+        summary = self._generate_sessions()
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': _('Sessions générées'),
-                'message': f'{session_count} sessions ont été créées à partir de l\'emploi du temps.',
+                'message': f"{summary['created']} sessions ont été créées à partir de l'emploi du temps.",
                 'type': 'success',
             }
         }
 
+    def action_preview_sessions(self):
+        """Aperçu de la génération des sessions, sans rien créer"""
+        summary = self._generate_sessions(dry_run=True)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Aperçu de la génération'),
+                'message': _("%s sessions à créer, %s déjà existantes, %s créneaux sans matière ignorés.") % (
+                    summary['created'], summary['existing'], summary['skipped']),
+                'type': 'info',
+            }
+        }
+
 
 class OpTimetableSlot(models.Model):
     _name = 'op.timetable.slot'
@@ -186,6 +284,32 @@ class OpTimetableSlot(models.Model):
         ('other', 'Autre')
     ], string='Type de cours', default='lecture')
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        slots = super().create(vals_list)
+        self.env['op.resource.occupancy']._mark_records_dirty(slots)
+        self.env['op.schedule.grid']._mark_slots_dirty(slots)
+        return slots
+
+    def write(self, vals):
+        occupancy_changed = any(field in vals for field in SLOT_OCCUPANCY_FIELDS)
+        grid_changed = occupancy_changed or any(field in vals for field in SLOT_GRID_FIELDS)
+        if occupancy_changed:
+            self.env['op.resource.occupancy']._mark_records_dirty(self)
+        if grid_changed:
+            self.env['op.schedule.grid']._mark_slots_dirty(self)
+        result = super().write(vals)
+        if occupancy_changed:
+            self.env['op.resource.occupancy']._mark_records_dirty(self)
+        if grid_changed:
+            self.env['op.schedule.grid']._mark_slots_dirty(self)
+        return result
+
+    def unlink(self):
+        self.env['op.resource.occupancy']._mark_records_dirty(self)
+        self.env['op.schedule.grid']._mark_slots_dirty(self)
+        return super().unlink()
+
     @api.depends('day_of_week', 'start_time', 'end_time', 'subject_id')
     def _compute_display_name(self):
         for slot in self:
@@ -216,29 +340,129 @@ class OpTimetableSlot(models.Model):
             if slot.start_time < 0 or slot.end_time > 24:
                 raise exceptions.ValidationError(_("Les heures doivent être entre 0 et 24."))
     
-    @api.constrains('timetable_id', 'day_of_week', 'start_time', 'end_time', 'classroom_id')
+    @api.model
+    def _load_conflict_slots(self, timetable_ids=None):
+        """Charger en une requête les créneaux à comparer
+
+        Créneaux des emplois du temps actifs, plus ceux de ``timetable_ids``
+        (brouillons en cours de vérification par exemple). La clé de contexte
+        ``conflict_replaced_batch_ids`` écarte les emplois du temps actifs des
+        classes dont l'emploi du temps est en cours de remplacement.
+
+        :return: liste de dicts au format attendu par SlotConflictIndex
+        """
+        self.flush_model()
+        self.env['op.timetable'].flush_model(['batch_id', 'start_date', 'end_date', 'state'])
+        replaced_batch_ids = list(self.env.context.get('conflict_replaced_batch_ids') or [])
+        self.env.cr.execute("""
+            SELECT s.id, s.timetable_id, s.day_of_week, s.start_time, s.end_time,
+                   s.classroom_id, s.faculty_id, t.batch_id, t.start_date, t.end_date
+              FROM op_timetable_slot s
+              JOIN op_timetable t ON t.id = s.timetable_id
+             WHERE (t.state = 'active' AND t.batch_id != ALL(%s)) OR t.id = ANY(%s)
+        """, [replaced_batch_ids, list(timetable_ids or [])])
+        return [{
+            'id': row[0],
+            'timetable_id': row[1],
+            'day': row[2],
+            'start': row[3],
+            'end': row[4],
+            'classroom_id': row[5],
+            'faculty_id': row[6],
+            'batch_id': row[7],
+            'period_start': row[8],
+            'period_end': row[9],
+        } for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _get_conflict_index(self, timetable_ids=None):
+        """Construire l'index des conflits
+
+        :return: (SlotConflictIndex, dict id -> créneau)
+        """
+        slots = self._load_conflict_slots(timetable_ids)
+        return SlotConflictIndex(slots), {slot['id']: slot for slot in slots}
+
+    def _format_conflict_message(self, conflict):
+        """Message lisible pour un conflit renvoyé par l'index"""
+        day_name = dict(self._fields['day_of_week'].selection).get(conflict['day'], conflict['day'])
+        if conflict['dimension'] == 'classroom':
+            name = self.env['op.classroom'].browse(conflict['resource_id']).name
+            return _("Conflit détecté : la salle %s est déjà occupée à cette heure le %s.") % (name, day_name)
+        if conflict['dimension'] == 'faculty':
+            name = self.env['op.faculty'].browse(conflict['resource_id']).name
+            return _("Conflit détecté : l'enseignant %s a déjà cours à cette heure le %s.") % (name, day_name)
+        name = self.env['op.batch'].browse(conflict['resource_id']).name
+        return _("Conflit détecté : la classe %s a déjà cours à cette heure le %s.") % (name, day_name)
+
+    @api.constrains('timetable_id', 'day_of_week', 'start_time', 'end_time', 'classroom_id', 'faculty_id')
     def _check_conflicts(self):
-        """Vérifier les conflits de créneaux"""
-        for slot in self:
-            if not slot.classroom_id:
+        """Vérifier les conflits de salle, d'enseignant et de classe
+
+        Un seul index est construit pour tout le lot de créneaux modifiés,
+        au lieu d'une recherche par créneau.
+        """
+        slots = self.filtered(lambda s: s.classroom_id or s.faculty_id or s.timetable_id.batch_id)
+        if not slots:
+            return
+        index, slots_by_id = slots._get_conflict_index(slots.mapped('timetable_id').ids)
+        for slot in slots:
+            slot_data = slots_by_id.get(slot.id)
+            if not slot_data:
                 continue
-                
-            # Vérifier les conflits dans le même emploi du temps
-            conflicting_slots = self.search([
-                ('timetable_id', '=', slot.timetable_id.id),
-                ('day_of_week', '=', slot.day_of_week),
-                ('classroom_id', '=', slot.classroom_id.id),
-                ('id', '!=', slot.id),
-                '|',
-                '&', ('start_time', '<=', slot.start_time), ('end_time', '>', slot.start_time),
-                '&', ('start_time', '<', slot.end_time), ('end_time', '>=', slot.end_time),
-            ])
-            
-            if conflicting_slots:
-                raise exceptions.ValidationError(
-                    _("Conflit détecté : la salle %s est déjà occupée à cette heure le %s.") % 
-                    (slot.classroom_id.name, dict(slot._fields['day_of_week'].selection)[slot.day_of_week])
-                )
+            conflicts = index.conflicts_for(slot_data)
+            if conflicts:
+                raise exceptions.ValidationError(slot._format_conflict_message(conflicts[0]))
+
+    @api.model
+    def validate_timetables(self, timetable_ids=None):
+        """Détecter tous les conflits en un passage
+
+        :param timetable_ids: emplois du temps à vérifier en plus des actifs
+        :return: dict {conflicts, count, by_dimension}
+        """
+        index, slots_by_id = self._get_conflict_index(timetable_ids)
+        conflicts = index.conflicts()
+
+        slot_ids = {slot_id for conflict in conflicts for slot_id in conflict['slot_ids']}
+        slot_names = {slot.id: slot.display_name for slot in self.browse(list(slot_ids))}
+        resource_models = {
+            'classroom': 'op.classroom',
+            'faculty': 'op.faculty',
+            'batch': 'op.batch',
+        }
+        resource_names = {}
+        for dimension, model_name in resource_models.items():
+            ids = {c['resource_id'] for c in conflicts if c['dimension'] == dimension}
+            for record in self.env[model_name].browse(list(ids)):
+                resource_names[(dimension, record.id)] = record.name
+        day_names = dict(self._fields['day_of_week'].selection)
+
+        by_dimension = dict.fromkeys(resource_models, 0)
+        result = []
+        for conflict in conflicts:
+            by_dimension[conflict['dimension']] += 1
+            result.append({
+                'dimension': conflict['dimension'],
+                'resource_id': conflict['resource_id'],
+                'resource_name': resource_names.get((conflict['dimension'], conflict['resource_id'])),
+                'day': conflict['day'],
+                'day_name': day_names.get(conflict['day'], conflict['day']),
+                'start_time': conflict['start'],
+                'end_time': conflict['end'],
+                'slots': [{
+                    'id': slot_id,
+                    'name': slot_names.get(slot_id),
+                    'timetable_id': slots_by_id[slot_id]['timetable_id'],
+                } for slot_id in conflict['slot_ids']],
+                'message': self._format_conflict_message(conflict),
+            })
+        return {
+            'conflicts': result,
+            'count': len(result),
+            'by_dimension': by_dimension,
+            'slot_count': len(slots_by_id),
+        }
 
 
 class OpTimetableTemplate(models.Model):
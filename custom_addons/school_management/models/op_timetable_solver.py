@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, exceptions, _
+from datetime import timedelta
+import logging
+
+from .timetable_solver import TimetableSolver, DEFAULT_PERIODS, run_benchmark
+
+_logger = logging.getLogger(__name__)
+
+# Jours autorisés sur op.course, dans l'ordre de day_of_week
+COURSE_DAY_FIELDS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday')
+
+
+class OpTimetableSolverRun(models.Model):
+    _name = 'op.timetable.solver.run'
+    _description = 'Résolution automatique des emplois du temps'
+    _order = 'create_date desc'
+
+    name = fields.Char('Nom', required=True)
+    run_type = fields.Selection([
+        ('solve', 'Résolution'),
+        ('benchmark', 'Banc d\'essai'),
+    ], string='Type', default='solve', required=True)
+
+    # Qualité et performance
+    class_count = fields.Integer('Classes')
+    lesson_count = fields.Integer('Heures à placer')
+    placed_count = fields.Integer('Heures placées')
+    unplaced_count = fields.Integer('Heures non placées')
+    placement_rate = fields.Float('Taux de placement (%)')
+    class_gaps = fields.Integer('Trous des classes')
+    teacher_gaps = fields.Integer('Trous des enseignants')
+    daily_overload = fields.Integer('Dépassements journaliers')
+    repairs = fields.Integer('Réparations')
+    duration_ms = fields.Float('Durée de résolution (ms)')
+    details = fields.Json('Détails')
+
+    timetable_ids = fields.Many2many('op.timetable', string='Emplois du temps générés')
+
+    @api.model
+    def _prepare_stats_vals(self, stats):
+        return {
+            'class_count': stats['classes'],
+            'lesson_count': stats['lessons'],
+            'placed_count': stats['placed'],
+            'unplaced_count': stats['unplaced'],
+            'placement_rate': stats['placement_rate'],
+            'class_gaps': stats['class_gaps'],
+            'teacher_gaps': stats['teacher_gaps'],
+            'daily_overload': stats['daily_overload'],
+            'repairs': stats['repairs'],
+            'duration_ms': stats['duration_ms'],
+        }
+
+    # ------------------------------------------------------------------
+    # Données du solveur
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _get_room_features(self, classroom):
+        """Équipements utiles au solveur : 'computer' et 'lab'"""
+        features = set()
+        equipments = classroom.equipment_ids.filtered('is_working')
+        if equipments.filtered(lambda e: e.equipment_type == 'computer'):
+            features.add('computer')
+        labels = [classroom.name or '', classroom.code or ''] + equipments.mapped('name')
+        if any('labo' in (label or '').lower() for label in labels):
+            features.add('lab')
+        return features
+
+    @api.model
+    def _prepare_solver_rooms(self):
+        classrooms = self.env['op.classroom'].search([('is_active', '=', True)])
+        return [{
+            'id': classroom.id,
+            'capacity': classroom.capacity,
+            'features': self._get_room_features(classroom),
+        } for classroom in classrooms]
+
+    @api.model
+    def _prepare_solver_course(self, course):
+        features = set()
+        if course.lab_required:
+            features.add('lab')
+        if course.computer_room_required:
+            features.add('computer')
+        teachers = course.main_teacher_id | course.teacher_ids
+        subject = course.subject_ids.sorted('sequence')[:1]
+        return {
+            'course_id': course.id,
+            'subject_id': subject.id or False,
+            'hours': course.weekly_hours,
+            'teacher_ids': teachers.ids,
+            'days': [day for day, field_name in enumerate(COURSE_DAY_FIELDS) if course[field_name]],
+            'features': features,
+            'room_id': course.classroom_id.id or False,
+        }
+
+    @api.model
+    def _prepare_solver_classes(self, batches):
+        courses_by_batch = batches._get_solver_courses()
+        course_data = {}
+        classes = []
+        for batch in batches:
+            class_courses = []
+            for course in courses_by_batch.get(batch.id, self.env['op.course']):
+                if course.id not in course_data:
+                    course_data[course.id] = self._prepare_solver_course(course)
+                class_courses.append(course_data[course.id])
+            classes.append({
+                'id': batch.id,
+                'size': batch.student_count,
+                'home_room_id': batch.main_classroom_id.id or False,
+                'courses': class_courses,
+            })
+        return classes
+
+    @api.model
+    def _prepare_solver_busy(self, batches):
+        """Occupations des emplois du temps actifs des autres classes"""
+        busy = []
+        slots = self.env['op.timetable.slot'].with_context(
+            conflict_replaced_batch_ids=batches.ids,
+        )._load_conflict_slots()
+        for slot in slots:
+            for dimension in ('faculty', 'classroom'):
+                if slot['%s_id' % dimension]:
+                    busy.append({
+                        'dimension': dimension,
+                        'resource_id': slot['%s_id' % dimension],
+                        'day': int(slot['day']),
+                        'start': slot['start'],
+                        'end': slot['end'],
+                    })
+        return busy
+
+    # ------------------------------------------------------------------
+    # Résolution
+    # ------------------------------------------------------------------
+
+    @api.model
+    def solve(self, batch_ids=None, start_date=None, end_date=None, apply=False, activate=False):
+        """Calculer les emplois du temps de plusieurs classes (par défaut toute l'école)
+
+        Les enseignants et salles déjà pris par les emplois du temps actifs des
+        autres classes sont respectés.
+
+        :param apply: créer un emploi du temps brouillon par classe
+        :param activate: activer ces emplois du temps (archive les précédents)
+        :return: op.timetable.solver.run
+        """
+        Batch = self.env['op.batch']
+        batches = Batch.browse(batch_ids).exists() if batch_ids else Batch.search([])
+        if not batches:
+            raise exceptions.UserError(_("Aucune classe à planifier."))
+
+        solver = TimetableSolver(
+            self._prepare_solver_classes(batches),
+            self._prepare_solver_rooms(),
+            periods=DEFAULT_PERIODS,
+            busy=self._prepare_solver_busy(batches),
+        )
+        result = solver.solve()
+        stats = result['stats']
+        _logger.info("Solveur d'emploi du temps : %s/%s heures placées pour %s classes en %s ms",
+                     stats['placed'], stats['lessons'], stats['classes'], stats['duration_ms'])
+
+        vals = self._prepare_stats_vals(stats)
+        vals.update({
+            'name': _("Résolution du %s") % fields.Datetime.now().strftime('%d/%m/%Y %H:%M'),
+            'run_type': 'solve',
+            'details': {'unplaced': result['unplaced'], 'slot_count': len(result['slots'])},
+        })
+        run = self.create(vals)
+        if apply or activate:
+            run.timetable_ids = self._create_timetables(batches, result['slots'], start_date, end_date, activate)
+        return run
+
+    @api.model
+    def _create_timetables(self, batches, slots, start_date=None, end_date=None, activate=False):
+        """Créer un emploi du temps par classe à partir des créneaux calculés"""
+        start_date = fields.Date.to_date(start_date) or fields.Date.today()
+        end_date = fields.Date.to_date(end_date) or start_date + timedelta(weeks=36)
+
+        slots_by_batch = {}
+        for slot in slots:
+            slots_by_batch.setdefault(slot['class_id'], []).append(slot)
+
+        Timetable = self.env['op.timetable'].with_context(conflict_replaced_batch_ids=batches.ids)
+        if activate:
+            Timetable.search([('batch_id', 'in', batches.ids), ('state', '=', 'active')]).write({'state': 'archived'})
+
+        vals_list = []
+        for batch in batches:
+            vals_list.append({
+                'name': _("Emploi du temps généré - %s") % batch.name,
+                'batch_id': batch.id,
+                'faculty_id': batch.class_teacher_id.id,
+                'start_date': start_date,
+                'end_date': end_date,
+                'state': 'active' if activate else 'draft',
+                'notes': _("Généré automatiquement le %s") % fields.Datetime.now().strftime('%d/%m/%Y %H:%M'),
+                'slot_ids': [(0, 0, {
+                    'day_of_week': str(slot['day']),
+                    'start_time': slot['start'],
+                    'end_time': slot['end'],
+                    'subject_id': slot['subject_id'] or False,
+                    'faculty_id': slot['teacher_id'] or False,
+                    'classroom_id': slot['room_id'] or False,
+                }) for slot in slots_by_batch.get(batch.id, [])],
+            })
+        timetables = Timetable.create(vals_list)
+        if activate:
+            for timetable in timetables:
+                timetable.batch_id.timetable_id = timetable
+        return timetables
+
+    @api.model
+    def run_benchmark(self, class_count=40, seed=0):
+        """Résoudre une école fictive et enregistrer le temps et la qualité obtenus"""
+        stats = run_benchmark(class_count, seed)
+        vals = self._prepare_stats_vals(stats)
+        vals.update({
+            'name': _("Banc d'essai %s classes (graine %s)") % (class_count, seed),
+            'run_type': 'benchmark',
+            'details': stats,
+        })
+        return self.create(vals)
+
+    def _get_api_data(self):
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'name': self.name,
+            'run_type': self.run_type,
+            'class_count': self.class_count,
+            'lesson_count': self.lesson_count,
+            'placed_count': self.placed_count,
+            'unplaced_count': self.unplaced_count,
+            'placement_rate': self.placement_rate,
+            'class_gaps': self.class_gaps,
+            'teacher_gaps': self.teacher_gaps,
+            'daily_overload': self.daily_overload,
+            'repairs': self.repairs,
+            'duration_ms': self.duration_ms,
+            'details': self.details or {},
+            'timetable_ids': self.timetable_ids.ids,
+            'created_at': self.create_date.strftime('%Y-%m-%d %H:%M:%S') if self.create_date else None,
+        }
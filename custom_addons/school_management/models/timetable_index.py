@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Index d'intervalles pour la détection des conflits d'emploi du temps.
+
+Les créneaux sont rangés par (dimension, ressource, jour) puis triés par heure
+de début : un balayage unique de chaque case suffit à trouver tous les
+chevauchements. Ce module ne dépend pas de l'ORM ; les modèles lui passent
+des dictionnaires de créneaux.
+"""
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+
+# Ressources qui ne peuvent pas être à deux endroits en même temps
+CONFLICT_DIMENSIONS = ('classroom', 'faculty', 'batch')
+
+
+def periods_overlap(slot_a, slot_b):
+    """Les périodes de validité des deux emplois du temps se recouvrent-elles ?"""
+    if not (slot_a.get('period_start') and slot_a.get('period_end')
+            and slot_b.get('period_start') and slot_b.get('period_end')):
+        return True
+    return slot_a['period_start'] <= slot_b['period_end'] and slot_b['period_start'] <= slot_a['period_end']
+
+
+def can_conflict(slot_a, slot_b):
+    """Deux créneaux peuvent-ils être en conflit ?
+
+    Deux emplois du temps différents d'une même classe sont des versions
+    concurrentes (brouillon qui remplacera l'actif) : ils ne se gênent pas.
+    """
+    if slot_a['id'] == slot_b['id']:
+        return False
+    if (slot_a['timetable_id'] != slot_b['timetable_id']
+            and slot_a.get('batch_id') and slot_a.get('batch_id') == slot_b.get('batch_id')):
+        return False
+    return periods_overlap(slot_a, slot_b)
+
+
+class SlotConflictIndex:
+    """Index des créneaux par (dimension, ressource, jour)
+
+    Chaque créneau est un dictionnaire avec au moins : id, timetable_id, day,
+    start, end et les identifiants classroom_id, faculty_id, batch_id
+    (éventuellement vides). period_start/period_end limitent la comparaison
+    aux emplois du temps actifs sur la même période.
+    """
+
+    def __init__(self, slots=()):
+        self._buckets = defaultdict(list)
+        self._starts = {}
+        self._sorted = True
+        for slot in slots:
+            self.add(slot)
+
+    def add(self, slot):
+        for dimension in CONFLICT_DIMENSIONS:
+            resource_id = slot.get('%s_id' % dimension)
+            if resource_id:
+                self._buckets[(dimension, resource_id, slot['day'])].append(slot)
+        self._sorted = False
+
+    def _ensure_sorted(self):
+        if not self._sorted:
+            for key, bucket in self._buckets.items():
+                bucket.sort(key=lambda slot: (slot['start'], slot['end'], slot['id']))
+                self._starts[key] = [slot['start'] for slot in bucket]
+            self._sorted = True
+
+    def conflicts(self):
+        """Tous les chevauchements, en un balayage par case
+
+        :return: liste de dicts {dimension, resource_id, day, slot_ids, start, end},
+                 start/end délimitant la plage commune
+        """
+        self._ensure_sorted()
+        result = []
+        for (dimension, resource_id, day), bucket in self._buckets.items():
+            active = []  # tas (fin, ordre, créneau) des créneaux en cours
+            for order, slot in enumerate(bucket):
+                while active and active[0][0] <= slot['start']:
+                    heapq.heappop(active)
+                for _end, _order, other in active:
+                    if can_conflict(other, slot):
+                        result.append(self._make_conflict(dimension, resource_id, day, other, slot))
+                heapq.heappush(active, (slot['end'], order, slot))
+        result.sort(key=lambda c: (c['dimension'], c['day'], c['start'], c['slot_ids']))
+        return result
+
+    def conflicts_for(self, slot):
+        """Chevauchements d'un créneau donné avec les créneaux indexés"""
+        self._ensure_sorted()
+        result = []
+        for dimension in CONFLICT_DIMENSIONS:
+            resource_id = slot.get('%s_id' % dimension)
+            if not resource_id:
+                continue
+            key = (dimension, resource_id, slot['day'])
+            bucket = self._buckets.get(key, [])
+            # Seuls les créneaux commençant avant la fin de celui-ci peuvent le chevaucher
+            stop = bisect_left(self._starts.get(key, []), slot['end'])
+            for other in bucket[:stop]:
+                if other['end'] > slot['start'] and can_conflict(other, slot):
+                    result.append(self._make_conflict(dimension, resource_id, slot['day'], other, slot))
+        return result
+
+    @staticmethod
+    def _make_conflict(dimension, resource_id, day, slot_a, slot_b):
+        return {
+            'dimension': dimension,
+            'resource_id': resource_id,
+            'day': day,
+            'slot_ids': tuple(sorted((slot_a['id'], slot_b['id']))),
+            'start': max(slot_a['start'], slot_b['start']),
+            'end': min(slot_a['end'], slot_b['end']),
+        }
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""Solveur d'emplois du temps pour toute une école.
+
+Chaque cours d'une classe est découpé en unités d'une période (une heure),
+placées une à une, des plus contraintes aux plus souples (salle spécialisée
+rare, peu de jours autorisés, enseignant chargé). Pour chaque unité, le
+meilleur couple (jour, période) est choisi parmi ceux où la classe,
+l'enseignant et une salle adaptée sont libres : on évite les trous, on
+étale un même cours sur la semaine et on équilibre les journées. Quand une
+unité ne trouve aucune place, une réparation déplace un unique cours
+bloquant vers un autre créneau.
+
+Le module ne dépend pas de l'ORM : les modèles lui passent des
+dictionnaires. ``run_benchmark`` génère une école fictive pour suivre le
+temps de résolution et la qualité ; il se lance aussi en ligne de commande :
+
+    python3 timetable_solver.py [nombre_de_classes]
+"""
+import math
+import random
+import time
+from collections import defaultdict
+
+# Grille horaire par défaut : (début, fin) en heures décimales
+DEFAULT_PERIODS = (
+    (8.0, 9.0), (9.0, 10.0), (10.0, 11.0), (11.0, 12.0),
+    (14.0, 15.0), (15.0, 16.0), (16.0, 17.0),
+)
+# Jours de cours par défaut (0 = lundi)
+DEFAULT_DAYS = (0, 1, 2, 3, 4)
+# Nombre maximum d'heures d'un même cours dans une journée
+MAX_DAILY_UNITS = 2
+
+# Occupation imposée de l'extérieur (emplois du temps non recalculés)
+FIXED = object()
+
+
+def hours_to_units(hours, period_length=1.0):
+    """Nombre de périodes nécessaires pour un volume horaire hebdomadaire"""
+    if not hours or hours <= 0:
+        return 0
+    return max(1, int(math.ceil(round(hours / period_length, 2))))
+
+
+class Lesson:
+    """Une unité de cours à placer (une période)"""
+
+    __slots__ = ('class_id', 'course_id', 'subject_id', 'teacher_ids', 'days',
+                 'rooms', 'features', 'index', 'teacher_id', 'room_id', 'day', 'period')
+
+    def __init__(self, class_id, course, rooms, index):
+        self.class_id = class_id
+        self.course_id = course['course_id']
+        self.subject_id = course.get('subject_id')
+        self.teacher_ids = list(course.get('teacher_ids') or [])
+        self.days = tuple(course.get('days') or DEFAULT_DAYS)
+        self.features = frozenset(course.get('features') or ())
+        self.rooms = rooms
+        self.index = index
+        self.teacher_id = None
+        self.room_id = None
+        self.day = None
+        self.period = None
+
+    @property
+    def placed(self):
+        return self.day is not None
+
+
+class TimetableSolver:
+    """Placement des cours de plusieurs classes sans conflit
+
+    :param classes: liste de dicts {id, size, home_room_id, courses}, chaque
+        cours étant un dict {course_id, subject_id, hours, teacher_ids (ordre
+        de préférence), days, features, room_id (salle préférée)}
+    :param rooms: liste de dicts {id, capacity, features}
+    :param busy: occupations déjà fixées, dicts {dimension ('faculty' ou
+        'classroom'), resource_id, day, start, end}
+    """
+
+    def __init__(self, classes, rooms, periods=DEFAULT_PERIODS, busy=(),
+                 max_daily_units=MAX_DAILY_UNITS, max_repairs=5000):
+        self.classes = list(classes)
+        self.rooms = [dict(room, features=frozenset(room.get('features') or ())) for room in rooms]
+        self.periods = tuple(periods)
+        self.max_daily_units = max_daily_units
+        self.max_repairs = max_repairs
+
+        self._class_busy = {}
+        self._teacher_busy = {}
+        self._room_busy = {}
+        self._course_teacher = {}
+        self._course_day_count = defaultdict(int)
+        self._class_day_periods = defaultdict(set)
+        self._teacher_load = defaultdict(int)
+        self._room_cache = {}
+        self.repairs = 0
+
+        for entry in busy:
+            self._add_busy(entry)
+        self.lessons = self._build_lessons()
+
+    # ------------------------------------------------------------------
+    # Préparation
+    # ------------------------------------------------------------------
+
+    def _periods_between(self, start, end):
+        return [index for index, (p_start, p_end) in enumerate(self.periods)
+                if p_start < end and start < p_end]
+
+    def _add_busy(self, entry):
+        target = self._teacher_busy if entry['dimension'] == 'faculty' else self._room_busy
+        for period in self._periods_between(entry['start'], entry['end']):
+            target[(entry['resource_id'], entry['day'], period)] = FIXED
+
+    def _candidate_rooms(self, size, features, preferred):
+        """Salles compatibles, dans l'ordre de préférence
+
+        Salles préférées d'abord, puis les moins équipées et les plus petites,
+        pour garder les salles spécialisées et les grandes salles disponibles.
+        """
+        key = (size, features, preferred)
+        if key not in self._room_cache:
+            rooms = [room for room in self.rooms
+                     if features <= room['features'] and (room.get('capacity') or 0) >= size]
+            if not rooms and not features:
+                # Aucune salle assez grande : toutes les salles, des plus petites aux plus grandes
+                rooms = [room for room in self.rooms]
+            rooms.sort(key=lambda room: (
+                preferred.index(room['id']) if room['id'] in preferred else len(preferred),
+                len(room['features']),
+                room.get('capacity') or 0,
+            ))
+            room_ids = [room['id'] for room in rooms]
+            if not room_ids and not features and not self.rooms:
+                # École sans salles déclarées : créneaux sans salle
+                room_ids = [None]
+            self._room_cache[key] = room_ids
+        return self._room_cache[key]
+
+    def _build_lessons(self):
+        period_length = (self.periods[0][1] - self.periods[0][0]) if self.periods else 1.0
+        lessons = []
+        for school_class in self.classes:
+            size = school_class.get('size') or 0
+            for course in school_class.get('courses', []):
+                features = frozenset(course.get('features') or ())
+                preferred = tuple(room_id for room_id in (course.get('room_id'), school_class.get('home_room_id'))
+                                  if room_id)
+                rooms = self._candidate_rooms(size, features, preferred)
+                for index in range(hours_to_units(course.get('hours'), period_length)):
+                    lessons.append(Lesson(school_class['id'], course, rooms, index))
+
+        # Charge des enseignants uniques : ils sont le goulot d'étranglement
+        demand = defaultdict(int)
+        for lesson in lessons:
+            if len(lesson.teacher_ids) == 1:
+                demand[lesson.teacher_ids[0]] += 1
+
+        def difficulty(lesson):
+            return (
+                len(lesson.rooms) if lesson.features else len(self.rooms) + 1,
+                len(lesson.days),
+                -(demand[lesson.teacher_ids[0]] if len(lesson.teacher_ids) == 1 else 0),
+                lesson.class_id,
+                lesson.course_id,
+                lesson.index,
+            )
+        lessons.sort(key=difficulty)
+        return lessons
+
+    # ------------------------------------------------------------------
+    # Placement
+    # ------------------------------------------------------------------
+
+    def _teachers_for(self, lesson):
+        assigned = self._course_teacher.get((lesson.class_id, lesson.course_id))
+        if assigned is not None:
+            return [assigned]
+        if not lesson.teacher_ids:
+            return [None]
+        return sorted(lesson.teacher_ids, key=lambda teacher_id: self._teacher_load[teacher_id])
+
+    def _free_resources(self, lesson, day, period):
+        """(enseignant, salle) libres pour l'unité, ou None"""
+        if (lesson.class_id, day, period) in self._class_busy:
+            return None
+        teacher_id = next((t for t in self._teachers_for(lesson)
+                           if t is None or (t, day, period) not in self._teacher_busy), False)
+        if teacher_id is False:
+            return None
+        room_id = next((r for r in lesson.rooms
+                        if r is None or (r, day, period) not in self._room_busy), False)
+        if room_id is False:
+            return None
+        return teacher_id, room_id
+
+    def _score(self, lesson, day, period):
+        """Coût d'un créneau : plus il est bas, meilleur il est"""
+        score = self._course_day_count[(lesson.class_id, lesson.course_id, day)] * 10.0
+        day_periods = self._class_day_periods[(lesson.class_id, day)]
+        if day_periods:
+            distance = min(abs(period - other) for other in day_periods)
+            if distance > 1:
+                score += (distance - 1) * 3.0
+        score += len(day_periods)
+        return score + period * 0.1
+
+    def _assign(self, lesson, day, period, teacher_id, room_id):
+        lesson.day, lesson.period = day, period
+        lesson.teacher_id, lesson.room_id = teacher_id, room_id
+        self._class_busy[(lesson.class_id, day, period)] = lesson
+        if teacher_id is not None:
+            self._teacher_busy[(teacher_id, day, period)] = lesson
+            self._teacher_load[teacher_id] += 1
+            self._course_teacher.setdefault((lesson.class_id, lesson.course_id), teacher_id)
+        if room_id is not None:
+            self._room_busy[(room_id, day, period)] = lesson
+        self._course_day_count[(lesson.class_id, lesson.course_id, day)] += 1
+        self._class_day_periods[(lesson.class_id, day)].add(period)
+
+    def _unassign(self, lesson):
+        day, period = lesson.day, lesson.period
+        del self._class_busy[(lesson.class_id, day, period)]
+        if lesson.teacher_id is not None:
+            del self._teacher_busy[(lesson.teacher_id, day, period)]
+            self._teacher_load[lesson.teacher_id] -= 1
+        if lesson.room_id is not None:
+            del self._room_busy[(lesson.room_id, day, period)]
+        self._course_day_count[(lesson.class_id, lesson.course_id, day)] -= 1
+        self._class_day_periods[(lesson.class_id, day)].discard(period)
+        lesson.day = lesson.period = lesson.teacher_id = lesson.room_id = None
+
+    def _place(self, lesson, daily_cap, forbidden=None):
+        """Placer l'unité au meilleur créneau libre ; True si placée"""
+        best = None
+        for day in lesson.days:
+            if daily_cap and self._course_day_count[(lesson.class_id, lesson.course_id, day)] >= daily_cap:
+                continue
+            for period in range(len(self.periods)):
+                if forbidden == (day, period):
+                    continue
+                resources = self._free_resources(lesson, day, period)
+                if resources is None:
+                    continue
+                score = self._score(lesson, day, period)
+                if best is None or score < best[0]:
+                    best = (score, day, period, resources)
+        if best is None:
+            return False
+        _score, day, period, (teacher_id, room_id) = best
+        self._assign(lesson, day, period, teacher_id, room_id)
+        return True
+
+    def _single_blocker(self, lesson, day, period):
+        """Unique unité à déplacer pour libérer le créneau, avec les ressources obtenues"""
+        class_occupant = self._class_busy.get((lesson.class_id, day, period))
+        for teacher_id in self._teachers_for(lesson):
+            teacher_occupant = self._teacher_busy.get((teacher_id, day, period)) if teacher_id is not None else None
+            if teacher_occupant is FIXED:
+                continue
+            for room_id in lesson.rooms:
+                room_occupant = self._room_busy.get((room_id, day, period)) if room_id is not None else None
+                if room_occupant is FIXED:
+                    continue
+                blockers = {occupant for occupant in (class_occupant, teacher_occupant, room_occupant)
+                            if occupant is not None}
+                if len(blockers) == 1:
+                    return blockers.pop(), teacher_id, room_id
+        return None
+
+    def _repair(self, lesson, daily_cap):
+        """Libérer un créneau en déplaçant une seule autre unité"""
+        for day in lesson.days:
+            if daily_cap and self._course_day_count[(lesson.class_id, lesson.course_id, day)] >= daily_cap:
+                continue
+            for period in range(len(self.periods)):
+                if self.repairs >= self.max_repairs:
+                    return False
+                found = self._single_blocker(lesson, day, period)
+                if not found:
+                    continue
+                blocker, teacher_id, room_id = found
+                self.repairs += 1
+                origin = (blocker.day, blocker.period, blocker.teacher_id, blocker.room_id)
+                self._unassign(blocker)
+                if self._free_resources(lesson, day, period) is None:
+                    self._assign(blocker, *origin)
+                    continue
+                self._assign(lesson, day, period, teacher_id, room_id)
+                if self._place(blocker, daily_cap, forbidden=(day, period)):
+                    return True
+                self._unassign(lesson)
+                self._assign(blocker, *origin)
+        return False
+
+    def solve(self):
+        """Placer toutes les unités
+
+        :return: dict {slots, unplaced, stats}
+        """
+        started = time.perf_counter()
+        pending = []
+        for lesson in self.lessons:
+            if not self._place(lesson, self.max_daily_units) and not self._repair(lesson, self.max_daily_units):
+                pending.append(lesson)
+        # Deuxième passe sans plafond journalier pour les unités restantes
+        unplaced = [lesson for lesson in pending
+                    if not self._place(lesson, None) and not self._repair(lesson, None)]
+        duration = time.perf_counter() - started
+
+        return {
+            'slots': self._merge_slots(),
+            'unplaced': [{
+                'class_id': lesson.class_id,
+                'course_id': lesson.course_id,
+                'subject_id': lesson.subject_id,
+                'reason': 'no_room' if not lesson.rooms else 'no_free_slot',
+            } for lesson in unplaced],
+            'stats': self._stats(duration, len(unplaced)),
+        }
+
+    # ------------------------------------------------------------------
+    # Résultat
+    # ------------------------------------------------------------------
+
+    def _merge_slots(self):
+        """Regrouper les unités consécutives d'un même cours en un créneau"""
+        placed = sorted((lesson for lesson in self.lessons if lesson.placed),
+                        key=lambda l: (l.class_id, l.day, l.period))
+        slots = []
+        for lesson in placed:
+            start, end = self.periods[lesson.period]
+            previous = slots[-1] if slots else None
+            if (previous and previous['class_id'] == lesson.class_id and previous['day'] == lesson.day
+                    and previous['course_id'] == lesson.course_id
+                    and previous['teacher_id'] == lesson.teacher_id
+                    and previous['room_id'] == lesson.room_id
+                    and previous['end'] == start):
+                previous['end'] = end
+                continue
+            slots.append({
+                'class_id': lesson.class_id,
+                'course_id': lesson.course_id,
+                'subject_id': lesson.subject_id,
+                'teacher_id': lesson.teacher_id,
+                'room_id': lesson.room_id,
+                'day': lesson.day,
+                'start': start,
+                'end': end,
+            })
+        return slots
+
+    @staticmethod
+    def _count_gaps(periods_by_key):
+        gaps = 0
+        for periods in periods_by_key.values():
+            if periods:
+                gaps += (max(periods) - min(periods) + 1) - len(periods)
+        return gaps
+
+    def _stats(self, duration, unplaced_count):
+        teacher_periods = defaultdict(set)
+        overload = 0
+        for lesson in self.lessons:
+            if lesson.placed and lesson.teacher_id is not None:
+                teacher_periods[(lesson.teacher_id, lesson.day)].add(lesson.period)
+        for count in self._course_day_count.values():
+            overload += max(0, count - self.max_daily_units)
+        total = len(self.lessons)
+        return {
+            'classes': len(self.classes),
+            'lessons': total,
+            'placed': total - unplaced_count,
+            'unplaced': unplaced_count,
+            'placement_rate': round(100.0 * (total - unplaced_count) / total, 2) if total else 100.0,
+            'class_gaps': self._count_gaps(self._class_day_periods),
+            'teacher_gaps': self._count_gaps(teacher_periods),
+            'daily_overload': overload,
+            'repairs': self.repairs,
+            'duration_ms': round(duration * 1000.0, 1),
+        }
+
+
+# ----------------------------------------------------------------------
+# Banc d'essai
+# ----------------------------------------------------------------------
+
+# Programme type d'une classe de collège : (matière, heures, équipements)
+BENCHMARK_CURRICULUM = (
+    ('francais', 4.0, ()),
+    ('maths', 4.0, ()),
+    ('histoire_geo', 3.0, ()),
+    ('anglais', 3.0, ()),
+    ('espagnol', 2.5, ()),
+    ('physique_chimie', 1.5, ('lab',)),
+    ('svt', 1.5, ('lab',)),
+    ('technologie', 1.5, ('computer',)),
+    ('eps', 3.0, ()),
+    ('arts_plastiques', 1.0, ()),
+    ('musique', 1.0, ()),
+    ('emc', 0.5, ()),
+)
+# Service hebdomadaire d'un enseignant fictif (en périodes)
+BENCHMARK_TEACHER_LOAD = 18
+
+
+def build_benchmark_school(class_count=40, seed=0):
+    """École fictive : classes, enseignants par matière et salles
+
+    :return: (classes, rooms) au format de TimetableSolver
+    """
+    rng = random.Random(seed)
+    rooms = [{'id': 'room_%d' % index, 'capacity': rng.choice((30, 32, 35)), 'features': ()}
+             for index in range(class_count)]
+    lab_units = sum(hours_to_units(h) for _name, h, features in BENCHMARK_CURRICULUM if 'lab' in features)
+    computer_units = sum(hours_to_units(h) for _name, h, features in BENCHMARK_CURRICULUM if 'computer' in features)
+    week = len(DEFAULT_DAYS) * len(DEFAULT_PERIODS)
+    for index in range(int(math.ceil(class_count * lab_units * 1.2 / week))):
+        rooms.append({'id': 'lab_%d' % index, 'capacity': 32, 'features': ('lab',)})
+    for index in range(int(math.ceil(class_count * computer_units * 1.2 / week))):
+        rooms.append({'id': 'computer_%d' % index, 'capacity': 32, 'features': ('computer',)})
+
+    classes = [{'id': 'class_%d' % index, 'size': rng.randint(24, 30),
+                'home_room_id': 'room_%d' % index, 'courses': []}
+               for index in range(class_count)]
+    for subject, hours, features in BENCHMARK_CURRICULUM:
+        per_teacher = max(1, BENCHMARK_TEACHER_LOAD // hours_to_units(hours))
+        for index, school_class in enumerate(classes):
+            teacher_id = '%s_%d' % (subject, index // per_teacher)
+            school_class['courses'].append({
+                'course_id': subject,
+                'subject_id': subject,
+                'hours': hours,
+                'teacher_ids': [teacher_id],
+                'days': DEFAULT_DAYS,
+                'features': features,
+            })
+    return classes, rooms
+
+
+def run_benchmark(class_count=40, seed=0):
+    """Résoudre une école fictive et renvoyer les statistiques de résolution"""
+    classes, rooms = build_benchmark_school(class_count, seed)
+    solver = TimetableSolver(classes, rooms)
+    result = solver.solve()
+    stats = dict(result['stats'], seed=seed, rooms=len(rooms))
+    return stats
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+    print(json.dumps(run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 40), indent=2))
@@ -2231,25 +2231,52 @@ class OdooAPI {
   
   // Générer des bulletins en lot
   async generateBulletinsBatch(batchId, trimestreId, options = {}) {
+    const { onProgress, pollInterval = 2000, ...generationOptions } = options;
     try {
       const response = await this.makeRequest('/api/bulletins/generate-batch', {
         method: 'POST',
         body: JSON.stringify({ 
           batch_id: batchId, 
           trimestre_id: trimestreId,
-          ...options
+          ...generationOptions
         })
       });
       
-      if (response.status === 'success') {
-        return { success: true, data: response.data, message: response.message };
+      if (response.status !== 'success') {
+        throw new Error(response.message || 'Erreur lors de la génération des bulletins');
+      }
+
+      // La génération tourne en arrière-plan : suivre la tâche jusqu'à la fin
+      let job = response.data;
+      while (job && job.job_id && !['done', 'failed'].includes(job.state)) {
+        await new Promise(resolve => setTimeout(resolve, pollInterval));
+        job = { ...(await this.getBulletinGenerationJob(job.job_id)), job_id: job.job_id };
+        if (onProgress) {
+          onProgress(job);
+        }
       }
-      throw new Error(response.message || 'Erreur lors de la génération des bulletins');
+
+      if (job.state === 'failed') {
+        throw new Error(job.summary || 'Erreur lors de la génération des bulletins');
+      }
+      return { success: true, data: job, message: job.summary || response.message };
     } catch (error) {
       console.error('Erreur génération bulletins:', error);
       throw error;
     }
   }
+
+  // Suivre une génération de bulletins en arrière-plan
+  async getBulletinGenerationJob(jobId) {
+    const response = await this.makeRequest(`/api/bulletins/jobs/${jobId}`, {
+      method: 'GET'
+    });
+
+    if (response.status === 'success') {
+      return response.data;
+    }
+    throw new Error(response.message || 'Tâche de génération introuvable');
+  }
   
   // Récupérer les étudiants d'une classe
   async getStudentsByBatch(batchId) {
@@ -2817,6 +2844,42 @@ class OdooAPI {
     }
   }
 
+  // Télécharger tous les bulletins d'une classe (PDF fusionné ou archive ZIP)
+  async printBulletinsBatch(batchId, trimestreId, format = 'pdf') {
+    try {
+      const params = new URLSearchParams({ batch_id: batchId, trimestre_id: trimestreId, format });
+      const response = await fetch(`${this.getBaseUrl()}/api/bulletins/print-batch?${params.toString()}`, {
+        method: 'GET',
+        credentials: 'include'
+      });
+
+      if (!response.ok) {
+        throw new Error(`Erreur HTTP: ${response.status}`);
+      }
+
+      const contentType = response.headers.get('content-type') || '';
+      if (contentType.includes('application/json')) {
+        const jsonResponse = await response.json();
+        throw new Error(jsonResponse.message || 'Erreur lors de l\'impression des bulletins');
+      }
+
+      const blob = await response.blob();
+      const url = window.URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      link.setAttribute('download', `bulletins_${batchId}_${trimestreId}.${format === 'zip' ? 'zip' : 'pdf'}`);
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      window.URL.revokeObjectURL(url);
+
+      return { success: true, message: 'Bulletins téléchargés avec succès' };
+    } catch (error) {
+      console.error('❌ Erreur impression bulletins en lot:', error);
+      throw error;
+    }
+  }
+
   // Archiver un bulletin
   async archiveBulletin(bulletinId) {
     try {
@@ -2834,6 +2897,28 @@ class OdooAPI {
     }
   }
 
+  // Appliquer une action (calculate, validate, publish, archive) à plusieurs bulletins
+  // selection: { ids: [...] } ou { batchId, trimestreId }
+  async bulkBulletinAction(action, { ids, batchId, trimestreId } = {}) {
+    try {
+      const payload = ids && ids.length
+        ? { action, ids }
+        : { action, batch_id: batchId, trimestre_id: trimestreId };
+      const response = await this.makeRequest('/api/bulletins/bulk-action', {
+        method: 'POST',
+        body: JSON.stringify(payload)
+      });
+
+      if (response.status === 'success') {
+        return { success: true, data: response.data, message: response.message };
+      }
+      throw new Error(response.message || 'Erreur lors de l\'action en masse sur les bulletins');
+    } catch (error) {
+      console.error('Erreur action en masse bulletins:', error);
+      throw error;
+    }
+  }
+
   // Méthode utilitaire pour créer des présences synchronisées avec la session
   async createSynchronizedAttendances(sessionId, attendanceData) {
     try {
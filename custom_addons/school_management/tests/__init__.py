@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+from . import test_timetable_index
+from . import test_timetable_solver
+from . import test_resource_occupancy
+from . import test_ical
+from . import test_bulletin_pdf
+from . import test_checkin_buffer
+from . import test_bulletin_ranking
+from . import test_bulletin_subject_stats
+from . import test_attendance_upsert
+from . import test_attendance_fact
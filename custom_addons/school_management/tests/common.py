@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+from odoo.tests import TransactionCase
+
+
+class SchoolTestCommon(TransactionCase):
+    """Classe, matières et trimestre partagés par les tests sur l'ORM"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.course = cls.env['op.course'].create({
+            'name': 'Mathématiques - 6ème',
+            'code': 'TEST_MATH_6',
+            'education_level': 'college',
+            'class_level': '6eme',
+            'subject_area': 'autre',
+            'course_type': 'obligatoire',
+        })
+        cls.batch = cls.env['op.batch'].create({
+            'name': '6ème A',
+            'code': 'TEST_6A',
+            'start_date': date(2024, 9, 1),
+            'end_date': date(2025, 6, 30),
+            'course_id': cls.course.id,
+            'school_cycle': 'college',
+        })
+        cls.subject_math, cls.subject_french = cls.env['op.subject'].create([
+            {'name': 'Algèbre', 'code': 'TEST_ALG', 'course_id': cls.course.id},
+            {'name': 'Lecture', 'code': 'TEST_LEC', 'course_id': cls.course.id},
+        ])
+        cls.trimestre = cls.env['op.trimestre'].create({
+            'name': 'Trimestre 1',
+            'code': 'TEST_T1',
+            'date_debut': date(2024, 9, 1),
+            'date_fin': date(2024, 12, 20),
+            'annee_scolaire': '2024-2025',
+            'education_level': 'college',
+        })
+
+    @classmethod
+    def create_faculty(cls, first_name='Paul', last_name='Professeur'):
+        return cls.env['op.faculty'].create({
+            'first_name': first_name,
+            'last_name': last_name,
+            'gender': 'male',
+            'birth_date': date(1980, 1, 1),
+        })
+
+    @classmethod
+    def create_session(cls, faculty, start, end):
+        """Session d'algèbre de la classe entre deux datetimes"""
+        return cls.env['op.session'].create({
+            'name': 'Algèbre - 6ème A',
+            'subject_id': cls.subject_math.id,
+            'batch_id': cls.batch.id,
+            'course_id': cls.course.id,
+            'faculty_id': faculty.id,
+            'start_datetime': start,
+            'end_datetime': end,
+        })
+
+    @classmethod
+    def create_student(cls, first_name, last_name='Test'):
+        return cls.env['op.student'].create({
+            'first_name': first_name,
+            'last_name': last_name,
+            'gender': 'male',
+        })
+
+    @classmethod
+    def create_bulletin(cls, student, notes, state='calculated'):
+        """Bulletin d'un élève avec une moyenne par matière {matière: moyenne}"""
+        return cls.env['op.bulletin'].create({
+            'student_id': student.id,
+            'course_id': cls.course.id,
+            'batch_id': cls.batch.id,
+            'trimestre_id': cls.trimestre.id,
+            'state': state,
+            'note_lines': [(0, 0, {
+                'subject_id': subject.id,
+                'moyenne_matiere': moyenne,
+                'coefficient': 1.0,
+            }) for subject, moyenne in notes.items()],
+        })
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime
+
+from odoo.tests import tagged
+
+from .common import SchoolTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAttendanceFact(SchoolTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        faculty = cls.create_faculty()
+        cls.session = cls.create_session(faculty, datetime(2024, 9, 2, 8, 0), datetime(2024, 9, 2, 9, 0))
+        cls.other_session = cls.create_session(faculty, datetime(2024, 9, 9, 8, 0), datetime(2024, 9, 9, 9, 0))
+        cls.alice = cls.create_student('Alice')
+        cls.bruno = cls.create_student('Bruno')
+        cls.chloe = cls.create_student('Chloé')
+        register = cls.env['op.attendance.register'].create({
+            'name': 'Registre 6ème A',
+            'code': 'TEST_REG_6A',
+            'course_id': cls.course.id,
+            'batch_id': cls.batch.id,
+        })
+        cls.sheet = cls.env['op.attendance.sheet'].create({
+            'register_id': register.id,
+            'session_id': cls.session.id,
+            'attendance_date': cls.session.date,
+        })
+
+    def mark_session(self, student, state, session=None):
+        session = session or self.session
+        return self.env['op.attendance'].create({
+            'session_id': session.id,
+            'student_id': student.id,
+            'date': session.date,
+            'state': state,
+        })
+
+    def mark_sheet(self, student, present):
+        return self.env['op.attendance.line'].create({
+            'attendance_id': self.sheet.id,
+            'student_id': student.id,
+            'present': present,
+        })
+
+    def totals(self, total=0, present=0, late=0, absent=0, excused=0):
+        return {'total': total, 'present': present, 'late': late, 'absent': absent, 'excused': excused}
+
+    def student_totals(self, student):
+        return self.env['op.attendance.daily'].get_student_totals([student.id]).get(student.id)
+
+    def batch_totals(self, date_from=None, date_to=None):
+        return self.env['op.attendance.monthly'].get_batch_totals(
+            [self.batch.id], date_from, date_to).get(self.batch.id)
+
+    def test_session_attendance_wins_over_sheet(self):
+        # Alice est pointée dans les deux sources : seule la présence de session compte
+        self.mark_session(self.alice, 'late')
+        self.mark_sheet(self.alice, present=False)
+        self.mark_sheet(self.bruno, present=True)
+        self.mark_session(self.chloe, 'absent')
+        self.env.cr.flush()
+
+        self.assertEqual(self.env['op.attendance.fact'].get_session_totals([self.session.id]),
+                         {self.session.id: self.totals(3, present=1, late=1, absent=1)})
+        self.assertEqual(self.student_totals(self.alice), self.totals(1, late=1))
+        self.assertEqual(self.student_totals(self.bruno), self.totals(1, present=1))
+        self.assertEqual(self.student_totals(self.chloe), self.totals(1, absent=1))
+        self.assertEqual(self.batch_totals(), self.totals(3, present=1, late=1, absent=1))
+
+    def test_edits_are_reaggregated_before_commit(self):
+        alice_session = self.mark_session(self.alice, 'late')
+        alice_line = self.mark_sheet(self.alice, present=False)
+        bruno_line = self.mark_sheet(self.bruno, present=True)
+        chloe_session = self.mark_session(self.chloe, 'absent')
+        self.env.cr.flush()
+
+        # Sans présence de session, la feuille d'appel d'Alice est reprise
+        alice_session.unlink()
+        bruno_line.present = False
+        chloe_session.state = 'present'
+        self.env.cr.flush()
+        self.assertEqual(self.env['op.attendance.fact'].get_session_totals([self.session.id]),
+                         {self.session.id: self.totals(3, present=1, absent=2)})
+        self.assertEqual(self.student_totals(self.alice), self.totals(1, absent=1))
+        self.assertEqual(self.student_totals(self.bruno), self.totals(1, absent=1))
+        self.assertEqual(self.student_totals(self.chloe), self.totals(1, present=1))
+
+        # La feuille d'appel redevient masquée dès qu'une présence de session existe
+        self.mark_session(self.alice, 'present')
+        alice_line.present = True
+        self.env.cr.flush()
+        self.assertEqual(self.student_totals(self.alice), self.totals(1, present=1))
+        self.assertEqual(self.batch_totals(), self.totals(3, present=2, absent=1))
+
+    def test_daily_and_monthly_periods(self):
+        self.mark_session(self.alice, 'present')
+        self.mark_session(self.alice, 'absent', session=self.other_session)
+        self.mark_session(self.bruno, 'late', session=self.other_session)
+        self.env.cr.flush()
+
+        Daily = self.env['op.attendance.daily']
+        self.assertEqual(Daily.get_student_totals([self.alice.id])[self.alice.id],
+                         self.totals(2, present=1, absent=1))
+        self.assertEqual(
+            Daily.get_student_totals([self.alice.id], date_from=date(2024, 9, 3))[self.alice.id],
+            self.totals(1, absent=1))
+        self.assertEqual(Daily.get_totals([self.alice.id, self.bruno.id], date_to=date(2024, 9, 8)),
+                         self.totals(1, present=1))
+        self.assertEqual(self.batch_totals(), self.totals(3, present=1, late=1, absent=1))
+        self.assertEqual(self.batch_totals(date_from=date(2024, 9, 15)), self.totals(3, present=1, late=1, absent=1))
+        self.assertIsNone(self.batch_totals(date_from=date(2024, 10, 1)))
+        self.assertEqual(self.env['op.attendance.fact'].get_session_totals([self.other_session.id]),
+                         {self.other_session.id: self.totals(2, late=1, absent=1)})
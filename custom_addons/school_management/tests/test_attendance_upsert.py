@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+
+from .common import SchoolTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAttendanceUpsert(SchoolTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.session = cls.create_session(
+            cls.create_faculty(), datetime(2024, 9, 2, 8, 0), datetime(2024, 9, 2, 9, 0))
+        cls.alice = cls.create_student('Alice')
+        cls.bruno = cls.create_student('Bruno')
+
+    def upsert(self, rows, last_writer_wins=False):
+        return self.env['op.attendance']._upsert_attendance(
+            [dict(row, session_id=self.session.id) for row in rows], last_writer_wins=last_writer_wins)
+
+    def get_attendance(self, student):
+        return self.env['op.attendance'].search([
+            ('session_id', '=', self.session.id), ('student_id', '=', student.id)])
+
+    def test_insert_then_update(self):
+        written = self.upsert([
+            {'student_id': self.alice.id, 'state': 'present', 'arrival_time': 8.0},
+            {'student_id': self.bruno.id, 'state': 'absent'},
+        ])
+        self.assertEqual(sorted(written), sorted([(self.session.id, self.alice.id), (self.session.id, self.bruno.id)]))
+        attendance = self.get_attendance(self.alice)
+        self.assertEqual(attendance.state, 'present')
+        self.assertEqual(attendance.date, self.session.date)
+        self.assertEqual(self.session.attendance_ids.mapped('student_id'), self.alice | self.bruno)
+
+        self.upsert([{'student_id': self.alice.id, 'state': 'late', 'arrival_time': 8.25}])
+        self.assertEqual(len(self.get_attendance(self.alice)), 1)
+        self.assertEqual(self.get_attendance(self.alice).state, 'late')
+
+    def test_last_writer_wins_keeps_newer_entry(self):
+        self.upsert([{'student_id': self.alice.id, 'state': 'present',
+                      'marked_date': datetime(2024, 9, 2, 8, 10)}])
+
+        # Saisie hors ligne plus ancienne, synchronisée après coup : ignorée
+        written = self.upsert([{'student_id': self.alice.id, 'state': 'absent',
+                                'marked_date': datetime(2024, 9, 2, 8, 5)}], last_writer_wins=True)
+        self.assertEqual(written, [])
+        attendance = self.get_attendance(self.alice)
+        self.assertEqual(attendance.state, 'present')
+        self.assertEqual(attendance.marked_date, datetime(2024, 9, 2, 8, 10))
+
+        # Saisie plus récente : elle remplace la présence
+        written = self.upsert([{'student_id': self.alice.id, 'state': 'late',
+                                'marked_date': datetime(2024, 9, 2, 8, 20)}], last_writer_wins=True)
+        self.assertEqual(written, [(self.session.id, self.alice.id)])
+        attendance = self.get_attendance(self.alice)
+        self.assertEqual(attendance.state, 'late')
+        self.assertEqual(attendance.marked_date, datetime(2024, 9, 2, 8, 20))
+
+    def test_last_writer_wins_inserts_missing_rows(self):
+        written = self.upsert([{'student_id': self.bruno.id, 'state': 'present',
+                                'marked_date': datetime(2024, 9, 2, 8, 0)}], last_writer_wins=True)
+        self.assertEqual(written, [(self.session.id, self.bruno.id)])
+        self.assertEqual(self.get_attendance(self.bruno).state, 'present')
+
+    def test_without_last_writer_wins_older_entry_overwrites(self):
+        self.upsert([{'student_id': self.alice.id, 'state': 'present',
+                      'marked_date': datetime(2024, 9, 2, 8, 10)}])
+        self.upsert([{'student_id': self.alice.id, 'state': 'absent',
+                      'marked_date': datetime(2024, 9, 2, 8, 5)}])
+        self.assertEqual(self.get_attendance(self.alice).state, 'absent')
+
+    def test_duplicate_rows_last_one_wins(self):
+        written = self.upsert([
+            {'student_id': self.alice.id, 'state': 'absent'},
+            {'student_id': self.alice.id, 'state': 'present'},
+        ])
+        self.assertEqual(written, [(self.session.id, self.alice.id)])
+        self.assertEqual(self.get_attendance(self.alice).state, 'present')
+
+    def test_arrival_after_departure_is_refused(self):
+        self.upsert([{'student_id': self.alice.id, 'state': 'present', 'arrival_time': 8.0}])
+        self.get_attendance(self.alice).departure_time = 8.5
+
+        written = self.upsert([{'student_id': self.alice.id, 'state': 'late', 'arrival_time': 8.75}])
+        self.assertEqual(written, [])
+        self.assertEqual(self.get_attendance(self.alice).arrival_time, 8.0)
+
+        with self.assertRaises(ValidationError):
+            self.env['op.attendance'].upsert_session_attendance(
+                self.session, [{'student_id': self.alice.id, 'state': 'late', 'arrival_time': 9.0}])
+
+        # Une arrivée avant le départ reste acceptée
+        written = self.upsert([{'student_id': self.alice.id, 'state': 'late', 'arrival_time': 8.25}])
+        self.assertEqual(written, [(self.session.id, self.alice.id)])
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+import io
+import zipfile
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.school_management.controllers.bulletin_pdf import iter_zip
+
+
+@tagged('post_install', '-at_install')
+class TestBulletinZip(BaseCase):
+
+    def test_iter_zip_streams_all_documents(self):
+        documents = [
+            ('bulletin_%s.pdf' % index, b'%PDF-1.4 bulletin ' + str(index).encode() * 1000)
+            for index in range(5)
+        ]
+        chunks = list(iter_zip(iter(documents)))
+        self.assertTrue(all(chunks))
+        # Archive produite au fil de l'eau, pas en un seul bloc final
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), [name for name, _content in documents])
+            for name, content in documents:
+                self.assertEqual(archive.read(name), content)
+                self.assertEqual(archive.getinfo(name).compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_iter_zip_empty(self):
+        with zipfile.ZipFile(io.BytesIO(b''.join(iter_zip([])))) as archive:
+            self.assertEqual(archive.namelist(), [])
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from .common import SchoolTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestBulletinRanking(SchoolTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.alice = cls.create_bulletin(cls.create_student('Alice'), {cls.subject_math: 15.0})
+        cls.bruno = cls.create_bulletin(cls.create_student('Bruno'), {cls.subject_math: 12.0})
+        cls.chloe = cls.create_bulletin(cls.create_student('Chloé'), {cls.subject_math: 12.0})
+        cls.draft = cls.create_bulletin(cls.create_student('David'), {cls.subject_math: 18.0}, state='draft')
+
+    def refresh(self):
+        self.env['op.bulletin']._refresh_class_ranking([(self.batch.id, self.trimestre.id)])
+
+    def test_rank_with_ties(self):
+        self.refresh()
+        self.assertEqual(
+            [(b.rang_classe, b.total_eleves_classe) for b in self.alice | self.bruno | self.chloe],
+            [(1, 3), (2, 3), (2, 3)],
+        )
+        self.assertAlmostEqual(self.alice.moyenne_generale_classe, 13.0)
+
+    def test_draft_bulletins_are_not_ranked(self):
+        self.refresh()
+        self.assertEqual(self.draft.rang_classe, 0)
+        self.assertEqual(self.draft.total_eleves_classe, 0)
+
+    def test_note_change_reranks_before_commit(self):
+        self.refresh()
+        self.bruno.note_lines.moyenne_matiere = 17.0
+        self.env.cr.flush()
+        self.assertEqual(
+            [b.rang_classe for b in self.alice | self.bruno | self.chloe],
+            [2, 1, 3],
+        )
+        self.assertAlmostEqual(self.alice.moyenne_generale_classe, 14.67)
+
+    def test_refresh_drops_cached_pdf_only_when_ranking_changes(self):
+        self.refresh()
+        self.env.cr.execute("UPDATE op_bulletin SET pdf_cache_key = 'key' WHERE id IN %s",
+                            [tuple((self.alice | self.bruno).ids)])
+        self.env['op.bulletin'].invalidate_model(['pdf_cache_key'])
+        self.refresh()
+        self.assertEqual(self.alice.pdf_cache_key, 'key')
+
+        # La moyenne de classe imprimée sur les deux PDF change
+        self.chloe.note_lines.moyenne_matiere = 11.0
+        self.env.cr.flush()
+        self.assertFalse(self.alice.pdf_cache_key)
+        self.assertFalse(self.bruno.pdf_cache_key)
+        self.assertEqual(self.chloe.rang_classe, 3)
+
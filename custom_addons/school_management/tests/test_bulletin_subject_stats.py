@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from .common import SchoolTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestSubjectStats(SchoolTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.alice = cls.create_bulletin(cls.create_student('Alice'), {
+            cls.subject_math: 16.0, cls.subject_french: 9.0})
+        cls.bruno = cls.create_bulletin(cls.create_student('Bruno'), {
+            cls.subject_math: 10.0, cls.subject_french: 14.0})
+        cls.draft = cls.create_bulletin(cls.create_student('Chloé'), {
+            cls.subject_math: 20.0}, state='draft')
+
+    def refresh(self, subjects):
+        self.env['op.bulletin.subject.stats']._refresh(
+            [(self.batch.id, self.trimestre.id, subject.id) for subject in subjects])
+
+    def get_stats(self, subject):
+        return self.env['op.bulletin.subject.stats'].search([
+            ('batch_id', '=', self.batch.id),
+            ('trimestre_id', '=', self.trimestre.id),
+            ('subject_id', '=', subject.id),
+        ])
+
+    def line(self, bulletin, subject):
+        return bulletin.note_lines.filtered(lambda l: l.subject_id == subject)
+
+    def test_subject_ranking_and_aggregates(self):
+        self.refresh(self.subject_math | self.subject_french)
+        stats = self.get_stats(self.subject_math)
+        self.assertEqual(stats.nombre_eleves, 2)
+        self.assertAlmostEqual(stats.moyenne_classe, 13.0)
+        self.assertAlmostEqual(stats.note_mini, 10.0)
+        self.assertAlmostEqual(stats.note_maxi, 16.0)
+        self.assertEqual([entry['bulletin_id'] for entry in stats.ranking], [self.alice.id, self.bruno.id])
+        self.assertEqual(self.line(self.alice, self.subject_math).rang_matiere, 1)
+        self.assertEqual(self.line(self.bruno, self.subject_french).rang_matiere, 1)
+        self.assertEqual(self.line(self.alice, self.subject_french).rang_matiere, 2)
+        self.assertAlmostEqual(self.line(self.alice, self.subject_french).moyenne_classe_matiere, 11.5)
+        # Les bulletins en brouillon ne sont pas classés
+        self.assertEqual(self.line(self.draft, self.subject_math).rang_matiere, 0)
+
+    def test_line_change_refreshes_before_commit(self):
+        self.refresh(self.subject_math)
+        self.line(self.bruno, self.subject_math).moyenne_matiere = 18.0
+        self.env.cr.flush()
+        stats = self.get_stats(self.subject_math)
+        self.assertAlmostEqual(stats.note_maxi, 18.0)
+        self.assertEqual(stats.ranking[0]['bulletin_id'], self.bruno.id)
+        self.assertEqual(self.line(self.alice, self.subject_math).rang_matiere, 2)
+
+    def test_stats_removed_without_ranked_lines(self):
+        self.refresh(self.subject_french)
+        self.assertTrue(self.get_stats(self.subject_french))
+        (self.alice | self.bruno).write({'state': 'draft'})
+        self.env.cr.flush()
+        self.assertFalse(self.get_stats(self.subject_french))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.school_management.models.checkin_buffer import CheckinBuffer
+
+
+@tagged('post_install', '-at_install')
+class TestCheckinBuffer(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+        self.written = threading.Event()
+
+    def writer(self, rows):
+        self.batches.append(list(rows))
+        self.written.set()
+
+    def test_flush_when_batch_is_full(self):
+        buffer = CheckinBuffer(self.writer, flush_size=3, flush_interval_ms=60000)
+        self.assertTrue(buffer.add(1))
+        self.assertTrue(buffer.add(2))
+        self.assertEqual(self.batches, [])
+        self.assertEqual(len(buffer), 2)
+        self.assertTrue(buffer.add(3))
+        self.assertEqual(self.batches, [[1, 2, 3]])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.age_ms(), 0.0)
+
+    def test_flush_after_interval(self):
+        buffer = CheckinBuffer(self.writer, flush_size=100, flush_interval_ms=20)
+        buffer.add('a')
+        self.assertGreaterEqual(buffer.age_ms(), 0.0)
+        self.assertTrue(self.written.wait(5))
+        self.assertEqual(self.batches, [['a']])
+        self.assertEqual(len(buffer), 0)
+
+    def test_explicit_flush(self):
+        buffer = CheckinBuffer(self.writer, flush_size=100, flush_interval_ms=60000)
+        self.assertEqual(buffer.flush(), 0)
+        buffer.add('a')
+        buffer.add('b')
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.batches, [['a', 'b']])
+
+    def test_failed_write_keeps_rows_in_order(self):
+        failures = [RuntimeError]
+
+        def writer(rows):
+            if failures:
+                raise failures.pop()("base indisponible")
+            self.batches.append(list(rows))
+
+        buffer = CheckinBuffer(writer, flush_size=100, flush_interval_ms=60000)
+        buffer.add('a')
+        buffer.add('b')
+        with self.assertLogs('odoo.addons.school_management.models.checkin_buffer', level='ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer), 2)
+        buffer.add('c')
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(self.batches, [['a', 'b', 'c']])
+
+    def test_saturated_buffer_refuses_rows(self):
+        buffer = CheckinBuffer(self.writer, flush_size=100, flush_interval_ms=60000, max_pending=2)
+        self.assertTrue(buffer.add(1))
+        self.assertTrue(buffer.add(2))
+        self.assertFalse(buffer.add(3))
+        self.assertEqual(len(buffer), 2)
+        buffer.flush()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.school_management.controllers.ical import (
+    ICAL_CHUNK_EVENTS, escape_text, fold_line, format_event, iter_calendar,
+)
+
+STAMP = datetime(2024, 9, 2, 6, 0, 0)
+
+
+def make_event(index=1, **values):
+    event = {
+        'uid': 'slot-%s@school' % index,
+        'start': datetime(2024, 9, 2, 8, 0),
+        'end': datetime(2024, 9, 2, 9, 30),
+        'summary': 'Mathématiques',
+    }
+    event.update(values)
+    return event
+
+
+@tagged('post_install', '-at_install')
+class TestICal(BaseCase):
+
+    def test_escape_text(self):
+        self.assertEqual(escape_text('a;b,c\\d'), 'a\\;b\\,c\\\\d')
+        self.assertEqual(escape_text('ligne 1\r\nligne 2\nligne 3'), 'ligne 1\\nligne 2\\nligne 3')
+        self.assertEqual(escape_text(None), '')
+        self.assertEqual(escape_text(False), '')
+
+    def test_fold_line_short(self):
+        self.assertEqual(fold_line('SUMMARY:Maths'), 'SUMMARY:Maths\r\n')
+
+    def test_fold_line_limits_octets(self):
+        line = 'DESCRIPTION:' + 'é' * 100
+        folded = fold_line(line)
+        self.assertTrue(folded.endswith('\r\n'))
+        parts = folded[:-2].split('\r\n')
+        self.assertGreater(len(parts), 1)
+        for part in parts:
+            self.assertLessEqual(len(part.encode('utf-8')), 75)
+        for part in parts[1:]:
+            self.assertTrue(part.startswith(' '))
+        # Le dépliage (suppression de CRLF + espace) rend la ligne d'origine
+        self.assertEqual(folded[:-2].replace('\r\n ', ''), line)
+
+    def test_format_event(self):
+        text = format_event(make_event(location='Salle 1, bât. A', status='CONFIRMED'), STAMP)
+        lines = text.split('\r\n')
+        self.assertEqual(lines[0], 'BEGIN:VEVENT')
+        self.assertIn('UID:slot-1@school', lines)
+        self.assertIn('DTSTAMP:20240902T060000Z', lines)
+        self.assertIn('DTSTART:20240902T080000', lines)
+        self.assertIn('DTEND:20240902T093000', lines)
+        self.assertIn('LOCATION:Salle 1\\, bât. A', lines)
+        self.assertIn('STATUS:CONFIRMED', lines)
+        self.assertEqual(lines[-2:], ['END:VEVENT', ''])
+        self.assertFalse(any(line.startswith('RRULE') for line in lines))
+
+    def test_format_recurring_event(self):
+        text = format_event(make_event(
+            until=date(2024, 12, 20),
+            exdates=[datetime(2024, 11, 1, 8, 0)],
+        ), STAMP)
+        self.assertIn('RRULE:FREQ=WEEKLY;UNTIL=20241220T235959\r\n', text)
+        self.assertIn('EXDATE:20241101T080000\r\n', text)
+
+    def test_iter_calendar_chunks(self):
+        events = [make_event(index) for index in range(ICAL_CHUNK_EVENTS + 1)]
+        chunks = list(iter_calendar('Classe 6e A', events, STAMP))
+        # En-tête, un morceau plein, puis le dernier événement avec la fin
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        calendar = b''.join(chunks).decode('utf-8')
+        self.assertTrue(calendar.startswith('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'))
+        self.assertIn('X-WR-CALNAME:Classe 6e A\r\n', calendar)
+        self.assertTrue(calendar.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(calendar.count('BEGIN:VEVENT'), ICAL_CHUNK_EVENTS + 1)
+
+    def test_iter_calendar_empty(self):
+        calendar = b''.join(iter_calendar('Vide', [], STAMP)).decode('utf-8')
+        self.assertNotIn('BEGIN:VEVENT', calendar)
+        self.assertTrue(calendar.endswith('END:VCALENDAR\r\n'))
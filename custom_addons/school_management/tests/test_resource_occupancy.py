@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.school_management.models.op_resource_occupancy import (
+    BUCKETS_PER_DAY, interval_mask, parse_hour,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestOccupancyMasks(BaseCase):
+
+    def test_interval_mask_buckets(self):
+        # 8h00-9h00 : tranches 32 à 35
+        self.assertEqual(interval_mask(8.0, 9.0), 0b1111 << 32)
+        # Une borne au milieu d'une tranche couvre toute la tranche
+        self.assertEqual(interval_mask(8.1, 8.2), 1 << 32)
+        self.assertEqual(interval_mask(8.0, 8.3), 0b11 << 32)
+
+    def test_interval_mask_empty_and_bounds(self):
+        self.assertEqual(interval_mask(10.0, 10.0), 0)
+        self.assertEqual(interval_mask(11.0, 10.0), 0)
+        self.assertEqual(interval_mask(0.0, 24.0), (1 << BUCKETS_PER_DAY) - 1)
+        self.assertEqual(interval_mask(-2.0, 30.0), (1 << BUCKETS_PER_DAY) - 1)
+
+    def test_adjacent_intervals_do_not_overlap(self):
+        self.assertEqual(interval_mask(8.0, 9.0) & interval_mask(9.0, 10.0), 0)
+        self.assertTrue(interval_mask(8.0, 9.25) & interval_mask(9.0, 10.0))
+        self.assertEqual(interval_mask(8.0, 9.0) | interval_mask(9.0, 10.0), interval_mask(8.0, 10.0))
+
+    def test_parse_hour(self):
+        self.assertEqual(parse_hour('08:30'), 8.5)
+        self.assertEqual(parse_hour('8h30'), 8.5)
+        self.assertEqual(parse_hour('8H'), 8.0)
+        self.assertEqual(parse_hour('8.5'), 8.5)
+        self.assertEqual(parse_hour(' 14:15 '), 14.25)
+        self.assertEqual(parse_hour(9), 9.0)
+        self.assertEqual(parse_hour(9.75), 9.75)
+
+    def test_parse_hour_invalid(self):
+        for value in (None, '', 'midi', '8:xx'):
+            self.assertIsNone(parse_hour(value))
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.school_management.models.timetable_index import SlotConflictIndex, can_conflict, periods_overlap
+
+
+def make_slot(slot_id, start, end, day='0', timetable_id=1, **resources):
+    slot = {
+        'id': slot_id,
+        'timetable_id': timetable_id,
+        'day': day,
+        'start': start,
+        'end': end,
+        'classroom_id': False,
+        'faculty_id': False,
+        'batch_id': False,
+    }
+    slot.update(resources)
+    return slot
+
+
+@tagged('post_install', '-at_install')
+class TestTimetableIndex(BaseCase):
+
+    def test_overlapping_slots_conflict_on_shared_resource(self):
+        index = SlotConflictIndex([
+            make_slot(1, 8.0, 10.0, classroom_id=5),
+            make_slot(2, 9.0, 11.0, classroom_id=5),
+        ])
+        conflicts = index.conflicts()
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(conflicts[0]['dimension'], 'classroom')
+        self.assertEqual(conflicts[0]['resource_id'], 5)
+        self.assertEqual(conflicts[0]['slot_ids'], (1, 2))
+        self.assertEqual((conflicts[0]['start'], conflicts[0]['end']), (9.0, 10.0))
+
+    def test_adjacent_slots_do_not_conflict(self):
+        index = SlotConflictIndex([
+            make_slot(1, 8.0, 9.0, faculty_id=3),
+            make_slot(2, 9.0, 10.0, faculty_id=3),
+        ])
+        self.assertEqual(index.conflicts(), [])
+
+    def test_other_day_or_resource_does_not_conflict(self):
+        index = SlotConflictIndex([
+            make_slot(1, 8.0, 10.0, classroom_id=5),
+            make_slot(2, 8.0, 10.0, day='1', classroom_id=5),
+            make_slot(3, 8.0, 10.0, classroom_id=6),
+        ])
+        self.assertEqual(index.conflicts(), [])
+
+    def test_one_conflict_per_shared_dimension(self):
+        index = SlotConflictIndex([
+            make_slot(1, 8.0, 10.0, classroom_id=5, faculty_id=3),
+            make_slot(2, 9.0, 10.0, classroom_id=5, faculty_id=3),
+        ])
+        self.assertEqual(sorted(c['dimension'] for c in index.conflicts()), ['classroom', 'faculty'])
+
+    def test_nested_slots_all_reported(self):
+        index = SlotConflictIndex([
+            make_slot(1, 8.0, 12.0, classroom_id=5),
+            make_slot(2, 8.5, 9.0, classroom_id=5),
+            make_slot(3, 10.0, 11.0, classroom_id=5),
+        ])
+        self.assertEqual(sorted(c['slot_ids'] for c in index.conflicts()), [(1, 2), (1, 3)])
+
+    def test_concurrent_versions_of_a_class_do_not_conflict(self):
+        draft = make_slot(1, 8.0, 10.0, timetable_id=1, batch_id=7)
+        active = make_slot(2, 8.0, 10.0, timetable_id=2, batch_id=7)
+        self.assertFalse(can_conflict(draft, active))
+        self.assertEqual(SlotConflictIndex([draft, active]).conflicts(), [])
+
+    def test_disjoint_periods_do_not_conflict(self):
+        first = make_slot(1, 8.0, 10.0, timetable_id=1, classroom_id=5,
+                          period_start='2024-09-01', period_end='2024-12-31')
+        second = make_slot(2, 8.0, 10.0, timetable_id=2, classroom_id=5,
+                           period_start='2025-01-01', period_end='2025-06-30')
+        self.assertFalse(periods_overlap(first, second))
+        self.assertEqual(SlotConflictIndex([first, second]).conflicts(), [])
+        # Sans période connue, les créneaux sont comparés
+        self.assertTrue(periods_overlap(first, make_slot(3, 8.0, 10.0)))
+
+    def test_conflicts_for_slot(self):
+        index = SlotConflictIndex([
+            make_slot(1, 8.0, 9.0, classroom_id=5),
+            make_slot(2, 9.0, 10.0, classroom_id=5),
+            make_slot(3, 11.0, 12.0, classroom_id=5),
+        ])
+        candidate = make_slot(4, 8.5, 9.5, classroom_id=5)
+        self.assertEqual(sorted(c['slot_ids'] for c in index.conflicts_for(candidate)), [(1, 4), (2, 4)])
+        # Un créneau déjà indexé n'est pas en conflit avec lui-même
+        self.assertEqual(index.conflicts_for(make_slot(3, 11.0, 12.0, classroom_id=5)), [])
+
+    def test_add_after_query(self):
+        index = SlotConflictIndex([make_slot(1, 8.0, 10.0, faculty_id=3)])
+        self.assertEqual(index.conflicts(), [])
+        index.add(make_slot(2, 9.0, 11.0, faculty_id=3))
+        self.assertEqual([c['slot_ids'] for c in index.conflicts()], [(1, 2)])
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from collections import defaultdict
+
+from odoo.tests import BaseCase, tagged
+
+from odoo.addons.school_management.models.timetable_solver import (
+    DEFAULT_PERIODS, TimetableSolver, build_benchmark_school, hours_to_units,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestTimetableSolver(BaseCase):
+
+    def assertNoOverlap(self, slots, field):
+        busy = defaultdict(list)
+        for slot in slots:
+            if slot[field] is None:
+                continue
+            for start, end in busy[(slot[field], slot['day'])]:
+                self.assertFalse(start < slot['end'] and slot['start'] < end,
+                                 "%s %s occupé deux fois" % (field, slot[field]))
+            busy[(slot[field], slot['day'])].append((slot['start'], slot['end']))
+
+    def test_hours_to_units(self):
+        self.assertEqual(hours_to_units(0), 0)
+        self.assertEqual(hours_to_units(None), 0)
+        self.assertEqual(hours_to_units(0.5), 1)
+        self.assertEqual(hours_to_units(1.5), 2)
+        self.assertEqual(hours_to_units(3.0), 3)
+        self.assertEqual(hours_to_units(3.0, period_length=1.5), 2)
+
+    def test_places_all_hours_without_conflict(self):
+        classes = [
+            {'id': 'a', 'size': 25, 'courses': [
+                {'course_id': 'maths', 'hours': 4, 'teacher_ids': ['t1']},
+                {'course_id': 'svt', 'hours': 2, 'teacher_ids': ['t2'], 'features': ('lab',)},
+            ]},
+            {'id': 'b', 'size': 25, 'courses': [
+                {'course_id': 'maths', 'hours': 4, 'teacher_ids': ['t1']},
+                {'course_id': 'svt', 'hours': 2, 'teacher_ids': ['t2'], 'features': ('lab',)},
+            ]},
+        ]
+        rooms = [
+            {'id': 'r1', 'capacity': 30},
+            {'id': 'lab', 'capacity': 30, 'features': ('lab',)},
+        ]
+        result = TimetableSolver(classes, rooms).solve()
+        self.assertEqual(result['unplaced'], [])
+        self.assertEqual(result['stats']['placed'], 12)
+        for field in ('class_id', 'teacher_id', 'room_id'):
+            self.assertNoOverlap(result['slots'], field)
+        for slot in result['slots']:
+            if slot['course_id'] == 'svt':
+                self.assertEqual(slot['room_id'], 'lab')
+
+    def test_daily_cap_spreads_course_over_week(self):
+        classes = [{'id': 'a', 'size': 20, 'courses': [
+            {'course_id': 'maths', 'hours': 5, 'teacher_ids': ['t1']},
+        ]}]
+        result = TimetableSolver(classes, [{'id': 'r1', 'capacity': 30}]).solve()
+        hours_by_day = defaultdict(float)
+        for slot in result['slots']:
+            hours_by_day[slot['day']] += slot['end'] - slot['start']
+        self.assertEqual(sum(hours_by_day.values()), 5.0)
+        self.assertLessEqual(max(hours_by_day.values()), 2.0)
+        self.assertEqual(result['stats']['daily_overload'], 0)
+
+    def test_busy_resources_are_respected(self):
+        # Enseignant indisponible toute la semaine sauf le lundi matin
+        busy = [{'dimension': 'faculty', 'resource_id': 't1', 'day': day, 'start': 8.0, 'end': 17.0}
+                for day in range(1, 5)]
+        busy.append({'dimension': 'faculty', 'resource_id': 't1', 'day': 0, 'start': 14.0, 'end': 17.0})
+        classes = [{'id': 'a', 'size': 20, 'courses': [
+            {'course_id': 'maths', 'hours': 2, 'teacher_ids': ['t1']},
+        ]}]
+        result = TimetableSolver(classes, [{'id': 'r1', 'capacity': 30}], busy=busy).solve()
+        self.assertEqual(result['unplaced'], [])
+        for slot in result['slots']:
+            self.assertEqual(slot['day'], 0)
+            self.assertLessEqual(slot['end'], 12.0)
+
+    def test_unplaceable_lessons_are_reported(self):
+        classes = [{'id': 'a', 'size': 20, 'courses': [
+            {'course_id': 'svt', 'hours': 1, 'teacher_ids': ['t1'], 'features': ('lab',)},
+        ]}]
+        result = TimetableSolver(classes, [{'id': 'r1', 'capacity': 30}]).solve()
+        self.assertEqual(result['slots'], [])
+        self.assertEqual([u['reason'] for u in result['unplaced']], ['no_room'])
+
+        full_week = len(DEFAULT_PERIODS) * 5
+        classes = [{'id': 'a', 'size': 20, 'courses': [
+            {'course_id': 'maths', 'hours': full_week + 1, 'teacher_ids': ['t1']},
+        ]}]
+        result = TimetableSolver(classes, [{'id': 'r1', 'capacity': 30}]).solve()
+        self.assertEqual(len(result['unplaced']), 1)
+        self.assertEqual(result['unplaced'][0]['reason'], 'no_free_slot')
+
+    def test_consecutive_units_are_merged(self):
+        classes = [{'id': 'a', 'size': 20, 'courses': [
+            {'course_id': 'maths', 'hours': 2, 'teacher_ids': ['t1'], 'days': (0,)},
+        ]}]
+        result = TimetableSolver(classes, [{'id': 'r1', 'capacity': 30}]).solve()
+        self.assertEqual(len(result['slots']), 1)
+        self.assertEqual(result['slots'][0]['end'] - result['slots'][0]['start'], 2.0)
+
+    def test_benchmark_school(self):
+        classes, rooms = build_benchmark_school(class_count=6, seed=1)
+        result = TimetableSolver(classes, rooms).solve()
+        self.assertEqual(result['stats']['classes'], 6)
+        self.assertGreaterEqual(result['stats']['placement_rate'], 99.0)
+        for field in ('class_id', 'teacher_id', 'room_id'):
+            self.assertNoOverlap(result['slots'], field)
+        # Même graine, même école
+        self.assertEqual(build_benchmark_school(class_count=6, seed=1), (classes, rooms))
@@ -83,24 +83,25 @@ class BulletinWizard(models.TransientModel):
             
             log_messages.append(_('Début de génération pour %d étudiants') % len(student_courses))
             
+            generated_bulletins = self.env['op.bulletin']
+            existing_bulletins = self.env['op.bulletin'].search([
+                ('batch_id', '=', self.batch_id.id),
+                ('trimestre_id', '=', self.trimestre_id.id)
+            ])
+            existing_by_student = {b.student_id.id: b for b in existing_bulletins}
+            
             for student_course in student_courses:
                 try:
                     # Vérifier si un bulletin existe déjà
-                    existing_bulletin = self.env['op.bulletin'].search([
-                        ('student_id', '=', student_course.student_id.id),
-                        ('batch_id', '=', self.batch_id.id),
-                        ('trimestre_id', '=', self.trimestre_id.id)
-                    ], limit=1)
+                    existing_bulletin = existing_by_student.get(student_course.student_id.id)
                     
                     if existing_bulletin:
                         if self.regenerate_existing:
-                            # Supprimer l'ancien bulletin et en créer un nouveau
-                            bulletin_number = existing_bulletin.numero_bulletin
-                            existing_bulletin.unlink()
+                            # Supprimer l'ancien bulletin et en créer un nouveau, ou ni l'un ni l'autre
+                            with self.env.cr.savepoint():
+                                existing_bulletin.unlink()
+                                bulletin = self._create_bulletin(student_course)
                             log_messages.append(_('Bulletin existant supprimé pour %s') % student_course.student_id.name)
-                            
-                            # Créer le nouveau bulletin
-                            bulletin = self._create_bulletin(student_course)
                             updated_count += 1
                             log_messages.append(_('Bulletin régénéré pour %s: %s') % (student_course.student_id.name, bulletin.numero_bulletin))
                         else:
@@ -108,25 +109,39 @@ class BulletinWizard(models.TransientModel):
                             continue
                     else:
                         # Créer un nouveau bulletin
-                        bulletin = self._create_bulletin(student_course)
+                        with self.env.cr.savepoint():
+                            bulletin = self._create_bulletin(student_course)
                         created_count += 1
                         log_messages.append(_('Bulletin créé pour %s: %s') % (student_course.student_id.name, bulletin.numero_bulletin))
                     
-                    # Calculer automatiquement si demandé
-                    if self.auto_calculate:
-                        bulletin.action_calculate()
-                        log_messages.append(_('Bulletin calculé pour %s') % student_course.student_id.name)
-                        
-                        # Valider automatiquement si demandé
-                        if self.auto_validate and bulletin.state == 'calculated':
-                            bulletin.action_validate()
-                            log_messages.append(_('Bulletin validé pour %s') % student_course.student_id.name)
+                    generated_bulletins |= bulletin
                             
                 except Exception as e:
                     error_count += 1
                     log_messages.append(_('Erreur pour %s: %s') % (student_course.student_id.name, str(e)))
                     continue
             
+            # Calculer automatiquement toute la classe en une seule passe si demandé
+            if self.auto_calculate and generated_bulletins:
+                try:
+                    # Point de sauvegarde : une erreur SQL n'interrompt pas la transaction
+                    # et aucune ligne à moitié calculée n'est conservée
+                    to_validate = self.env['op.bulletin']
+                    with self.env.cr.savepoint():
+                        self.env['op.bulletin']._with_bulk_mode().calculate_for_class(
+                            self.batch_id, self.trimestre_id, bulletins=generated_bulletins
+                        )
+                        # Valider automatiquement si demandé
+                        if self.auto_validate:
+                            to_validate = generated_bulletins.filtered(lambda b: b.state == 'calculated')
+                            to_validate._with_bulk_mode().action_validate()
+                    log_messages.append(_('%d bulletins calculés') % len(generated_bulletins))
+                    for bulletin in to_validate:
+                        log_messages.append(_('Bulletin validé pour %s') % bulletin.student_id.name)
+                except Exception as e:
+                    error_count += len(generated_bulletins)
+                    log_messages.append(_('Erreur lors du calcul de la classe: %s') % str(e))
+            
             # Mettre à jour les statistiques
             self.created_bulletins = created_count
             self.updated_bulletins = updated_count